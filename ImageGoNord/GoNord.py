@@ -1,27 +1,18 @@
 
+import asyncio
 import base64
+import copy
 import os
-from io import BytesIO
-
-from math import ceil
-
 import threading
+import time
+from io import BytesIO
 
 from PIL import Image, ImageFilter, ExifTags
 
 import numpy as np
-import ffmpeg
 import uuid
 import shutil
-import requests
-
-try:
-    import torch
-    import skimage.color as convertor
-    import torchvision.transforms as transforms
-except ImportError:
-    # AI feature disabled
-    pass
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 
 try:
@@ -35,13 +26,18 @@ from .models import PaletteNet as palette_net
 
 from ImageGoNord.utility.quantize import quantize_to_palette
 import ImageGoNord.utility.palette_loader as pl
+import ImageGoNord.utility.batch as batch
+import ImageGoNord.utility.tracing as tracing
+import ImageGoNord.utility.parallel as parallel
+import ImageGoNord.utility.streaming as streaming
+import ImageGoNord.utility.async_executor as async_executor
+from ImageGoNord.utility.async_executor import QueueFullError
 from ImageGoNord.utility.ConvertUtility import ConvertUtility
-
-try:
-    from ImageGoNord.utility.model import FeatureEncoder,RecoloringDecoder
-except ImportError:
-    # AI feature disabled
-    pass
+from ImageGoNord.utility.palette_index import get_palette_index
+import ImageGoNord.utility.color_metrics as cm
+import ImageGoNord.utility.model_tiling as model_tiling
+import ImageGoNord.utility.model_backend as model_backend
+import ImageGoNord.utility.model_weights as model_weights
 
 
 class NordPaletteFile:
@@ -75,6 +71,12 @@ class GoNord(object):
     A class used for converting image to the nord palette
     It can be used also for converting image to other palette by loading different palette
 
+    The configuration belongs to the instance: instances with different palettes
+    can convert at the same time in different threads, sharing the parsed palette
+    files, the palette indexes, the color maps and the models of the process.
+    An instance can be shared between threads as long as it is not configured
+    while it converts: use copy() to derive a configuration from another one.
+
     This class need Pillow and apply 3 different palette conversion algorithm:
         - replace pixel by avg area pixel
         - replace pixel by pixel
@@ -94,18 +96,67 @@ class GoNord(object):
         loaded palette list
     PALETTE_DATA : dict
         available palette data in hex : rgb format
+    MAX_THREADS : int
+        maximum number of worker processes used by the parallel conversion
+    COLOR_MAP_CACHE_PATH : str
+        folder where the color maps used by videos and by the lut engine are cached
+    COLOR_METRIC : str
+        color distance used to find the nearest palette color, in images and videos
+    MODEL_MEMORY_LIMIT : int
+        peak memory budget of the PaletteNet inference in bytes, bigger images are processed in tiles
+    MODEL_BACKEND : str
+        library running PaletteNet: 'torch', 'torchscript' or 'onnx'
+    USE_FAST_CPU_MODEL : bool
+        enable or disable the int8 quantized PaletteNet on cpu ('torch' backend)
+    MODEL_THREADS : int
+        cpu threads used inside a PaletteNet operator, library default if None
+    MODEL_INTEROP_THREADS : int
+        cpu threads running independent PaletteNet operators, library default if None
+    CONVERSION_ENGINES : tuple
+        engines of convert_image: 'python', 'numpy' and 'lut'
+    TRACER : Tracer
+        tracer timing the stages of the conversions, a no-op by default
+    STRIP_PIXELS : int
+        pixels converted at once by convert_image_strips, it bounds its memory
+    PALETTE_NET_PATH : str
+        folder of the PaletteNet weights, IMAGE_GO_NORD_WEIGHTS if set
+    PALETTE_NET_REPO_FOLDER : str
+        url or folder the missing weights are downloaded from, IMAGE_GO_NORD_WEIGHTS_MIRROR if set
+    PALETTE_NET_CHECKSUMS : dict
+        expected sha256 of the weights files, by file name; the published files by default
 
     Methods
     -------
+    copy(self)
+        Get an independent instance with the same configuration
+
     set_palette_lookup_path(self, path)
         Set the base_path for the palette folder
 
+    set_color_map_cache_path(self, path)
+        Set the folder where the color maps are cached
+
+    set_tracer(self, tracer=None)
+        Set the tracer timing the stages of the conversions
+
+    set_async_limits(self, max_workers=None, max_queue=None)
+        Set the concurrency limit and the queue depth of the async conversions
+
+    get_async_executor(self)
+        Get the pool of threads running the async conversions
+
     set_default_nord_palette(self)
         Set available palette as the default palette
 
     get_palette_data(self)
         Build the palette data from configuration
 
+    get_palette_index(self, metric=None)
+        Get the nearest color index of the current palette
+
+    set_color_metric(self, metric)
+        Set the color distance used to find the nearest palette color
+
     add_color_to_palette(self, hex_color)
         Add hex color to current palette
 
@@ -148,11 +199,101 @@ class GoNord(object):
     quantize_image(self, image, save_path='')
         Quantize a Pillow image by applying the available palette
 
-    convert_image(self, image, palettedata, save_path='')
+    load_avg_pixel_image(self, pixels)
+        Load the pixel map of the avg colors of a numpy array
+
+    converted_loop(self, is_rgba, pixels, original_pixels, maxRow, maxCol, minRow=0, minCol=0, avg_pixels=None)
+        Replace pixel by pixel using the Pillow pixel map
+
+    converted_array(self, is_rgba, pixels, out=None)
+        Replace every pixel of a numpy array in one batched computation
+
+    converted_color_map(self, is_rgba, pixels, out=None)
+        Replace every pixel of a numpy array with a lookup in the color map
+
+    convert_array(self, pixels, out=None, engine='numpy')
+        Convert an image stored in a numpy array, in place or into a given array
+
+    converted_parallel(self, is_rgba, pixels, engine='python')
+        Convert a numpy array tile by tile in a pool of worker processes
+
+    set_palette_net_path(self, path)
+        Set the folder of the PaletteNet weights
+
+    set_palette_net_mirror(self, mirror, checksums=None)
+        Set where the missing PaletteNet weights are downloaded from
+
+    load_and_save_models(self)
+        Download the missing PaletteNet weights
+
+    prefetch_models(self)
+        Download the missing PaletteNet weights in a background thread
+
+    load_palette_net(self, use_model_cpu=False)
+        Get the PaletteNet models, loading the weights only once per process
+
+    set_model_backend(self, backend)
+        Set the library running PaletteNet
+
+    export_model(self, backend, path=None)
+        Export PaletteNet as TorchScript or ONNX graph
+
+    enable_fast_cpu_model(self)
+        Enable the int8 quantized PaletteNet on cpu
+
+    disable_fast_cpu_model(self)
+        Disable the int8 quantized PaletteNet on cpu
+
+    set_model_threads(self, threads=None, interop_threads=None)
+        Set the cpu threads used by PaletteNet
+
+    load_model_backend(self, use_model_cpu=False)
+        Get the backend running PaletteNet
+
+    compare_fast_cpu_model(self, images, max_side=None)
+        Measure the quality of the int8 quantized PaletteNet against fp32
+
+    warmup(self, use_model_cpu=False)
+        Load the PaletteNet models in advance
+
+    set_model_memory_limit(self, memory_limit)
+        Set the peak memory budget of the PaletteNet inference
+
+    convert_image_by_model(self, image, use_model_cpu=False, max_side=None)
+        Process a Pillow image by using the PaletteNet model
+
+    convert_images_by_model(self, images, use_model_cpu=False, batch_size=4, num_threads=None, max_side=None)
+        Process many Pillow images with PaletteNet, in batches
+
+    convert_image(self, image, save_path='', use_model=False, use_model_cpu=False, parallel_threading=False, engine='python')
         Process a Pillow image by replacing pixel or by avg algorithm
 
     save_image_to_file(self, image, path)
         Save a Pillow image to file
+
+    convert_image_strips(self, path, output_path, engine='numpy', strip_rows=None)
+        Convert an image file strip by strip, with bounded memory
+
+    convert_image_file(self, path, output_path, engine='numpy', use_model=False, use_model_cpu=False, streaming=False)
+        Convert an image file and write the result atomically
+
+    get_engine_image(self, image, engine)
+        Get an image in a mode supported by a conversion engine
+
+    get_conversion_fingerprint(self, engine='numpy', use_model=False)
+        Get the fingerprint of the settings changing the converted images
+
+    convert_batch(self, paths, out_dir, workers=None, engine='numpy', use_model=False, use_model_cpu=False, force=False, callback=None, streaming=False)
+        Convert many image files with a pool of worker threads
+
+    aconvert_image(self, image, save_path='', use_model=False, use_model_cpu=False, parallel_threading=False, engine='numpy')
+        Process a Pillow image without blocking the event loop
+
+    aquantize_image(self, image, fill_color='2E3440', save_path='')
+        Quantize a Pillow image without blocking the event loop
+
+    aconvert_video(self, _input, palette_name, _frames_per_batch=200, save_path='/tmp', streaming=True)
+        Convert a video without blocking the event loop
     """
 
     DEFAULT_PALETTE_PATH = '../palettes/Nord/'
@@ -167,24 +308,108 @@ class GoNord(object):
     AVG_BOX_DATA = {"w": -2, "h": 3}
     TRANSPARENCY_TOLERANCE = 190
     MAX_THREADS = 10
+    COLOR_MAP_CACHE_PATH = pl.get_cache_path()
+    COLOR_METRIC = 'manhattan'
+    MODEL_MEMORY_LIMIT = 1024 ** 3
+    MODEL_BACKEND = 'torch'
+    USE_FAST_CPU_MODEL = False
+    MODEL_THREADS = None
+    MODEL_INTEROP_THREADS = None
+    TRACER = tracing.NULL_TRACER
+    STRIP_PIXELS = 1024 ** 2
+    CONVERSION_ENGINES = ('python', 'numpy', 'lut')
 
     EXIF_IGN = "ImageGoNord by Schroedinger Hat"
     EXIF_IGN_AI = "ImageGoNord AI by Schroedinger Hat"
 
-    PALETTE_NET_REPO_FOLDER = 'https://github.com/Schroedinger-Hat/ImageGoNord-pip/raw/main/ImageGoNord/models/PaletteNet/'
+    PALETTE_NET_REPO_FOLDER = os.environ.get('IMAGE_GO_NORD_WEIGHTS_MIRROR') or 'https://github.com/Schroedinger-Hat/ImageGoNord-pip/raw/main/ImageGoNord/models/PaletteNet/'
+    PALETTE_NET_PATH = os.environ.get('IMAGE_GO_NORD_WEIGHTS') or os.path.dirname(palette_net.__file__)
+    PALETTE_NET_CHECKSUMS = model_weights.read_checksums(
+        os.path.join(os.path.dirname(palette_net.__file__), model_weights.CHECKSUMS_FILE)
+    )
 
     AVAILABLE_PALETTE = []
     PALETTE_DATA = {}
+    PALETTE_INDEXES = {}
 
     def __init__(self):
         """Constructor: init variables & config"""
+        self.PALETTE_DATA = {}
+        self.PALETTE_INDEXES = {}
         self.set_default_nord_palette()
         self.set_avg_box_data()
 
+    def copy(self):
+        """
+        Get an independent instance with the same configuration
+
+        Changing the palette or the settings of the copy does not change this instance.
+
+        Returns
+        -------
+        GoNord
+            the new instance
+        """
+        go_nord = copy.copy(self)
+        go_nord.AVAILABLE_PALETTE = list(self.AVAILABLE_PALETTE)
+        go_nord.PALETTE_DATA = dict(self.PALETTE_DATA)
+        go_nord.AVG_BOX_DATA = dict(self.AVG_BOX_DATA)
+        go_nord.PALETTE_NET_CHECKSUMS = dict(self.PALETTE_NET_CHECKSUMS)
+        return go_nord
+
     def set_palette_lookup_path(self, path):
         """Set the base_path for the palette folder"""
         self.PALETTE_LOOKUP_PATH = path
 
+    def set_color_map_cache_path(self, path):
+        """Set the folder where the color maps are cached"""
+        self.COLOR_MAP_CACHE_PATH = path
+
+    def set_tracer(self, tracer=None):
+        """
+        Set the tracer timing the stages of the conversions
+
+        Every stage of convert_image, quantize_image, convert_image_by_model and
+        convert_video (e.g. 'convert_image.convert') runs in a span of the tracer,
+        which receives its duration and its pixel and byte counts.
+
+        Parameters
+        ----------
+        tracer : Tracer, optional
+            e.g. tracing.StatsTracer() reporting p50 and p95 of every stage,
+            or tracing.Tracer(callback); None for the no-op default
+        """
+        self.TRACER = tracer or tracing.NULL_TRACER
+
+    def set_async_limits(self, max_workers=None, max_queue=None):
+        """
+        Set the concurrency limit and the queue depth of the async conversions
+
+        The pool of threads is shared by the whole process: every instance
+        and copy uses it, so the limit bounds all the async conversions.
+        The conversions started after the call run in a new pool of threads.
+
+        Parameters
+        ----------
+        max_workers : int, optional
+            conversions running at once, MAX_THREADS and the cpu count bound it by default
+        max_queue : int, optional
+            conversions waiting for a slot, the next ones raise QueueFullError; unbounded if None
+        """
+        max_workers = max_workers or min(self.MAX_THREADS, os.cpu_count() or 1)
+        async_executor.set_shared_executor(max_workers, max_queue)
+
+    def get_async_executor(self):
+        """
+        Get the pool of threads running the async conversions, shared by the whole process
+
+        Returns
+        -------
+        AsyncExecutor
+            the executor, created with the default limits on first use
+        """
+        return async_executor.get_shared_executor(min(self.MAX_THREADS, os.cpu_count() or 1))
+
     def set_default_nord_palette(self):
         """Set available palette as the default palette"""
         self.AVAILABLE_PALETTE = [
@@ -198,26 +423,74 @@ class GoNord(object):
         """
         Build the palette data from configuration
 
+        Palette files are parsed once and parsed again only when they change
+        on disk, so the palette index and the color maps built from the data
+        are reused by the next conversions.
+        The palette data is replaced, never modified, so a conversion running
+        in another thread keeps the dict it started with.
+
         Returns
         -------
         dict
             The palette data: keys are hex color code, values are rgb values
         """
+        palette_data = dict(self.PALETTE_DATA)
         for palette_file in self.AVAILABLE_PALETTE:
-            hex_colors = pl.import_palette_from_file(
+            hex_colors, colors = pl.load_palette_file(
                 self.PALETTE_LOOKUP_PATH + palette_file)
-            for hex_color in hex_colors:
-                self.PALETTE_DATA[hex_color] = pl.export_tripletes_from_color(
-                    hex_color)
+            for hex_color, color in zip(hex_colors, colors.tolist()):
+                palette_data[hex_color] = color
 
         # Delete empty lines, if they exist.
-        if self.PALETTE_DATA.get('') and len(self.PALETTE_DATA['']) == 0:
-            del self.PALETTE_DATA['']
+        if palette_data.get('') is not None and len(palette_data['']) == 0:
+            del palette_data['']
+
+        self.PALETTE_DATA = palette_data
+        return palette_data
+
+    def get_palette_index(self, metric=None):
+        """
+        Get the nearest color index of the current palette
+
+        The index is built once and rebuilt only when the palette changes,
+        instances with the same palette share it.
+
+        Parameters
+        ----------
+        metric : str, optional
+            color distance of the index, COLOR_METRIC by default
+
+        Returns
+        -------
+        PaletteIndex
+            the index of the palette data
+        """
+        metric = metric or self.COLOR_METRIC
+        palette = pl.create_palette_array(self.PALETTE_DATA)
+        palette_index = self.PALETTE_INDEXES.get(metric)
+        if palette_index is None or not np.array_equal(palette_index.palette, palette):
+            palette_index = get_palette_index(palette, metric)
+            # a new dict: a conversion in another thread may be reading it
+            self.PALETTE_INDEXES = {**self.PALETTE_INDEXES, metric: palette_index}
+        return palette_index
+
+    def set_color_metric(self, metric):
+        """
+        Set the color distance used to find the nearest palette color
 
-        return self.PALETTE_DATA
+        The same distance is used by every conversion, images and videos.
+
+        Parameters
+        ----------
+        metric : str
+            'manhattan' or 'euclidean' (RGB), 'redmean' (weighted RGB),
+            'cie76' or 'ciede2000' (CIELAB)
+        """
+        cm.check_metric(metric)
+        self.COLOR_METRIC = metric
 
     def add_color_to_palette(self, hex_color):
-        self.PALETTE_DATA[hex_color[1:]] = pl.export_tripletes_from_color(hex_color[1:])
+        self.PALETTE_DATA = {**self.PALETTE_DATA, hex_color[1:]: pl.export_tripletes_from_color(hex_color[1:])}
 
     def reset_palette(self):
         """Reset available palette array"""
@@ -226,7 +499,7 @@ class GoNord(object):
 
     def add_file_to_palette(self, file):
         """Method for adding file to the available palette"""
-        self.AVAILABLE_PALETTE.append(file)
+        self.AVAILABLE_PALETTE = self.AVAILABLE_PALETTE + [file]
         self.get_palette_data()
 
     def set_transparency_tolerance(self, tolerance):
@@ -347,6 +620,26 @@ class GoNord(object):
         """
         return opened_image.load()
 
+    def load_avg_pixel_image(self, pixels):
+        """
+        Load the pixel map of the avg colors of a numpy array
+
+        The avg area of every pixel is computed at once by the box filter of the
+        numpy engine, so converted_loop reads it instead of averaging each area.
+
+        Parameters
+        ----------
+        pixels : ndarray
+            The source image as uint8 array, shape (h, w, 3) or (h, w, 4)
+
+        Returns
+        -------
+        pillow image
+            pixel map of the avg colors
+        """
+        avg_colors = ConvertUtility.get_avg_color_array(pixels, w=self.AVG_BOX_DATA['w'], h=self.AVG_BOX_DATA['h'])
+        return self.load_pixel_image(Image.fromarray(avg_colors))
+
     def enable_avg_algorithm(self):
         """
         Enabled avg algorithm
@@ -373,8 +666,7 @@ class GoNord(object):
             Box's height
 
         """
-        self.AVG_BOX_DATA['w'] = w
-        self.AVG_BOX_DATA['h'] = h
+        self.AVG_BOX_DATA = {'w': w, 'h': h}
 
     def quantize_image(self, image, fill_color='2E3440', save_path=''):
         """
@@ -394,25 +686,56 @@ class GoNord(object):
         pillow image
             quantized image
         """
-
-        data_colors = pl.create_data_colors(self.get_palette_data())
-        while len(data_colors) < 768:
-            data_colors.extend(pl.export_tripletes_from_color(fill_color))
-
-        palimage = Image.new('P', (1, 1))
-        palimage.putpalette(data_colors)
-        quantize_img = quantize_to_palette(image, palimage)
-        exif = quantize_img.getexif()
-        exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN
+        tracer = self.TRACER
+        pixels_count = image.size[0] * image.size[1]
+        nbytes = pixels_count * len(image.getbands())
+        with tracer.span('quantize_image.get_palette_data'):
+            data_colors = pl.create_data_colors(self.get_palette_data())
+            while len(data_colors) < 768:
+                data_colors.extend(pl.export_tripletes_from_color(fill_color))
+
+        with tracer.span('quantize_image.quantize', pixels_count, nbytes):
+            palimage = Image.new('P', (1, 1))
+            palimage.putpalette(data_colors)
+            quantize_img = quantize_to_palette(image, palimage)
+        with tracer.span('quantize_image.exif'):
+            exif = quantize_img.getexif()
+            exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN
 
         if (save_path != ''):
-            self.save_image_to_file(quantize_img, save_path)
+            with tracer.span('quantize_image.save', pixels_count, pixels_count):
+                self.save_image_to_file(quantize_img, save_path)
 
         return quantize_img
 
-    def converted_loop(self, is_rgba, pixels, original_pixels, maxRow, maxCol, minRow=0, minCol=0):
+    def converted_loop(self, is_rgba, pixels, original_pixels, maxRow, maxCol, minRow=0, minCol=0, avg_pixels=None):
+        """
+        Replace pixel by pixel using the Pillow pixel map
+
+        Parameters
+        ----------
+        is_rgba : bool
+            true if the image has the alpha channel
+        pixels : pixel map
+            The pixels to convert, modified in place
+        original_pixels : pixel map
+            The pixels not converted, read by the avg algorithm if avg_pixels is None
+        maxRow, maxCol, minRow, minCol : int
+            the converted area, rows are the x coordinates
+        avg_pixels : pixel map, optional
+            the avg colors of load_avg_pixel_image, by default every area is averaged in the loop
+
+        Returns
+        -------
+        pixel map
+            the converted pixels
+        """
         color_checked = {}
+        palette_index = self.get_palette_index()
+        palette_colors = [tuple(self.PALETTE_DATA[name]) for name in sorted(self.PALETTE_DATA)]
         for row in range(minRow, maxRow, 1):
+            # the colors of a row are matched together, one query for the new ones
+            row_colors = []
             for col in range(minCol, maxCol, 1):
                 try:
                     color_to_check = pixels[row, col]
@@ -423,236 +746,1188 @@ class GoNord(object):
                     if (color_to_check[3] < self.TRANSPARENCY_TOLERANCE):
                         continue
 
-                if self.USE_AVG_COLOR == True:
-                    # todo: improve this feature in performance
+                if self.USE_AVG_COLOR == True and avg_pixels is not None:
+                    color_to_check = avg_pixels[row, col]
+                elif self.USE_AVG_COLOR == True:
                     color_to_check = ConvertUtility.get_avg_color(
                         pixels=original_pixels, row=row, col=col, w=self.AVG_BOX_DATA['w'], h=self.AVG_BOX_DATA['h'])
+                row_colors.append((col, color_to_check))
 
-                # saving in memory every checked color to improve performance
-                key_color_checked = ','.join(str(e) for e in list(color_to_check))
-                if (key_color_checked in color_checked):
-                    difference = color_checked[key_color_checked]
-                else:
-                    differences = [[ConvertUtility.color_difference(color_to_check, target_value), target_name]
-                                   for target_name, target_value in self.PALETTE_DATA.items()]
-                    differences.sort()
-                    difference = differences[0][1]
+            # saving in memory every checked color to improve performance
+            new_colors = list({tuple(color[:3]) for col, color in row_colors}.difference(color_checked))
+            if new_colors:
+                for key_color_checked, index in zip(new_colors, palette_index.query(np.array(new_colors))):
+                    color_checked[key_color_checked] = palette_colors[index]
 
-                color_checked[key_color_checked] = difference
-                colors_list = self.PALETTE_DATA[difference]
-                if (is_rgba and len(colors_list) == 3):
-                    colors_list.append(color_to_check[3])
+            for col, color_to_check in row_colors:
+                difference = color_checked[tuple(color_to_check[:3])]
+                if (is_rgba and len(difference) == 3):
+                    difference = difference + (color_to_check[3],)
 
-                pixels[row, col] = tuple(colors_list)
+                pixels[row, col] = difference
         return pixels
 
-    def load_and_save_models(self):
-        rd_model = requests.get(self.PALETTE_NET_REPO_FOLDER + 'RD.state_dict.pt')
-        fe_model = requests.get(self.PALETTE_NET_REPO_FOLDER + 'FE.state_dict.pt')
-
-        with open(os.path.dirname(palette_net.__file__) + '/FE.state_dict.pt', "wb") as f:
-            f.write(fe_model.content)
-        
-        with open(os.path.dirname(palette_net.__file__) + '/RD.state_dict.pt', "wb") as f:
-            f.write(rd_model.content)
-
-    def convert_image_by_model(self, image, use_model_cpu=False):
+    def converted_array(self, is_rgba, pixels, out=None):
         """
-        Process a Pillow image by using a PyTorch model "PaletteNet" for recoloring the image
+        Vectorized version of converted_loop working on a numpy array
+
+        Every pixel is matched against the palette in one batched computation,
+        giving the same output of the pixel by pixel loop.
+        The avg algorithm is applied as a box filter over the whole array.
 
         Parameters
         ----------
-        image : pillow image
-            The source pillow image
-        use_model_cpu : bool, optional
-            true if using cpu power
+        is_rgba : bool
+            true if the array has the alpha channel
+        pixels : ndarray
+            The image as uint8 array, it is converted in place unless out is given
+        out : ndarray, optional
+            array receiving the converted pixels, same shape of pixels
 
         Returns
         -------
-        pillow image
-            processed image
+        ndarray
+            the converted pixels
         """
-        FE = FeatureEncoder() # torch.Size([64, 3, 3, 3])
-        RD = RecoloringDecoder() # torch.Size([530, 256, 3, 3])
+        tolerance = self.TRANSPARENCY_TOLERANCE if is_rgba else None
+        colors = None
+        if self.USE_AVG_COLOR:
+            colors = ConvertUtility.get_avg_color_array(pixels, w=self.AVG_BOX_DATA['w'], h=self.AVG_BOX_DATA['h'])
+        return ConvertUtility.convert_pixels(self.get_palette_index(), pixels, colors, tolerance, out)
 
-        if (
-            os.path.exists(os.path.dirname(palette_net.__file__) + '/FE.state_dict.pt')
-            and os.path.exists(os.path.dirname(palette_net.__file__) + '/RD.state_dict.pt')
-        ):
-            FE.load_state_dict(torch.load(pkg_resources.open_binary(palette_net, "FE.state_dict.pt")))
-            RD.load_state_dict(torch.load(pkg_resources.open_binary(palette_net, "RD.state_dict.pt")))
-        else:
-            self.load_and_save_models()
+    def converted_color_map(self, is_rgba, pixels, out=None):
+        """
+        Replace every pixel of a numpy array with a lookup in the color map
 
-        if use_model_cpu:
-            FE.to("cpu")
-            RD.to("cpu")
+        The color map of the palette is the one used by the videos: built once
+        per palette and color distance and cached on disk, so the conversion is
+        a single gather and stills match the frames of a video.
+        The output is the same of converted_array.
 
-        lab_image = ((convertor.rgb2lab(np.array(image))) - [50,0,0] ) / [50,127,127]
+        Parameters
+        ----------
+        is_rgba : bool
+            true if the array has the alpha channel
+        pixels : ndarray
+            The image as uint8 array, it is converted in place unless out is given
+        out : ndarray, optional
+            array receiving the converted pixels, same shape of pixels
 
-        img = torch.Tensor(lab_image).permute(2,0,1)
+        Returns
+        -------
+        ndarray
+            the converted pixels
+        """
+        tolerance = self.TRANSPARENCY_TOLERANCE if is_rgba else None
+        colors = None
+        if self.USE_AVG_COLOR:
+            colors = ConvertUtility.get_avg_color_array(pixels, w=self.AVG_BOX_DATA['w'], h=self.AVG_BOX_DATA['h'])
+        color_cube = pl.load_color_map(self.get_palette_index(), cache_path=self.COLOR_MAP_CACHE_PATH)
+        return ConvertUtility.lookup_pixels(color_cube, pixels, colors, tolerance, out)
+
+    def convert_array(self, pixels, out=None, engine='numpy'):
+        """
+        Convert an image stored in a numpy array, in place or into a given array
 
-        h = 16*int(img.shape[1]/16)
-        w = 16*int(img.shape[2]/16)
+        The array is converted as it is: any strides work, e.g. views, channel
+        slices or read-only memory maps (with an out array), without copying it.
+        The conversion runs in numpy kernels, which release the GIL, so many
+        arrays can be converted at once by a pool of threads.
+        With 4 channels the pixels below TRANSPARENCY_TOLERANCE are left untouched.
 
-        T = transforms.Resize((h,w))
+        Parameters
+        ----------
+        pixels : ndarray
+            The image as uint8 array, shape (h, w, 3) or (h, w, 4)
+        out : ndarray, optional
+            writable uint8 array receiving the converted pixels, same shape of pixels.
+            By default pixels is converted in place
+        engine : str, optional
+            'numpy' for the vectorized engine or 'lut' for a lookup in the cached
+            color map of the palette, they give the same output of convert_image
 
-        img = T(img)
-        img = img.unsqueeze(0)
-        palette = []
-        for hex, rgb_value in self.PALETTE_DATA.items():
-            a = []
-            for j in [2,4,6]:
-                a.append(int(hex[j-2:j],16))
-            palette.append(a)
+        Returns
+        -------
+        ndarray
+            out, or pixels if out is not given
 
-        try:
-            pal_np = np.array(palette).reshape(1,6,3)/255
-        except:
-            # this feature is limited to 6 colours
-            # we're taking the first six
-            pal_np = np.array(palette[0:6]).reshape(1,6,3)/255
+        Raises
+        ------
+        ValueError
+            if the engine is not supported, if the arrays have a wrong type or
+            shape, or if the converted array is read-only
+        """
+        if engine not in ('numpy', 'lut'):
+            raise ValueError("the array conversion supports only the numpy and lut engines: " + str(engine))
+        if not isinstance(pixels, np.ndarray) or pixels.dtype != np.uint8 or pixels.ndim != 3 or pixels.shape[2] not in (3, 4):
+            raise ValueError("pixels must be an uint8 array of shape (h, w, 3) or (h, w, 4)")
+        if out is None:
+            out = pixels
+        elif not isinstance(out, np.ndarray) or out.dtype != np.uint8 or out.shape != pixels.shape:
+            raise ValueError("out must be an uint8 array of shape " + str(pixels.shape))
+        elif out is not pixels and np.may_share_memory(out, pixels):
+            # the pixels are read while out is written
+            pixels = pixels.copy()
+        if not out.flags.writeable:
+            raise ValueError("the converted array is read-only, give an out array")
+
+        tracer = self.TRACER
+        with tracer.span('convert_array.get_palette_data'):
+            self.get_palette_data()
+        is_rgba = (pixels.shape[2] == 4)
+        with tracer.span('convert_array.convert', pixels.shape[0] * pixels.shape[1], pixels.nbytes):
+            if engine == 'lut':
+                return self.converted_color_map(is_rgba, pixels, out)
+            return self.converted_array(is_rgba, pixels, out)
+
+    def converted_parallel(self, is_rgba, pixels, engine='python'):
+        """
+        Convert a numpy array tile by tile in a pool of worker processes
 
-        pal = torch.Tensor((convertor.rgb2lab(pal_np) - [50,0,0] ) / [50,128,128]).unsqueeze(0)
+        The image is split in horizontal tiles that are converted in shared memory
+        by a persistent process pool, so the conversion scales with the cpu cores.
+        Tiles include the rows around them needed by the avg algorithm.
 
-        image = img
-        palette = pal
-        illu = image[:,0:1,:,:]
+        Parameters
+        ----------
+        is_rgba : bool
+            true if the array has the alpha channel
+        pixels : ndarray
+            The image as uint8 array
+        engine : str, optional
+            conversion engine used by the workers: 'python', 'numpy' or 'lut'
 
-        with torch.no_grad():
-            c1,c2,c3,c4 = FE(image)
-            out = RD(c1, c2, c3, c4, palette, illu)
-            final_image = torch.cat([(illu+1)*50, out*128],axis = 1).permute(0,2,3,1)[0]
-            # need to convert float value returning in skimage to 0-255 range values for pillow (computer vision / training lib vs pixel operation lib)
-            return Image.fromarray((convertor.lab2rgb(final_image) * 255).astype(np.uint8))
+        Returns
+        -------
+        ndarray
+            the converted pixels
 
-    def convert_image(self, image, save_path='', use_model=False, use_model_cpu=False, parallel_threading=False):
+        Raises
+        ------
+        RuntimeError
+            if the conversion of a tile fails
         """
-        Process a Pillow image by replacing pixel or by avg algorithm
+        settings = {
+            'PALETTE_DATA': dict(self.PALETTE_DATA),
+            'TRANSPARENCY_TOLERANCE': self.TRANSPARENCY_TOLERANCE,
+            'COLOR_METRIC': self.COLOR_METRIC,
+            'USE_AVG_COLOR': self.USE_AVG_COLOR,
+            'AVG_BOX_DATA': dict(self.AVG_BOX_DATA),
+            'COLOR_MAP_CACHE_PATH': self.COLOR_MAP_CACHE_PATH,
+        }
+        if engine == 'lut':
+            # built once here, the workers load it from the cache
+            pl.load_color_map(self.get_palette_index(), cache_path=self.COLOR_MAP_CACHE_PATH)
+        max_workers = min(self.MAX_THREADS, os.cpu_count() or 1)
+        return parallel.convert_tiles(convert_tile, pixels, (settings, is_rgba, engine), max_workers)
+
+    def set_palette_net_path(self, path):
+        """Set the folder of the PaletteNet weights (and of the exported graphs)"""
+        self.PALETTE_NET_PATH = path
+
+    def set_palette_net_mirror(self, mirror, checksums=None):
+        """
+        Set where the missing PaletteNet weights are downloaded from
 
         Parameters
         ----------
-        image : pillow image
-            The source pillow image
-        save_path : str, optional
-            the path and the filename where to save the image
-        use_model : bool, optional
-            true if using ai model
-        use_model_cpu : bool, optional
-            true if using cpu power
-        parallel_threading : bool, optional
-            true to enable multi-thread conversion loop
+        mirror : str
+            base http(s) url or local folder holding the weights files
+        checksums : dict, optional
+            expected sha256 hex digest of every weights file name, the current
+            ones (the published files by default) if not specified; an empty
+            dict disables the check, e.g. for retrained weights
+        """
+        self.PALETTE_NET_REPO_FOLDER = mirror
+        if checksums is not None:
+            self.PALETTE_NET_CHECKSUMS = dict(checksums)
+
+    def load_and_save_models(self):
+        """
+        Download the missing PaletteNet weights into PALETTE_NET_PATH
+
+        Files are streamed from PALETTE_NET_REPO_FOLDER, verified against
+        PALETTE_NET_CHECKSUMS and moved in place only when complete.
 
         Returns
         -------
-        pillow image
-            processed image
+        str
+            the weights folder
         """
-        self.get_palette_data()
-        original_image = image.copy()
-        original_pixels = self.load_pixel_image(original_image)
-        original_image.close()
-        pixels = self.load_pixel_image(image)
-        is_rgba = (image.mode == 'RGBA')
-        exif = image.getexif()
-        exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN
+        return model_weights.provision_weights(self.PALETTE_NET_PATH, self.PALETTE_NET_REPO_FOLDER, self.PALETTE_NET_CHECKSUMS)
 
-        if use_model:
-            if torch != None:
-                image = self.convert_image_by_model(image, use_model_cpu)
-                exif = image.getexif()
-                exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN_AI
-            else:
-                print('Please install the dependencies required for the AI feature: pip install image-go-nord[AI]')
-        else:
-            if not parallel_threading:
-                self.converted_loop(is_rgba, pixels, original_pixels, image.size[0], image.size[1])
-            else:
-                step = ceil(image.size[0] / self.MAX_THREADS)
-                threads = []
-                for row in range(step, image.size[0] + step, step):
-                    args = (is_rgba, pixels, original_pixels, row, image.size[1], row - step, 0)
-                    t = threading.Thread(target=self.converted_loop, args=args)
-                    t.daemon = True
-                    t.start()
-                    threads.append(t)
-
-                for t in threads:
-                    t.join(timeout=30)
-
-        if self.USE_GAUSSIAN_BLUR:
-            image = image.filter(ImageFilter.GaussianBlur(1))
+    def prefetch_models(self):
+        """
+        Download the missing PaletteNet weights in a background thread
 
-        if (save_path != ''):
-            self.save_image_to_file(image, save_path)
+        Services can call it at startup, so that the first conversion does not wait
+        for the download; conversions started meanwhile wait for the same download.
 
-        return image
+        Returns
+        -------
+        Future
+            resolved with the weights folder, or with the download error
+        """
+        return model_weights.prefetch_weights(self.PALETTE_NET_PATH, self.PALETTE_NET_REPO_FOLDER, self.PALETTE_NET_CHECKSUMS)
 
-    def save_image_to_file(self, image, path):
+    def load_palette_net(self, use_model_cpu=False):
         """
-        Save a Pillow image to file
+        Get the PaletteNet models, loading the weights only once per process
+
+        The models are shared by every GoNord instance and kept in eval mode.
+        Missing weights are downloaded first; weights not matching
+        PALETTE_NET_CHECKSUMS raise a ValueError instead of being loaded.
 
         Parameters
         ----------
-        image : pillow image
-            The source pillow image
-        path : str
-            the path and the filename where to save the image
+        use_model_cpu : bool, optional
+            true if using cpu power, otherwise cuda is used when available
+
+        Returns
+        -------
+        tuple
+            the FeatureEncoder and the RecoloringDecoder
         """
-        exif = image.getexif()
-        image.save(path, exif=exif)
+        if not model_weights.has_weights(self.PALETTE_NET_PATH):
+            self.load_and_save_models()
 
+        # torch is imported only by the AI feature
+        import torch
+        import ImageGoNord.utility.model_loader as model_loader
 
+        device = 'cuda' if not use_model_cpu and torch.cuda.is_available() else 'cpu'
+        return model_loader.get_palette_net(self.PALETTE_NET_PATH, device, self.PALETTE_NET_CHECKSUMS)
 
-    def get_video_information(self, video_path):
+    def set_model_backend(self, backend):
         """
-        Get basic information about the video file
+        Set the library running PaletteNet
 
         Parameters
         ----------
-        video_path : str
-            Path of input video file
+        backend : str
+            'torch' (eager PyTorch), 'torchscript' or 'onnx' (onnxruntime, torch not needed)
+        """
+        model_backend.check_backend(backend)
+        self.MODEL_BACKEND = backend
+
+    def export_model(self, backend, path=None):
+        """
+        Export PaletteNet as a single graph, for the 'torchscript' and 'onnx' backends
+
+        Parameters
+        ----------
+        backend : str
+            'torchscript' or 'onnx'
+        path : str, optional
+            path of the exported graph, next to the weights if not specified
 
         Returns
         -------
-        tuple
-            The tuple of width, height, avg_framerate, duration, total_frames
+        str
+            path of the exported graph
         """
+        if backend not in model_backend.MODEL_FILES:
+            raise ValueError("only the torchscript and onnx backends can be exported")
 
-        probe = ffmpeg.probe(video_path)
-        video_stream = next(
-                (stream for stream in probe['streams'] if stream['codec_type'] == 'video'),
-                None)
+        from ImageGoNord.utility.model import PaletteNet
 
-        width = int(video_stream['width'])
-        height = int(video_stream['height'])
-        avg_frame_rate = video_stream['avg_frame_rate'].split('/')
-        framerate = int(avg_frame_rate[0]) / int(1 if avg_frame_rate[1] == 0 else avg_frame_rate[1])
-        duration = float(probe['format']['duration'])
-        total_frames = int(duration * framerate)
+        path = path or model_backend.get_model_file(backend, self.PALETTE_NET_PATH)
+        model = PaletteNet(*self.load_palette_net(use_model_cpu=True))
+        weights_version = model_backend.get_weights_version(self.PALETTE_NET_PATH)
+        if backend == 'onnx':
+            model_backend.export_onnx(model, path, weights_version)
+        else:
+            model_backend.export_torchscript(model, path, weights_version)
+        return path
 
-        return width, height, round(framerate, 2), duration, total_frames
+    def enable_fast_cpu_model(self):
+        """
+        Enable the int8 quantized PaletteNet on cpu
 
-    def convert_vid_to_np_arr(self, video_path, width, height, start_time, duration):
+        The models are quantized once per process (a few seconds) and then run
+        about twice as fast, at some accuracy cost: see compare_fast_cpu_model.
+        Only the 'torch' backend running on cpu is quantized.
         """
-        Convert video to array of numpy elements
+        self.USE_FAST_CPU_MODEL = True
 
-        Parameters
-        ----------
-        video_path : str
-            Path of input video file
-        width : int
-            Width of video(numpy array width)
-        height: int
-            Height of video(numpy array depth)
-        start_time : int
-            Time to seek forward in the video
-        duration : int
-            Number of frames to capture
-        fill_color: str
-            Default fill color as foreground
-        save_path : str, optional
-            the path and the filename where to save the image
+    def disable_fast_cpu_model(self):
+        """
+        Disable the int8 quantized PaletteNet on cpu
+
+        """
+        self.USE_FAST_CPU_MODEL = False
+
+    def set_model_threads(self, threads=None, interop_threads=None):
+        """
+        Set the cpu threads used by PaletteNet
+
+        With the torch backends the threads are shared by the whole process,
+        and the inter-op threads can be set only before the first conversion.
+
+        Parameters
+        ----------
+        threads : int, optional
+            threads used inside an operator, library default if None
+        interop_threads : int, optional
+            threads running independent operators, library default if None
+        """
+        self.MODEL_THREADS = threads
+        self.MODEL_INTEROP_THREADS = interop_threads
+
+    def load_model_backend(self, use_model_cpu=False, num_threads=None):
+        """
+        Get the backend running PaletteNet, MODEL_BACKEND
+
+        The exported graph is created from the weights the first time,
+        and again when the weights change.
+
+        Parameters
+        ----------
+        use_model_cpu : bool, optional
+            true if using cpu power, otherwise cuda is used when available
+        num_threads : int, optional
+            threads used inside an operator, MODEL_THREADS if None
+
+        Returns
+        -------
+        TorchBackend or OnnxBackend
+            the backend
+        """
+        backend = self.MODEL_BACKEND
+        num_threads = num_threads or self.MODEL_THREADS
+        if backend == 'torch':
+            from ImageGoNord.utility.model import PaletteNet
+            import ImageGoNord.utility.model_loader as model_loader
+
+            FE, RD = self.load_palette_net(use_model_cpu)
+            device = next(FE.parameters()).device
+            if self.USE_FAST_CPU_MODEL and device.type == 'cpu':
+                loaded = model_backend.TorchBackend(model_loader.get_quantized_palette_net(self.PALETTE_NET_PATH, self.PALETTE_NET_CHECKSUMS), channels_last=True)
+            else:
+                loaded = model_backend.TorchBackend(PaletteNet(FE, RD), device)
+        else:
+            if not model_backend.is_graph_current(backend, self.PALETTE_NET_PATH):
+                self.export_model(backend)
+            if use_model_cpu:
+                device = 'cpu'
+            elif backend == 'onnx':
+                # onnxruntime falls back to cpu without cuda support
+                device = 'cuda'
+            else:
+                import torch
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            # the onnx sessions are shared, each thread setting has its own
+            loaded = model_backend.get_backend(backend, self.PALETTE_NET_PATH, device, num_threads, self.MODEL_INTEROP_THREADS)
+
+        if backend != 'onnx':
+            loaded.set_num_threads(num_threads, self.MODEL_INTEROP_THREADS)
+        return loaded
+
+    def compare_fast_cpu_model(self, images, max_side=None):
+        """
+        Measure the quality of the int8 quantized PaletteNet against fp32
+
+        Parameters
+        ----------
+        images : list
+            The source pillow images
+        max_side : int, optional
+            as in convert_images_by_model
+
+        Returns
+        -------
+        list
+            for every image a dict with the 'psnr' (dB) and the mean CIEDE2000
+            difference ('delta_e') of the quantized output, and the conversion
+            times in seconds ('time_fp32', 'time_int8')
+        """
+        outputs = {}
+        for fast in (False, True):
+            go_nord = self.copy()
+            go_nord.USE_FAST_CPU_MODEL = fast
+            go_nord.warmup(use_model_cpu=True)
+            outputs[fast] = []
+            for image in images:
+                start = time.perf_counter()
+                converted = go_nord.convert_image_by_model(image, use_model_cpu=True, max_side=max_side)
+                outputs[fast].append((np.array(converted), time.perf_counter() - start))
+
+        report = []
+        for (expected, time_fp32), (quantized, time_int8) in zip(outputs[False], outputs[True]):
+            mse = np.mean((expected.astype(np.float64) - quantized) ** 2)
+            delta_e = cm.delta_e_2000(cm.rgb_to_lab(expected), cm.rgb_to_lab(quantized))
+            report.append({
+                'psnr': float('inf') if mse == 0 else float(10 * np.log10(255 ** 2 / mse)),
+                'delta_e': float(delta_e.mean()),
+                'time_fp32': time_fp32,
+                'time_int8': time_int8,
+            })
+        return report
+
+    def warmup(self, use_model_cpu=False):
+        """
+        Load the PaletteNet models in advance and run them once,
+        so that the first conversion does not pay the load cost
+
+        Parameters
+        ----------
+        use_model_cpu : bool, optional
+            true if using cpu power
+        """
+        backend = self.load_model_backend(use_model_cpu)
+        backend.predict(np.zeros((1, 64, 64, 3), dtype=np.float32), np.zeros((1, 6, 3), dtype=np.float32))
+
+    def get_model_palette(self):
+        """
+        Get the palette as PaletteNet input: the L*a*b* values of 6 colors
+
+        Returns
+        -------
+        ndarray
+            normalized palette, float32, shape (1, 6, 3)
+        """
+        palette = []
+        for hex, rgb_value in self.PALETTE_DATA.items():
+            a = []
+            for j in [2,4,6]:
+                a.append(int(hex[j-2:j],16))
+            palette.append(a)
+
+        try:
+            pal_np = np.array(palette, dtype=np.uint8).reshape(1,6,3)
+        except:
+            # this feature is limited to 6 colours
+            # we're taking the first six
+            pal_np = np.array(palette[0:6], dtype=np.uint8).reshape(1,6,3)
+
+        return ((cm.rgb_to_lab(pal_np) - [50,0,0] ) / [50,128,128]).astype(np.float32)
+
+    def get_model_pixels(self, image):
+        """
+        Get the RGB pixels of an image, padded to the PaletteNet input size
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+
+        Returns
+        -------
+        ndarray
+            uint8 values, padded to the model size (multiple of 16)
+        """
+        return model_tiling.pad_to_model_size(np.asarray(image.convert('RGB')))
+
+    def pixels_to_model_input(self, pixels):
+        """
+        Get RGB pixels as PaletteNet input: the normalized L*a*b* values
+
+        Parameters
+        ----------
+        pixels : ndarray
+            uint8 RGB values, shape (..., 3)
+
+        Returns
+        -------
+        ndarray
+            float32 values, same shape
+        """
+        lab = cm.rgb_to_lab(pixels, dtype=np.float32)
+        lab[..., 0] -= 50
+        lab /= np.array([50, 127, 127], dtype=np.float32)
+        return lab
+
+    def get_model_input(self, image):
+        """
+        Get an image as PaletteNet input: the normalized L*a*b* values
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+
+        Returns
+        -------
+        ndarray
+            float32 values, padded to the model size (multiple of 16)
+        """
+        return self.pixels_to_model_input(self.get_model_pixels(image))
+
+    def predict_chroma_by_tiles(self, backend, palette, pixels, batch_size, max_pixels):
+        """
+        Run PaletteNet on overlapping tiles of an image and blend them
+
+        Every batch of tiles is converted to the model input on its own, so
+        the L*a*b* values of the whole image are never in memory.
+
+        Parameters
+        ----------
+        backend : TorchBackend or OnnxBackend
+            The backend running PaletteNet
+        palette : ndarray
+            The normalized palette, shape (1, 6, 3)
+        pixels : ndarray
+            uint8 RGB values padded to the model size, shape (h, w, 3)
+        batch_size : int
+            maximum number of tiles run together
+        max_pixels : int
+            maximum number of pixels of a forward pass
+
+        Returns
+        -------
+        ndarray
+            the predicted a* b* channels, normalized, shape (h, w, 2)
+        """
+        height, width = pixels.shape[:2]
+        tile_height, tile_width = model_tiling.get_tile_shape(height, width, max_pixels)
+        boxes = [
+            (top, left)
+            for top in model_tiling.split_tiles(height, tile_height)
+            for left in model_tiling.split_tiles(width, tile_width)
+        ]
+        batch_size = max(1, min(batch_size, max_pixels // (tile_height * tile_width)))
+
+        chroma = np.zeros((height, width, 2), dtype=np.float32)
+        weights = np.zeros((height, width, 1), dtype=np.float32)
+        for start in range(0, len(boxes), batch_size):
+            batch = boxes[start:start + batch_size]
+            tiles = self.pixels_to_model_input(
+                np.stack([pixels[top:top + tile_height, left:left + tile_width] for top, left in batch])
+            )
+            for (top, left), tile_chroma in zip(batch, backend.predict(tiles, palette)):
+                weight = np.outer(
+                    model_tiling.get_blend_weights(height, tile_height, top),
+                    model_tiling.get_blend_weights(width, tile_width, left),
+                )[:, :, None]
+                chroma[top:top + tile_height, left:left + tile_width] += tile_chroma * weight
+                weights[top:top + tile_height, left:left + tile_width] += weight
+
+        return chroma / weights
+
+    def get_model_image(self, image, max_side=None):
+        """
+        Get the image used for predicting the chroma
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        max_side : int, optional
+            maximum length of the longest side, no limit if not specified
+
+        Returns
+        -------
+        pillow image
+            the source image, downscaled if its longest side exceeds max_side
+        """
+        w, h = image.size
+        if not max_side or max(w, h) <= max_side:
+            return image
+
+        scale = max_side / max(w, h)
+        return image.convert('RGB').resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BOX)
+
+    def model_output_to_image(self, image, chroma):
+        """
+        Combine the luminance of an image with the chroma predicted by PaletteNet
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        chroma : ndarray
+            the predicted a* b* channels, normalized, shape (h, w, 2);
+            it is upsampled when predicted on a downscaled image
+
+        Returns
+        -------
+        pillow image
+            processed image, same size of the source
+        """
+        width, height = image.size
+        pixels = np.asarray(image.convert('RGB'))
+        converted = np.empty_like(pixels)
+        # float32 L*a*b* values of a strip at a time, never of the whole image
+        strip_rows = max(1, self.STRIP_PIXELS // width)
+        for start in range(0, height, strip_rows):
+            rows = slice(start, min(height, start + strip_rows))
+            if chroma.shape[:2] != (height, width):
+                strip_chroma = model_tiling.resize_bilinear(chroma, height, width, rows=rows)
+            else:
+                strip_chroma = chroma[rows]
+            lab_image = cm.rgb_to_lab(pixels[rows], dtype=np.float32)
+            lab_image[:, :, 1:] = strip_chroma * 128
+            # need to convert float value in the 0-1 range to 0-255 range values for pillow
+            converted[rows] = cm.lab_to_rgb(lab_image, dtype=np.float32) * 255
+        return Image.fromarray(converted)
+
+    def set_model_memory_limit(self, memory_limit):
+        """
+        Set the peak memory budget of the PaletteNet inference
+
+        Images needing more memory are processed in overlapping tiles.
+
+        Parameters
+        ----------
+        memory_limit : int
+            memory budget in bytes
+        """
+        self.MODEL_MEMORY_LIMIT = int(memory_limit)
+
+    def convert_image_by_model(self, image, use_model_cpu=False, max_side=None):
+        """
+        Process a Pillow image by using a PyTorch model "PaletteNet" for recoloring the image
+
+        Only the chroma is predicted by the model, the luminance is kept from the
+        source image. Images exceeding MODEL_MEMORY_LIMIT are processed in tiles.
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        use_model_cpu : bool, optional
+            true if using cpu power
+        max_side : int, optional
+            predict the chroma on a copy whose longest side is at most max_side
+            (e.g. 512), then upsample it: the cost becomes almost constant
+
+        Returns
+        -------
+        pillow image
+            processed image, same size of the source
+        """
+        return self.convert_images_by_model([image], use_model_cpu, max_side=max_side)[0]
+
+    def convert_images_by_model(self, images, use_model_cpu=False, batch_size=4, num_threads=None, max_side=None):
+        """
+        Process many Pillow images with PaletteNet, running the models once per batch
+
+        Images with the same model input size (the size rounded up to a multiple of 16)
+        are grouped in batches of up to batch_size images, within MODEL_MEMORY_LIMIT.
+        Bigger images are processed in overlapping tiles.
+
+        Parameters
+        ----------
+        images : list
+            The source pillow images
+        use_model_cpu : bool, optional
+            true if using cpu power
+        batch_size : int, optional
+            maximum number of images (or tiles) run together
+        num_threads : int, optional
+            number of cpu threads used by the model backend
+        max_side : int, optional
+            predict the chroma on copies whose longest side is at most max_side
+
+        Returns
+        -------
+        list
+            processed images, in the same order
+        """
+        tracer = self.TRACER
+        with tracer.span('convert_image_by_model.get_palette_data'):
+            self.get_palette_data()
+        with tracer.span('convert_image_by_model.load_model'):
+            backend = self.load_model_backend(use_model_cpu, num_threads)
+        palette = self.get_model_palette()
+        max_pixels = model_tiling.get_max_pixels(self.MODEL_MEMORY_LIMIT)
+
+        model_images = [self.get_model_image(image, max_side) for image in images]
+        batches = {}
+        for position, image in enumerate(model_images):
+            w, h = image.size
+            batches.setdefault(model_tiling.get_model_size(h, w), []).append(position)
+
+        def output_to_image(position, chroma):
+            image = images[position]
+            pixels_count = image.size[0] * image.size[1]
+            with tracer.span('convert_image_by_model.postprocess', pixels_count, pixels_count * 3):
+                return self.model_output_to_image(image, chroma)
+
+        converted = [None] * len(images)
+        for (h, w), positions in batches.items():
+            if h * w > max_pixels:
+                for position in positions:
+                    width, height = model_images[position].size
+                    with tracer.span('convert_image_by_model.preprocess', width * height, width * height * 3):
+                        pixels = self.get_model_pixels(model_images[position])
+                    with tracer.span('convert_image_by_model.predict', h * w, pixels.nbytes):
+                        chroma = self.predict_chroma_by_tiles(backend, palette, pixels, batch_size, max_pixels)
+                    converted[position] = output_to_image(position, chroma[:height, :width])
+                continue
+
+            images_per_batch = max(1, min(batch_size, max_pixels // (h * w)))
+            for start in range(0, len(positions), images_per_batch):
+                batch_positions = positions[start:start + images_per_batch]
+                batch_pixels = len(batch_positions) * h * w
+                with tracer.span('convert_image_by_model.preprocess', batch_pixels, batch_pixels * 3):
+                    lab_images = np.stack([self.get_model_input(model_images[position]) for position in batch_positions])
+                with tracer.span('convert_image_by_model.predict', batch_pixels, lab_images.nbytes):
+                    predicted = backend.predict(lab_images, palette)
+                for position, chroma in zip(batch_positions, predicted):
+                    width, height = model_images[position].size
+                    converted[position] = output_to_image(position, chroma[:height, :width])
+
+        return converted
+
+    def convert_image(self, image, save_path='', use_model=False, use_model_cpu=False, parallel_threading=False, engine='python'):
+        """
+        Process a Pillow image by replacing pixel or by avg algorithm
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        save_path : str, optional
+            the path and the filename where to save the image
+        use_model : bool, optional
+            true if using ai model
+        use_model_cpu : bool, optional
+            true if using cpu power
+        parallel_threading : bool, optional
+            true to convert the image in parallel with a pool of worker processes
+        engine : str, optional
+            'python' for the pixel by pixel loop, 'numpy' for the vectorized engine,
+            'lut' for a lookup in the cached color map of the palette, like videos.
+            The numpy and lut engines work on RGB and RGBA images and give the same output
+
+        Returns
+        -------
+        pillow image
+            processed image
+        """
+        if engine not in self.CONVERSION_ENGINES:
+            raise ValueError("unknown conversion engine: " + str(engine))
+
+        tracer = self.TRACER
+        pixels_count = image.size[0] * image.size[1]
+        nbytes = pixels_count * len(image.getbands())
+        with tracer.span('convert_image.get_palette_data'):
+            self.get_palette_data()
+        with tracer.span('convert_image.decode', pixels_count, nbytes):
+            pixels = self.load_pixel_image(image)
+            original_pixels = pixels
+            avg_pixels = None
+            if engine == 'python' and self.USE_AVG_COLOR and not use_model and not parallel_threading:
+                if image.mode in ('RGB', 'RGBA'):
+                    avg_pixels = self.load_avg_pixel_image(np.asarray(image))
+                else:
+                    # the avg of the loop reads the pixels not converted yet
+                    original_image = image.copy()
+                    original_pixels = self.load_pixel_image(original_image)
+                    original_image.close()
+        is_rgba = (image.mode == 'RGBA')
+        with tracer.span('convert_image.exif'):
+            exif = image.getexif()
+            exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN
+
+        with tracer.span('convert_image.convert', pixels_count, nbytes):
+            if use_model:
+                if model_backend.is_backend_available(self.MODEL_BACKEND):
+                    image = self.convert_image_by_model(image, use_model_cpu)
+                    exif = image.getexif()
+                    exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN_AI
+                else:
+                    print('Please install the dependencies required for the AI feature: pip install image-go-nord[AI]')
+            elif parallel_threading:
+                if image.mode not in ('RGB', 'RGBA'):
+                    raise ValueError("the parallel conversion supports only RGB or RGBA images")
+                image.paste(Image.fromarray(self.converted_parallel(is_rgba, np.array(image), engine)))
+            elif engine in ('numpy', 'lut'):
+                if image.mode not in ('RGB', 'RGBA'):
+                    raise ValueError("the " + engine + " engine supports only RGB or RGBA images")
+                # Pillow exposes no writable view of its pixels: convert one
+                # copy in place, then write it back into the image
+                pixels = np.array(image)
+                image.frombytes(self.convert_array(pixels, engine=engine))
+            else:
+                self.converted_loop(is_rgba, pixels, original_pixels, image.size[0], image.size[1], avg_pixels=avg_pixels)
+
+        if self.USE_GAUSSIAN_BLUR:
+            with tracer.span('convert_image.blur', pixels_count, nbytes):
+                image = image.filter(ImageFilter.GaussianBlur(1))
+                # the filtered image is a new one, keep the exif of the converted image
+                image.getexif().update(exif)
+
+        if (save_path != ''):
+            with tracer.span('convert_image.save', pixels_count, nbytes):
+                self.save_image_to_file(image, save_path)
+
+        return image
+
+    def save_image_to_file(self, image, path):
+        """
+        Save a Pillow image to file
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        path : str
+            the path and the filename where to save the image
+        """
+        exif = image.getexif()
+        image.save(path, exif=exif)
+
+    def convert_image_strips(self, path, output_path, engine='numpy', strip_rows=None):
+        """
+        Convert an image file strip by strip, with bounded memory
+
+        The image is read, converted and written in horizontal strips of about
+        STRIP_PIXELS pixels. Each strip is converted together with the rows
+        around it read by the avg algorithm and by the blur, so the pixels are
+        the same of convert_image.
+        The pixels of uncompressed files (TIFF, BMP, PPM) are mapped from disk
+        and TIFF outputs are written as uncompressed TIFF strip by strip: then
+        the memory does not depend on the size of the image. Compressed inputs
+        are decoded by Pillow at once, other output formats are assembled and
+        saved by Pillow, like convert_image_file does.
+        The output is written atomically.
+
+        Parameters
+        ----------
+        path : str
+            path of the source image
+        output_path : str
+            path of the converted image, its folder is created if missing
+        engine : str, optional
+            as in convert_image, the numpy engine by default
+        strip_rows : int, optional
+            rows of every strip, STRIP_PIXELS bounds it by default
+
+        Returns
+        -------
+        int
+            the number of pixels of the image
+        """
+        if engine not in self.CONVERSION_ENGINES:
+            raise ValueError("unknown conversion engine: " + str(engine))
+
+        tracer = self.TRACER
+        with tracer.span('convert_image_strips.get_palette_data'):
+            self.get_palette_data()
+
+        folder, name = os.path.split(output_path)
+        tmp_path = os.path.join(folder, '.' + uuid.uuid4().hex + '.' + name)
+        # not open_image: the pixels must not be loaded, or they cannot be mapped from disk
+        with Image.open(path) as image:
+            if len(image.getbands()) == 1:
+                # single band images are converted to RGB like open_image does
+                image = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                has_alpha = 'A' in image.mode or 'transparency' in image.info
+                image = image.convert('RGBA' if has_alpha else 'RGB')
+            width, height = image.size
+            is_rgba = (image.mode == 'RGBA')
+            exif = image.getexif()
+            exif[ExifTags.Base.ProcessingSoftware] = self.EXIF_IGN
+
+            def convert(pixels):
+                with tracer.span('convert_image_strips.convert', pixels.shape[0] * width, pixels.nbytes):
+                    if engine == 'numpy':
+                        return self.converted_array(is_rgba, pixels)
+                    if engine == 'lut':
+                        return self.converted_color_map(is_rgba, pixels)
+                    strip = Image.fromarray(pixels).copy()
+                    loop_pixels = self.load_pixel_image(strip)
+                    avg_pixels = self.load_avg_pixel_image(pixels) if self.USE_AVG_COLOR else None
+                    self.converted_loop(is_rgba, loop_pixels, loop_pixels, width, pixels.shape[0], avg_pixels=avg_pixels)
+                    return np.asarray(strip)
+
+            def blur(pixels):
+                with tracer.span('convert_image_strips.blur', pixels.shape[0] * width, pixels.nbytes):
+                    return np.asarray(Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(1)))
+
+            halo_top, halo_bottom = 0, 0
+            if self.USE_AVG_COLOR:
+                halo_top = max(0, -self.AVG_BOX_DATA['w'])
+                halo_bottom = max(0, self.AVG_BOX_DATA['h'] - 1)
+            strip_rows = strip_rows or max(1, self.STRIP_PIXELS // width)
+            strips = streaming.stream_with_halo(streaming.read_strips(image, strip_rows), halo_top, halo_bottom, convert)
+            if self.USE_GAUSSIAN_BLUR:
+                strips = streaming.stream_with_halo(strips, streaming.BLUR_HALO, streaming.BLUR_HALO, blur)
+
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            try:
+                if os.path.splitext(name)[1].lower() in streaming.TIFF_EXTENSIONS:
+                    with streaming.TiffWriter(tmp_path, width, height, image.mode, software=self.EXIF_IGN) as writer:
+                        for strip in strips:
+                            with tracer.span('convert_image_strips.save', strip.shape[0] * width, strip.nbytes):
+                                writer.write(strip)
+                else:
+                    converted = np.empty((height, width, len(image.mode)), dtype=np.uint8)
+                    row = 0
+                    for strip in strips:
+                        converted[row:row + len(strip)] = strip
+                        row += len(strip)
+                    with tracer.span('convert_image_strips.save', width * height, converted.nbytes):
+                        converted_image = Image.fromarray(converted, image.mode)
+                        converted_image.info.update(image.info)
+                        converted_image.save(tmp_path, exif=exif)
+                os.replace(tmp_path, output_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return width * height
+
+    def convert_image_file(self, path, output_path, engine='numpy', use_model=False, use_model_cpu=False, streaming=False):
+        """
+        Convert an image file and write the result atomically
+
+        Parameters
+        ----------
+        path : str
+            path of the source image
+        output_path : str
+            path of the converted image, its folder is created if missing
+        engine : str, optional
+            as in convert_image
+        use_model : bool, optional
+            true if using ai model
+        use_model_cpu : bool, optional
+            true if using cpu power
+        streaming : bool, optional
+            true to convert the image strip by strip with convert_image_strips,
+            for images too big for the memory
+
+        Returns
+        -------
+        int
+            the number of pixels of the image
+        """
+        if streaming:
+            if use_model:
+                raise ValueError("the streaming conversion does not support the model")
+            return self.convert_image_strips(path, output_path, engine)
+
+        folder, name = os.path.split(output_path)
+        # a hidden name with the same extension, so the format does not change
+        tmp_path = os.path.join(folder, '.' + uuid.uuid4().hex + '.' + name)
+        with self.open_image(path) as image:
+            converted = self.convert_image(self.get_engine_image(image, engine), use_model=use_model, use_model_cpu=use_model_cpu, engine=engine)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            try:
+                self.save_image_to_file(converted, tmp_path)
+                os.replace(tmp_path, output_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            return converted.size[0] * converted.size[1]
+
+    def get_engine_image(self, image, engine):
+        """
+        Get an image in a mode supported by a conversion engine
+
+        Parameters
+        ----------
+        image : pillow image
+            The source pillow image
+        engine : str
+            engine of convert_image
+
+        Returns
+        -------
+        pillow image
+            the image itself, or an RGB (RGBA if it has transparency) copy
+            for the numpy and lut engines
+        """
+        if engine != 'python' and image.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in image.mode or 'transparency' in image.info
+            return image.convert('RGBA' if has_alpha else 'RGB')
+        return image
+
+    def get_conversion_fingerprint(self, engine='numpy', use_model=False):
+        """
+        Get the fingerprint of the settings changing the converted images
+
+        Parameters
+        ----------
+        engine : str, optional
+            as in convert_image
+        use_model : bool, optional
+            true if using ai model
+
+        Returns
+        -------
+        str
+            sha256 hex digest of the palette and of the conversion settings
+        """
+        settings = {
+            'palette': sorted(self.get_palette_data().items()),
+            'use_model': use_model,
+        }
+        if use_model:
+            settings.update(
+                backend=self.MODEL_BACKEND,
+                fast_cpu_model=self.USE_FAST_CPU_MODEL,
+                weights=sorted(self.PALETTE_NET_CHECKSUMS.items()),
+            )
+        else:
+            settings.update(
+                engine=engine,
+                gaussian_blur=self.USE_GAUSSIAN_BLUR,
+                avg_color=self.USE_AVG_COLOR,
+                avg_box=self.AVG_BOX_DATA if self.USE_AVG_COLOR else None,
+                transparency_tolerance=self.TRANSPARENCY_TOLERANCE,
+                color_metric=self.COLOR_METRIC,
+            )
+        return batch.get_fingerprint(settings)
+
+    def convert_batch(self, paths, out_dir, workers=None, engine='numpy', use_model=False, use_model_cpu=False, force=False, callback=None, streaming=False):
+        """
+        Convert many image files with a pool of worker threads
+
+        Files with an image extension are found in directories (recursively)
+        and glob patterns, and the outputs keep their path relative to the
+        directory or to the glob folder; files that would be written to the
+        same output raise a ValueError.
+        The workers share this instance, so the palette, its index, the color
+        maps and the models are loaded once for every file.
+        Outputs newer than their source and written with the same settings
+        (get_conversion_fingerprint, recorded in the manifest of out_dir)
+        are skipped.
+
+        Parameters
+        ----------
+        paths : list
+            image files, directories or glob patterns
+        out_dir : str
+            folder of the converted images
+        workers : int, optional
+            number of worker threads, MAX_THREADS and the cpu count bound it by default
+        engine : str, optional
+            as in convert_image, the numpy engine by default
+        use_model : bool, optional
+            true if using ai model
+        use_model_cpu : bool, optional
+            true if using cpu power
+        force : bool, optional
+            true to convert also the images whose output is up to date
+        callback : callable, optional
+            called with the result of every file as soon as it is done
+        streaming : bool, optional
+            true to convert every image strip by strip, as in convert_image_file
+
+        Returns
+        -------
+        dict
+            'files': for every file a dict with its 'path', 'output', 'status'
+            ('converted', 'skipped' or 'failed'), 'seconds', 'pixels' and 'error';
+            'seconds': the total time, 'pixels': the converted pixels and
+            'megapixels_per_second': the throughput
+        """
+        if engine not in self.CONVERSION_ENGINES:
+            raise ValueError("unknown conversion engine: " + str(engine))
+
+        start = time.perf_counter()
+        # load the shared state once, before the workers start
+        self.get_palette_data()
+        if use_model:
+            self.warmup(use_model_cpu)
+        elif self.PALETTE_DATA:
+            palette_index = self.get_palette_index()
+            if engine == 'lut':
+                pl.load_color_map(palette_index, cache_path=self.COLOR_MAP_CACHE_PATH)
+
+        fingerprint = self.get_conversion_fingerprint(engine, use_model)
+        recorded = batch.load_manifest(out_dir)
+        manifest = dict(recorded)
+        manifest_lock = threading.Lock()
+
+        def convert(job):
+            path, relative_path = job
+            output_path = os.path.join(out_dir, relative_path)
+            key = relative_path.replace(os.sep, '/')
+            result = {'path': path, 'output': output_path, 'status': 'skipped', 'seconds': 0.0, 'pixels': 0, 'error': None}
+            file_start = time.perf_counter()
+            try:
+                if force or not batch.is_up_to_date(path, output_path, fingerprint, manifest.get(key)):
+                    with manifest_lock:
+                        manifest.pop(key, None)
+                    result['pixels'] = self.convert_image_file(path, output_path, engine, use_model, use_model_cpu, streaming)
+                    result['status'] = 'converted'
+                    with manifest_lock:
+                        manifest[key] = fingerprint
+            except Exception as error:
+                result['status'] = 'failed'
+                result['error'] = error
+            result['seconds'] = time.perf_counter() - file_start
+            if callback is not None:
+                callback(result)
+            return result
+
+        jobs = batch.find_images(paths)
+        workers = workers or min(self.MAX_THREADS, os.cpu_count() or 1)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                files = list(executor.map(convert, jobs))
+        finally:
+            if manifest != recorded:
+                batch.save_manifest(out_dir, manifest)
+
+        seconds = time.perf_counter() - start
+        pixels = sum(result['pixels'] for result in files)
+        return {
+            'files': files,
+            'seconds': seconds,
+            'pixels': pixels,
+            'megapixels_per_second': pixels / 1e6 / seconds if seconds > 0 else 0.0,
+        }
+
+
+
+    def get_video_information(self, video_path):
+        """
+        Get basic information about the video file
+
+        Parameters
+        ----------
+        video_path : str
+            Path of input video file
+
+        Returns
+        -------
+        tuple
+            The tuple of width, height, avg_framerate, duration, total_frames
+        """
+        import ffmpeg
+
+        probe = ffmpeg.probe(video_path)
+        video_stream = next(
+                (stream for stream in probe['streams'] if stream['codec_type'] == 'video'),
+                None)
+
+        width = int(video_stream['width'])
+        height = int(video_stream['height'])
+        avg_frame_rate = video_stream['avg_frame_rate'].split('/')
+        framerate = int(avg_frame_rate[0]) / int(1 if avg_frame_rate[1] == 0 else avg_frame_rate[1])
+        duration = float(probe['format']['duration'])
+        total_frames = int(duration * framerate)
+
+        return width, height, round(framerate, 2), duration, total_frames
+
+    def convert_vid_to_np_arr(self, video_path, width, height, start_time, duration):
+        """
+        Convert video to array of numpy elements
+
+        Parameters
+        ----------
+        video_path : str
+            Path of input video file
+        width : int
+            Width of video(numpy array width)
+        height: int
+            Height of video(numpy array depth)
+        start_time : int
+            Time to seek forward in the video
+        duration : int
+            Number of frames to capture
+        fill_color: str
+            Default fill color as foreground
+        save_path : str, optional
+            the path and the filename where to save the image
 
 
         Returns
@@ -660,7 +1935,8 @@ class GoNord(object):
         ndarray
             The numpy array of video frames
         """
-        
+        import ffmpeg
+
         out, _ = (
             ffmpeg
             .input(video_path, ss=str(start_time), t=str(duration))
@@ -697,7 +1973,8 @@ class GoNord(object):
         None
             Convert the numpy array to video and save to disk
         """
-        
+        import ffmpeg
+
         # If images is a list, convert to ndarray
         if not isinstance(images, np.ndarray):
             images = np.asarray(images)
@@ -709,12 +1986,13 @@ class GoNord(object):
                 .overwrite_output()
                 .run_async(pipe_stdin=True)
         )
+        tracer = self.TRACER
+        frame_size = width * height * 3
         for idx, frame in enumerate(images):
-            process.stdin.write(
-                ConvertUtility.convert_palette(cube, frame)
-                    .astype(np.uint8)
-                    .tobytes()
-            )
+            with tracer.span('convert_video.convert', width * height, frame_size):
+                frame = ConvertUtility.convert_palette(cube, frame).astype(np.uint8).tobytes()
+            with tracer.span('convert_video.encode', width * height, frame_size):
+                process.stdin.write(frame)
         process.stdin.close()
         process.wait()
 
@@ -734,7 +2012,8 @@ class GoNord(object):
         None
             Concatenate two videos and save to disk
         """
-        
+        import ffmpeg
+
         main = ffmpeg.input(out)
         temp = ffmpeg.input(os.path.join(save_path, f'temp_{uid}.mp4'))
         (
@@ -764,6 +2043,8 @@ class GoNord(object):
         None
             Apply the original audio to the output video
         """
+        import ffmpeg
+
         tmp_filename = '/tmp/' + str(uuid.uuid4())
         shutil.copyfile(_output, tmp_filename)
         output_video_stream = ffmpeg.input(tmp_filename).video
@@ -775,42 +2056,161 @@ class GoNord(object):
         )
         os.remove(tmp_filename)
 
-    def convert_video(self, _input, palette_name, _frames_per_batch = 200, save_path = '/tmp'):
+    def stream_video(self, _input, _output, cube, width, height, framerate, vcodec='libx264', cancel_event=None):
         """
-        Concatenate two videos
+        Convert a video in a single pass
+
+        One ffmpeg process decodes the input into raw frames, every frame goes
+        through the color map and into one ffmpeg process that encodes it
+        together with the original audio. Each frame is decoded and encoded
+        once and only one frame at a time is kept in memory.
+
+        Parameters
+        ----------
+        _input : str
+            Input video file path
+        _output : str
+            Output video file path
+        cube : ndarray
+            color map that is generated
+        width : int
+            Width of the video
+        height : int
+            Height of the video
+        framerate : float
+            FPS of the video
+        vcodec : str / optional
+            Video codec of the output
+        cancel_event : threading.Event / optional
+            when set, the conversion stops before the next frame
+
+        Raises
+        ------
+        RuntimeError
+            if ffmpeg fails to decode or encode the video, with the errors of the encoder
+        CancelledError
+            if the conversion is cancelled
+        """
+        import ffmpeg
+
+        probe = ffmpeg.probe(_input)
+        has_audio = any(stream['codec_type'] == 'audio' for stream in probe['streams'])
+
+        decoder = (
+            ffmpeg
+            .input(_input)
+            .output('pipe:', format='rawvideo', pix_fmt='rgb24', loglevel='quiet')
+            .run_async(pipe_stdout=True)
+        )
+        streams = [ffmpeg.input('pipe:', format='rawvideo', pix_fmt='rgb24', r=framerate, s='{}x{}'.format(width, height))]
+        if has_audio:
+            streams.append(ffmpeg.input(_input).audio)
+        encoder = (
+            ffmpeg
+            .output(*streams, _output, pix_fmt='yuv420p', vcodec=vcodec, loglevel='error', tune='fastdecode', preset='ultrafast')
+            .overwrite_output()
+            .run_async(pipe_stdin=True, pipe_stderr=True)
+        )
+        # drained in background, a full stderr pipe would block the encoder
+        encoder_errors = []
+        stderr_reader = threading.Thread(target=lambda: encoder_errors.append(encoder.stderr.read()), daemon=True)
+        stderr_reader.start()
+
+        tracer = self.TRACER
+        frame_size = width * height * 3
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError('the conversion of the video ' + _input + ' was cancelled')
+                with tracer.span('convert_video.decode', width * height, frame_size):
+                    frame = decoder.stdout.read(frame_size)
+                if len(frame) < frame_size:
+                    break
+                frame = np.frombuffer(frame, np.uint8).reshape(height, width, 3)
+                with tracer.span('convert_video.convert', width * height, frame_size):
+                    frame = ConvertUtility.convert_palette(cube, frame).tobytes()
+                try:
+                    with tracer.span('convert_video.encode', width * height, frame_size):
+                        encoder.stdin.write(frame)
+                except BrokenPipeError:
+                    # the encoder exited early, its errors are reported below
+                    decoder.kill()
+                    break
+        except BaseException:
+            decoder.kill()
+            encoder.kill()
+            raise
+        finally:
+            decoder.stdout.close()
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+            decoder.wait()
+            encoder.wait()
+            stderr_reader.join()
+            encoder.stderr.close()
+
+        if decoder.returncode != 0 or encoder.returncode != 0:
+            errors = b''.join(encoder_errors).decode('utf-8', 'replace').strip()
+            raise RuntimeError('ffmpeg failed to convert the video ' + _input + (': ' + errors if errors else ''))
+
+    def convert_video(self, _input, palette_name, _frames_per_batch = 200, save_path = '/tmp', streaming = True, cancel_event = None):
+        """
+        Convert a video to the current palette
 
         Parameters
         ----------
         _input : str
             Input video file path
         palette_name : str
-            Name of palette to choose
+            Name of palette to choose, kept for compatibility:
+            the color map is cached by the content of the current palette
         _frames_per_batch : int / optional
             Number of frames to keep in a batch
             Higher number indicates more memory usage but faster execution due to lesser number of parts 
         save_path : str
             Location where to save the output video
+        streaming : bool / optional
+            true to convert the video in a single pass with stream_video,
+            false to convert it in batches of `_frames_per_batch` frames
+        cancel_event : threading.Event / optional
+            when set, the conversion stops before the next frame (or batch)
+            and the partial output is removed
 
         Returns
         -------
-        None
-            Convert input video and save to disk
+        str
+            Path of the converted video
+
+        Raises
+        ------
+        CancelledError
+            if the conversion is cancelled
         """
         # Generate some random unique identifier that is generated for each session for the temporary files.
         uid = uuid.uuid4()
-        palette = list(self.PALETTE_DATA.values())
+        tracer = self.TRACER
+        with tracer.span('convert_video.get_palette_data'):
+            self.get_palette_data()
 
         _output = os.path.join(save_path, _input.split('.')[0] + str(uid) +'_converted.mp4')
-        # run once to generate the color map file
-        try:
-            # for all colors (256*256*256) assign color from palette
-            precalculated = np.load(f'{palette_name}.npz')['color_cube']
-        except:
-            pl.generate_color_map(palette, palette_name)
-            precalculated = np.load(f'{palette_name}.npz')['color_cube']
+        # for all colors (256*256*256) assign color from palette, built once per palette
+        with tracer.span('convert_video.color_map'):
+            precalculated = pl.load_color_map(self.get_palette_index(), cache_path=self.COLOR_MAP_CACHE_PATH)
 
         # Initialize variables for conversion
-        width, height, framerate, duration, total_frames = self.get_video_information(_input)
+        with tracer.span('convert_video.probe'):
+            width, height, framerate, duration, total_frames = self.get_video_information(_input)
+
+        if streaming:
+            try:
+                self.stream_video(_input, _output, precalculated, width, height, framerate, cancel_event=cancel_event)
+            except CancelledError:
+                if os.path.exists(_output):
+                    os.remove(_output)
+                raise
+            return _output
 
         frames_per_batch = _frames_per_batch
         frame_number = 0
@@ -820,7 +2220,12 @@ class GoNord(object):
 
         # Process the entire video in batches of `frames_per_batch` frames
         while frame_number < total_frames:
-            np_arr = self.convert_vid_to_np_arr(_input, width, height, timestamp, batch_dur)
+            if cancel_event is not None and cancel_event.is_set():
+                if os.path.exists(_output):
+                    os.remove(_output)
+                raise CancelledError('the conversion of the video ' + _input + ' was cancelled')
+            with tracer.span('convert_video.decode'):
+                np_arr = self.convert_vid_to_np_arr(_input, width, height, timestamp, batch_dur)
             if os.path.exists(_output):
                 self.vidwrite(os.path.join(save_path, f'temp_{uid}.mp4'), precalculated, np_arr, framerate, frame_number, total_frames)
                 self.concat_video(uid, _output, save_path)
@@ -836,3 +2241,153 @@ class GoNord(object):
         self.apply_original_audio(_input, _output)
 
         return _output
+
+    async def aconvert_image(self, image, save_path='', use_model=False, use_model_cpu=False, parallel_threading=False, engine='numpy'):
+        """
+        Process a Pillow image without blocking the event loop
+
+        convert_image runs in the pool of threads of get_async_executor, the
+        models are loaded (and downloaded) there too. The image must not be
+        used until the conversion ends.
+        The numpy engine is the default: its kernels release the GIL, so the
+        event loop and the other conversions keep running, while the python
+        engine holds the GIL for the whole conversion. Images of other modes
+        than RGB and RGBA are converted to them first, as in convert_image_file.
+        If the task is cancelled while waiting for a slot the image is not
+        converted; a running conversion ends in its thread and its result is dropped.
+
+        Parameters
+        ----------
+        image, save_path, use_model, use_model_cpu, parallel_threading, engine
+            as in convert_image
+
+        Returns
+        -------
+        pillow image
+            processed image
+
+        Raises
+        ------
+        QueueFullError
+            if every slot is busy and the queue is full
+        """
+        def convert():
+            return self.convert_image(
+                self.get_engine_image(image, engine), save_path, use_model, use_model_cpu, parallel_threading, engine)
+
+        return await self.get_async_executor().run(convert)
+
+    async def aquantize_image(self, image, fill_color='2E3440', save_path=''):
+        """
+        Quantize a Pillow image without blocking the event loop
+
+        quantize_image runs in the pool of threads of get_async_executor,
+        like aconvert_image.
+
+        Parameters
+        ----------
+        image, fill_color, save_path
+            as in quantize_image
+
+        Returns
+        -------
+        pillow image
+            quantized image
+
+        Raises
+        ------
+        QueueFullError
+            if every slot is busy and the queue is full
+        """
+        return await self.get_async_executor().run(self.quantize_image, image, fill_color, save_path)
+
+    async def aconvert_video(self, _input, palette_name, _frames_per_batch=200, save_path='/tmp', streaming=True):
+        """
+        Convert a video without blocking the event loop
+
+        convert_video runs in the pool of threads of get_async_executor.
+        Cancelling the task stops the conversion before the next frame
+        and removes the partial output.
+
+        Parameters
+        ----------
+        _input, palette_name, _frames_per_batch, save_path, streaming
+            as in convert_video
+
+        Returns
+        -------
+        str
+            Path of the converted video
+
+        Raises
+        ------
+        QueueFullError
+            if every slot is busy and the queue is full
+        """
+        cancel_event = threading.Event()
+        try:
+            return await self.get_async_executor().run(
+                self.convert_video, _input, palette_name, _frames_per_batch, save_path, streaming, cancel_event)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise
+
+
+def convert_tile(source_name, target_name, shape, start, end, settings, is_rgba, engine):
+    """
+    Convert the rows [start, end) of an image stored in shared memory
+
+    Run by the workers of GoNord.converted_parallel: the tile is read from the
+    source block, together with the rows around it needed by the avg algorithm,
+    and the converted rows are written into the target block.
+
+    Parameters
+    ----------
+    source_name : str
+        shared memory block of the source image
+    target_name : str
+        shared memory block of the converted image
+    shape : tuple
+        shape of the image array
+    start : int
+        first row of the tile
+    end : int
+        last row (excluded) of the tile
+    settings : dict
+        GoNord attributes to use for the conversion
+    is_rgba : bool
+        true if the image has the alpha channel
+    engine : str
+        'python', 'numpy' or 'lut'
+    """
+    go_nord = GoNord()
+    for attribute, value in settings.items():
+        setattr(go_nord, attribute, value)
+
+    halo_top, halo_bottom = 0, 0
+    if go_nord.USE_AVG_COLOR:
+        halo_top = max(0, -go_nord.AVG_BOX_DATA['w'])
+        halo_bottom = max(0, go_nord.AVG_BOX_DATA['h'] - 1)
+    top = max(0, start - halo_top)
+    bottom = min(shape[0], end + halo_bottom)
+
+    source, source_pixels = parallel.attach_array(source_name, shape)
+    target, target_pixels = parallel.attach_array(target_name, shape)
+    try:
+        if engine == 'numpy':
+            pixels = go_nord.converted_array(is_rgba, np.array(source_pixels[top:bottom]))
+            target_pixels[start:end] = pixels[start - top:end - top]
+        elif engine == 'lut':
+            pixels = go_nord.converted_color_map(is_rgba, np.array(source_pixels[top:bottom]))
+            target_pixels[start:end] = pixels[start - top:end - top]
+        else:
+            tile = np.array(source_pixels[top:bottom])
+            image = Image.fromarray(tile).copy()
+            pixels = go_nord.load_pixel_image(image)
+            avg_pixels = go_nord.load_avg_pixel_image(tile) if go_nord.USE_AVG_COLOR else None
+            go_nord.converted_loop(is_rgba, pixels, pixels, shape[1], end - top, 0, start - top, avg_pixels)
+            target_pixels[start:end] = np.asarray(image)[start - top:end - top]
+    finally:
+        source_pixels = target_pixels = None
+        source.close()
+        target.close()
@@ -1,7 +1,21 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import numpy as np
 import pytest
 from PIL import Image
 
-from ImageGoNord import GoNord
+from ImageGoNord import GoNord, NordPaletteFile
+from ImageGoNord.utility.ConvertUtility import ConvertUtility
+import ImageGoNord.utility.palette_loader as pl
+import ImageGoNord.utility.model_tiling as model_tiling
+import ImageGoNord.utility.tracing as tracing
 
 
 @pytest.fixture
@@ -29,3 +43,569 @@ def test_resize_image(image: Image, go_nord: GoNord):
     resized_image = go_nord.resize_image(image)
     w, h = image.size
     assert resized_image.size == (round(w / 2), round(h / 2))
+
+
+@pytest.fixture
+def rgba_image():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (40, 30, 4), dtype=np.uint8), 'RGBA')
+
+
+def test_numpy_engine_matches_loop(image: Image, go_nord: GoNord):
+    image = go_nord.resize_image(image, size=(60, 50))
+    expected = go_nord.convert_image(image.copy())
+    converted = go_nord.convert_image(image.copy(), engine='numpy')
+    assert np.array_equal(np.array(converted), np.array(expected))
+
+
+def test_numpy_engine_matches_loop_rgba(rgba_image: Image, go_nord: GoNord):
+    expected = go_nord.convert_image(rgba_image.copy())
+    converted = go_nord.convert_image(rgba_image.copy(), engine='numpy')
+    assert np.array_equal(np.array(converted), np.array(expected))
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "lut"])
+def test_parallel_conversion_matches_loop(image: Image, go_nord: GoNord, engine, tmp_path):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    image = go_nord.resize_image(image, size=(60, 70))
+    go_nord.enable_avg_algorithm()
+    expected = go_nord.convert_image(image.copy())
+    converted = go_nord.convert_image(image.copy(), parallel_threading=True, engine=engine)
+    assert np.array_equal(np.array(converted), np.array(expected))
+
+
+def test_parallel_conversion_raises_on_failed_tile(image: Image, go_nord: GoNord):
+    go_nord.reset_palette()
+    go_nord.PALETTE_DATA['broken'] = ['not a color']
+    with pytest.raises(RuntimeError):
+        go_nord.convert_image(go_nord.resize_image(image, size=(60, 70)), parallel_threading=True)
+
+
+@pytest.mark.parametrize("box", [(-2, 2), (-1, 3), (-3, 5)])
+def test_numpy_engine_avg_matches_loop(rgba_image: Image, go_nord: GoNord, box):
+    go_nord.enable_avg_algorithm()
+    go_nord.set_avg_box_data(*box)
+    for source in (rgba_image, rgba_image.convert('RGB')):
+        expected = go_nord.convert_image(source.copy())
+        converted = go_nord.convert_image(source.copy(), engine='numpy')
+        assert np.array_equal(np.array(converted), np.array(expected))
+
+        # the precomputed avg colors of the loop are the ones of the area by area average
+        image = source.copy()
+        pixels = go_nord.load_pixel_image(image)
+        go_nord.converted_loop(source.mode == 'RGBA', pixels, go_nord.load_pixel_image(source.copy()), *image.size)
+        assert np.array_equal(np.array(image), np.array(expected))
+
+
+def test_images_and_videos_use_the_same_metric(image: Image, go_nord: GoNord, tmp_path):
+    go_nord.set_color_metric('euclidean')
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    pixels = np.array(go_nord.resize_image(image, size=(60, 50)))
+    converted = go_nord.convert_image(Image.fromarray(pixels), engine='numpy')
+    color_cube = pl.load_color_map(go_nord.get_palette_index(), cache_path=str(tmp_path))
+    assert np.array_equal(np.array(converted), ConvertUtility.convert_palette(color_cube, pixels))
+
+
+def configure_go_nord(variant):
+    go_nord = GoNord()
+    if variant == 1:
+        go_nord.reset_palette()
+        go_nord.add_file_to_palette(NordPaletteFile.FROST)
+    elif variant == 2:
+        go_nord.reset_palette()
+        for hex_color in ('#FF0000', '#00FF00', '#0000FF'):
+            go_nord.add_color_to_palette(hex_color)
+    elif variant == 3:
+        go_nord.enable_avg_algorithm()
+        go_nord.set_avg_box_data(-1, 3)
+    return go_nord
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_instances_convert_concurrently(image: Image, engine):
+    image = GoNord().resize_image(image, size=(40, 30))
+    expected = [np.array(configure_go_nord(variant).convert_image(image.copy(), engine=engine)) for variant in range(4)]
+    assert all(not np.array_equal(expected[0], other) for other in expected[1:])
+
+    def convert(variant):
+        return variant, np.array(configure_go_nord(variant).convert_image(image.copy(), engine=engine))
+
+    shared = configure_go_nord(3)
+
+    def convert_shared(_):
+        return 3, np.array(shared.convert_image(image.copy(), engine=engine))
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(convert, [variant for _ in range(8) for variant in range(4)]))
+        results += list(executor.map(convert_shared, range(8)))
+    for variant, converted in results:
+        assert np.array_equal(converted, expected[variant])
+    assert GoNord.PALETTE_DATA == {} and GoNord.AVG_BOX_DATA == {"w": -2, "h": 3}
+
+
+def test_copy_is_independent(go_nord: GoNord):
+    go_nord.get_palette_data()
+    other = go_nord.copy()
+    other.reset_palette()
+    other.add_color_to_palette('#FF0000')
+    other.set_avg_box_data(-1, 1)
+    assert list(other.get_palette_data()) == ['FF0000']
+    assert len(go_nord.get_palette_data()) == 16
+    assert go_nord.AVG_BOX_DATA == {"w": -2, "h": 2}
+
+
+def test_convert_batch(image: Image, go_nord: GoNord, tmp_path):
+    source = tmp_path / "in"
+    (source / "sub").mkdir(parents=True)
+    image = go_nord.resize_image(image, size=(40, 30))
+    image.save(source / "a.png")
+    image.convert('P').save(source / "sub" / "b.png")
+    (source / "notes.txt").write_text("not an image")
+
+    summary = go_nord.convert_batch([str(source)], str(tmp_path / "out"), workers=2)
+    assert [result['status'] for result in summary['files']] == ['converted', 'converted']
+    assert summary['pixels'] == 2 * 40 * 30
+    expected = go_nord.convert_image(image.copy(), engine='numpy')
+    assert np.array_equal(np.array(Image.open(tmp_path / "out" / "a.png")), np.array(expected))
+    assert (tmp_path / "out" / "sub" / "b.png").exists()
+
+    summary = go_nord.convert_batch([str(source / "**" / "*.png")], str(tmp_path / "out"))
+    assert [result['status'] for result in summary['files']] == ['skipped', 'skipped']
+    # glob matches keep only the images
+    summary = go_nord.convert_batch([str(source / "*")], str(tmp_path / "out"))
+    assert [result['path'] for result in summary['files']] == [str(source / "a.png")]
+
+    # other settings, other outputs
+    go_nord.enable_avg_algorithm()
+    summary = go_nord.convert_batch([str(source)], str(tmp_path / "out"))
+    assert [result['status'] for result in summary['files']] == ['converted', 'converted']
+    summary = go_nord.convert_batch([str(source)], str(tmp_path / "out"))
+    assert [result['status'] for result in summary['files']] == ['skipped', 'skipped']
+
+    summary = go_nord.convert_batch([str(source / "missing.png")], str(tmp_path / "out"))
+    assert summary['files'][0]['status'] == 'failed'
+
+    # files with the same name in different folders
+    image.save(source / "sub" / "a.png")
+    with pytest.raises(ValueError):
+        go_nord.convert_batch([str(source / "a.png"), str(source / "sub" / "a.png")], str(tmp_path / "out"))
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy", "lut"])
+def test_convert_image_strips_matches_whole_image(rgba_image: Image, go_nord: GoNord, tmp_path, engine):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    go_nord.enable_avg_algorithm()
+    go_nord.enable_gaussian_blur()
+    rgba_image = go_nord.resize_image(rgba_image, size=(40, 30))
+    rgba_image.save(tmp_path / "source.png")
+    rgba_image.save(tmp_path / "source.tif")
+
+    go_nord.convert_image_file(str(tmp_path / "source.png"), str(tmp_path / "whole.png"), engine)
+    # strips smaller than the halo of the avg box and of the blur
+    for strip_rows in (2, 7, 30):
+        go_nord.convert_image_strips(str(tmp_path / "source.png"), str(tmp_path / "strips.png"), engine, strip_rows)
+        assert (tmp_path / "strips.png").read_bytes() == (tmp_path / "whole.png").read_bytes()
+
+        go_nord.convert_image_strips(str(tmp_path / "source.tif"), str(tmp_path / "strips.tif"), engine, strip_rows)
+        assert np.array_equal(np.array(Image.open(tmp_path / "strips.tif")), np.array(Image.open(tmp_path / "whole.png")))
+    assert sorted(path.name for path in tmp_path.iterdir() if path.name.startswith('.')) == []
+
+
+@pytest.mark.parametrize("engine", ["numpy", "lut"])
+def test_convert_array(rgba_image: Image, go_nord: GoNord, tmp_path, engine):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    go_nord.enable_avg_algorithm()
+    expected = np.array(go_nord.convert_image(rgba_image.copy(), engine=engine))
+
+    pixels = np.array(rgba_image)
+    assert go_nord.convert_array(pixels, engine=engine) is pixels
+    assert np.array_equal(pixels, expected)
+
+    # strided and read-only memory mapped inputs, converted into a strided out array
+    source = np.lib.format.open_memmap(str(tmp_path / "pixels.npy"), mode='w+', dtype=np.uint8, shape=(80, 30, 4))
+    source[::2] = np.array(rgba_image)
+    source.flush()
+    source = np.load(str(tmp_path / "pixels.npy"), mmap_mode='r')[::2]
+    out = np.zeros((40, 60, 4), dtype=np.uint8)[:, ::2]
+    assert go_nord.convert_array(source, out, engine) is out
+    assert np.array_equal(out, expected)
+    assert np.array_equal(source, np.array(rgba_image))
+
+    rgb = np.array(rgba_image)[..., :3]
+    expected = np.array(go_nord.convert_image(rgba_image.convert('RGB'), engine=engine))
+    assert np.array_equal(go_nord.convert_array(rgb, engine=engine), expected)
+
+    with pytest.raises(ValueError):
+        go_nord.convert_array(source, engine=engine)
+    with pytest.raises(ValueError):
+        go_nord.convert_array(pixels, np.empty((40, 30, 3), dtype=np.uint8), engine)
+    with pytest.raises(ValueError):
+        go_nord.convert_array(pixels, engine='python')
+
+
+@pytest.mark.parametrize("avg", [False, True])
+def test_lut_engine_matches_numpy_and_video(rgba_image: Image, go_nord: GoNord, tmp_path, avg):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    if avg:
+        go_nord.enable_avg_algorithm()
+    for source in (rgba_image, rgba_image.convert('RGB')):
+        expected = go_nord.convert_image(source.copy(), engine='numpy')
+        converted = go_nord.convert_image(source.copy(), engine='lut')
+        assert np.array_equal(np.array(converted), np.array(expected))
+
+    if not avg:
+        # the same color map of the video frames
+        pixels = np.array(rgba_image.convert('RGB'))
+        color_cube = pl.load_color_map(go_nord.get_palette_index(), cache_path=str(tmp_path))
+        converted = go_nord.convert_image(Image.fromarray(pixels), engine='lut')
+        assert np.array_equal(np.array(converted), ConvertUtility.convert_palette(color_cube, pixels))
+
+
+def test_tracer_times_the_stages(image: Image, go_nord: GoNord, tmp_path):
+    tracer = tracing.StatsTracer()
+    go_nord.set_tracer(tracer)
+    go_nord.enable_gaussian_blur()
+    image = go_nord.resize_image(image, size=(40, 30))
+    go_nord.convert_image(image.copy(), save_path=str(tmp_path / "converted.png"), engine='numpy')
+    go_nord.convert_image(image.copy(), engine='numpy')
+    go_nord.quantize_image(image.copy())
+
+    report = tracer.report()
+    assert {'convert_image.get_palette_data', 'convert_image.decode', 'convert_image.exif', 'convert_image.convert',
+            'convert_image.blur', 'convert_image.save', 'quantize_image.quantize'} <= set(report)
+    assert report['convert_image.convert']['count'] == 2
+    assert report['convert_image.convert']['pixels'] == 2 * 40 * 30
+    assert report['convert_image.save']['count'] == 1
+    assert report['convert_image.convert']['p95'] >= report['convert_image.convert']['p50'] > 0
+
+    go_nord.set_tracer()
+    go_nord.convert_image(image.copy(), engine='numpy')
+    assert tracer.report()['convert_image.convert']['count'] == 2
+
+
+def test_async_conversions(image: Image, go_nord: GoNord):
+    image = go_nord.resize_image(image, size=(40, 30))
+    go_nord.set_async_limits(max_workers=2, max_queue=4)
+    copy = go_nord.copy()
+    copy.reset_palette()
+    copy.add_color_to_palette('#000000')
+
+    async def main():
+        return await asyncio.gather(
+            go_nord.aconvert_image(image.copy(), engine='numpy'),
+            copy.aconvert_image(image.copy(), engine='numpy'),
+            go_nord.aquantize_image(image.copy()))
+
+    converted, black, quantized = asyncio.run(main())
+    assert copy.get_async_executor() is go_nord.get_async_executor()
+    assert np.array_equal(np.array(converted), np.array(go_nord.convert_image(image.copy(), engine='numpy')))
+    assert not np.array(black).any()
+    assert np.array_equal(np.array(quantized), np.array(go_nord.quantize_image(image.copy())))
+
+
+def test_async_conversions_keep_the_loop_responsive(image: Image, go_nord: GoNord):
+    image = go_nord.resize_image(image, size=(800, 600))
+    go_nord.convert_image(image.copy(), engine='numpy')
+    delays = []
+
+    async def main():
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                delays.append(time.perf_counter() - start - 0.005)
+
+        task = asyncio.ensure_future(ticker())
+        converted = await asyncio.gather(*(go_nord.aconvert_image(image.copy()) for _ in range(3)))
+        palette = await go_nord.aconvert_image(image.convert('P'))
+        done.set()
+        await task
+        return converted, palette
+
+    converted, palette = asyncio.run(main())
+    expected = np.array(go_nord.convert_image(image.copy(), engine='numpy'))
+    assert all(np.array_equal(np.array(result), expected) for result in converted)
+    assert palette.mode == 'RGB'
+    # the default numpy engine releases the GIL, the loop keeps ticking
+    assert len(delays) > 3
+    assert max(delays) < 0.1
+
+
+def test_async_executor_is_shared(go_nord: GoNord):
+    other = GoNord()
+    assert other.get_async_executor() is go_nord.get_async_executor()
+    go_nord.set_async_limits(max_workers=3, max_queue=2)
+    executor = other.get_async_executor()
+    assert executor.max_workers == 3 and executor.max_queue == 2
+    assert go_nord.copy().get_async_executor() is executor
+    go_nord.set_async_limits()
+
+
+def test_aconvert_video_cancellation(go_nord: GoNord):
+    started = threading.Event()
+
+    def convert_video(_input, palette_name, _frames_per_batch, save_path, streaming, cancel_event):
+        started.set()
+        # a conversion checking the event between the frames
+        assert cancel_event.wait(5)
+        raise CancelledError()
+
+    go_nord.convert_video = convert_video
+
+    async def main():
+        task = asyncio.ensure_future(go_nord.aconvert_video('video.mp4', 'nord'))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # the slot is free again once the conversion stopped
+        assert await go_nord.get_async_executor().run(sum, [1, 2]) == 3
+
+    asyncio.run(main())
+
+
+# ffprobe and ffmpeg stand-ins: a "video" is a json header line followed by raw rgb24 frames,
+# the encoder saves the piped frames and its arguments
+FFMPEG_STUB = """
+import json, os, sys
+
+args = sys.argv[1:]
+if os.path.basename(sys.argv[0]) == 'ffprobe':
+    with open(args[-1], 'rb') as video:
+        header = json.loads(video.readline())
+    streams = [{'codec_type': 'video', 'width': header['width'], 'height': header['height'], 'avg_frame_rate': '10/1'}]
+    if header['audio']:
+        streams.append({'codec_type': 'audio'})
+    print(json.dumps({'streams': streams, 'format': {'duration': str(header['frames'] / 10)}}))
+elif args[-1] == 'pipe:':
+    with open(args[args.index('-i') + 1], 'rb') as video:
+        video.readline()
+        sys.stdout.buffer.write(video.read())
+else:
+    if os.environ.get('FFMPEG_STUB_FAIL'):
+        sys.stderr.write('Unknown encoder libx264')
+        sys.exit(1)
+    output = args[-2]
+    with open(output, 'wb') as converted:
+        converted.write(sys.stdin.buffer.read())
+    with open(output + '.args', 'w') as arguments:
+        json.dump(args, arguments)
+"""
+
+
+@pytest.fixture
+def ffmpeg_stub(tmp_path, monkeypatch):
+    folder = tmp_path / "bin"
+    folder.mkdir()
+    for name in ("ffmpeg", "ffprobe"):
+        (folder / name).write_text("#!" + sys.executable + "\n" + FFMPEG_STUB)
+        (folder / name).chmod(0o755)
+    monkeypatch.setenv("PATH", str(folder) + os.pathsep + os.environ["PATH"])
+
+    def make_video(frames, audio=False, size=(32, 24)):
+        video = tmp_path / ("video-audio.raw" if audio else "video.raw")
+        with open(video, 'wb') as file:
+            file.write((json.dumps({'width': size[0], 'height': size[1], 'frames': len(frames), 'audio': audio}) + "\n").encode())
+            for frame in frames:
+                file.write(frame.tobytes())
+        return str(video)
+
+    return make_video
+
+
+@pytest.mark.parametrize("audio", [False, True])
+def test_stream_video_pipes_every_frame(go_nord: GoNord, tmp_path, ffmpeg_stub, audio):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    frames = np.random.default_rng(0).integers(0, 256, (5, 24, 32, 3), dtype=np.uint8)
+    video = ffmpeg_stub(frames, audio)
+
+    output = go_nord.convert_video(video, 'nord', save_path=str(tmp_path))
+    cube = pl.load_color_map(go_nord.get_palette_index(), cache_path=str(tmp_path))
+    expected = np.stack([ConvertUtility.convert_palette(cube, frame) for frame in frames])
+    converted = np.frombuffer(open(output, 'rb').read(), dtype=np.uint8).reshape(frames.shape)
+    assert np.array_equal(converted, expected)
+
+    with open(output + '.args') as arguments:
+        arguments = json.load(arguments)
+    assert arguments[arguments.index('-s') + 1] == '32x24'
+    # the original audio is muxed only if there is one
+    assert ('1:a' in arguments) == audio
+    assert (video in arguments) == audio
+
+
+def test_stream_video_reports_encoder_errors(go_nord: GoNord, tmp_path, ffmpeg_stub, monkeypatch):
+    go_nord.set_color_map_cache_path(str(tmp_path))
+    monkeypatch.setenv("FFMPEG_STUB_FAIL", "1")
+    # more frames than a pipe buffers, the encoder exits before reading them
+    frames = np.zeros((40, 240, 320, 3), dtype=np.uint8)
+    video = ffmpeg_stub(frames, size=(320, 240))
+
+    with pytest.raises(RuntimeError, match="Unknown encoder libx264"):
+        go_nord.convert_video(video, 'nord', save_path=str(tmp_path))
+
+
+def test_unknown_color_metric(go_nord: GoNord):
+    with pytest.raises(ValueError):
+        go_nord.set_color_metric('unknown')
+
+
+@pytest.fixture
+def palette_net_path(tmp_path, monkeypatch):
+    torch = pytest.importorskip("torch")
+    # random weights, not the published ones
+    monkeypatch.setattr(GoNord, "PALETTE_NET_CHECKSUMS", {})
+    from ImageGoNord.utility.model import FeatureEncoder, RecoloringDecoder
+    torch.manual_seed(0)
+    torch.save(FeatureEncoder().state_dict(), str(tmp_path / "FE.state_dict.pt"))
+    torch.save(RecoloringDecoder().state_dict(), str(tmp_path / "RD.state_dict.pt"))
+    return str(tmp_path)
+
+
+def test_palette_net_is_loaded_once(image: Image, go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    go_nord.warmup(use_model_cpu=True)
+    FE, RD = go_nord.load_palette_net(use_model_cpu=True)
+    assert not FE.training and not RD.training
+
+    other = GoNord()
+    other.PALETTE_NET_PATH = palette_net_path
+    assert other.load_palette_net(use_model_cpu=True)[0] is FE
+
+    converted = go_nord.convert_image_by_model(go_nord.resize_image(image, size=(64, 48)), use_model_cpu=True)
+    assert converted.size == (64, 48)
+
+
+def test_palette_net_checksum_mismatch(go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    go_nord.set_palette_net_mirror(go_nord.PALETTE_NET_REPO_FOLDER, {"FE.state_dict.pt": "0" * 64})
+    with pytest.raises(ValueError):
+        go_nord.load_palette_net(use_model_cpu=True)
+
+
+def test_convert_images_by_model_batches(image: Image, go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    images = [
+        go_nord.resize_image(image, size=(64, 48)),
+        go_nord.resize_image(image, size=(48, 64)),
+        go_nord.resize_image(image, size=(70, 50)),
+    ]
+    tracer = tracing.StatsTracer()
+    go_nord.set_tracer(tracer)
+    converted = go_nord.convert_images_by_model(images, use_model_cpu=True, batch_size=2, num_threads=1)
+    assert [img.size for img in converted] == [(64, 48), (48, 64), (70, 50)]
+    report = tracer.report()
+    # one batch for every model input size
+    assert report['convert_image_by_model.predict']['count'] == 3
+    assert report['convert_image_by_model.postprocess']['pixels'] == 2 * 64 * 48 + 70 * 50
+    for source, batched in zip(images, converted):
+        single = go_nord.convert_image_by_model(source, use_model_cpu=True)
+        assert np.abs(np.array(single, dtype=int) - np.array(batched, dtype=int)).max() <= 1
+
+
+def test_convert_image_by_model_tiles(image: Image, go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    source = go_nord.resize_image(image, size=(150, 100))
+    whole = go_nord.convert_image_by_model(source, use_model_cpu=True)
+
+    go_nord.set_model_memory_limit(64 * 64 * model_tiling.BYTES_PER_PIXEL)
+    tiled = go_nord.convert_image_by_model(source, use_model_cpu=True)
+    assert tiled.size == whole.size == (150, 100)
+    # the instance norms see the statistics of every tile, so the blended
+    # tiles are only close to the whole image prediction
+    mse = np.mean((np.array(tiled, dtype=float) - np.array(whole, dtype=float)) ** 2)
+    assert 10 * np.log10(255 ** 2 / mse) > 18
+
+
+class PointwiseBackend:
+    """Model backend predicting every pixel from itself only"""
+
+    def predict(self, images, palette):
+        return np.tanh(2 * images[..., 1:] + images[..., :1])
+
+
+def test_convert_image_by_model_tiles_are_blended_in_place(image: Image, go_nord: GoNord, monkeypatch):
+    monkeypatch.setattr(go_nord, "load_model_backend", lambda *args, **kwargs: PointwiseBackend())
+    source = go_nord.resize_image(image, size=(150, 100))
+    whole = go_nord.convert_image_by_model(source, use_model_cpu=True)
+
+    go_nord.set_model_memory_limit(64 * 64 * model_tiling.BYTES_PER_PIXEL)
+    tiled = go_nord.convert_image_by_model(source, use_model_cpu=True)
+    # blending weights sum to one, every pixel gets its own prediction back
+    difference = np.abs(np.array(tiled, dtype=int) - np.array(whole, dtype=int))
+    assert difference.max() <= 1
+
+
+def test_convert_image_by_model_low_resolution_chroma(image: Image, go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    source = go_nord.resize_image(image, size=(300, 200))
+    assert go_nord.get_model_image(source, max_side=96).size == (96, 64)
+    assert go_nord.get_model_image(source, max_side=512) is source
+
+    converted = go_nord.convert_image_by_model(source, use_model_cpu=True, max_side=96)
+    assert converted.size == (300, 200)
+
+
+def test_onnx_backend_matches_torch(image: Image, go_nord: GoNord, palette_net_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnxscript")
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    source = go_nord.resize_image(image, size=(64, 48))
+    expected = go_nord.convert_image_by_model(source, use_model_cpu=True)
+
+    go_nord.set_model_backend('onnx')
+    converted = go_nord.convert_image_by_model(source, use_model_cpu=True)
+    difference = np.abs(np.array(converted, dtype=int) - np.array(expected, dtype=int))
+    assert difference.max() <= 1
+
+
+def test_exported_graph_follows_the_weights(image: Image, go_nord: GoNord, palette_net_path):
+    import torch
+    from ImageGoNord.utility.model import FeatureEncoder
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    go_nord.set_model_backend('torchscript')
+    source = go_nord.resize_image(image, size=(64, 48))
+    before = go_nord.convert_image_by_model(source, use_model_cpu=True)
+
+    torch.manual_seed(1)
+    torch.save(FeatureEncoder().state_dict(), os.path.join(palette_net_path, "FE.state_dict.pt"))
+    after = go_nord.convert_image_by_model(source, use_model_cpu=True)
+    go_nord.set_model_backend('torch')
+    expected = go_nord.convert_image_by_model(source, use_model_cpu=True)
+    assert np.abs(np.array(after, dtype=int) - np.array(expected, dtype=int)).max() <= 1
+    assert np.abs(np.array(after, dtype=int) - np.array(before, dtype=int)).max() > 1
+
+
+def test_fast_cpu_model_quality(image: Image, go_nord: GoNord, palette_net_path):
+    go_nord.PALETTE_NET_PATH = palette_net_path
+    go_nord.set_model_threads(threads=1)
+    report = go_nord.compare_fast_cpu_model([go_nord.resize_image(image, size=(96, 64))])
+    assert not go_nord.USE_FAST_CPU_MODEL
+    assert report[0]['psnr'] > 20
+    assert report[0]['delta_e'] < 5
+
+
+def test_import_is_light():
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import ImageGoNord\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(elapsed, ' '.join(m for m in ('torch', 'ffmpeg', 'requests', 'onnxruntime') if m in sys.modules))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.split()
+    assert output[1:] == []
+    assert float(output[0]) < 1.0
+
+
+def test_model_output_to_image_by_strips(go_nord: GoNord):
+    pixels = np.random.default_rng(0).integers(0, 256, (50, 40, 3), dtype=np.uint8)
+    source = Image.fromarray(pixels)
+    chroma = go_nord.pixels_to_model_input(pixels)[:, :, 1:]
+    assert chroma.dtype == np.float32
+    go_nord.STRIP_PIXELS = 40 * 7
+    converted = np.array(go_nord.model_output_to_image(source, chroma * 127 / 128), dtype=int)
+    # the source colors come back, but for the float32 rounding
+    assert np.abs(converted - pixels).max() <= 1
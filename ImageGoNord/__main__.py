@@ -0,0 +1,5 @@
+import sys
+
+from ImageGoNord.cli import main
+
+sys.exit(main())
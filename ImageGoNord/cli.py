@@ -0,0 +1,116 @@
+"""Command line interface.
+
+Convert image files, directories and glob patterns to a palette:
+
+    python -m ImageGoNord photos/ 'scans/**/*.png' -o converted/
+
+or, once installed, with the image-go-nord command.
+"""
+import argparse
+import os
+import sys
+
+from ImageGoNord.GoNord import GoNord, NordPaletteFile
+from ImageGoNord.utility.color_metrics import COLOR_METRICS
+import ImageGoNord.utility.tracing as tracing
+
+NORD_PALETTES = {
+    'aurora': NordPaletteFile.AURORA,
+    'frost': NordPaletteFile.FROST,
+    'polar-night': NordPaletteFile.POLAR_NIGHT,
+    'snow-storm': NordPaletteFile.SNOW_STORM,
+}
+
+
+def get_parser():
+    """Get the parser of the command line arguments"""
+    parser = argparse.ArgumentParser(
+        prog='image-go-nord',
+        description='Convert images to the Nord palette, or to any palette.')
+    parser.add_argument('paths', nargs='+', help='image files, directories or glob patterns')
+    parser.add_argument('-o', '--out-dir', required=True, help='folder of the converted images')
+    parser.add_argument('-p', '--palette', action='append', default=[],
+                        help='palette file (.txt of hex colors) or Nord palette: ' + ', '.join(NORD_PALETTES)
+                        + '; repeat to combine palettes, the whole Nord palette by default')
+    parser.add_argument('-c', '--color', action='append', default=[], help='hex color to add to the palette, e.g. #FF0000')
+    parser.add_argument('--avg', action='store_true', help='replace every pixel by the avg color of its area')
+    parser.add_argument('--blur', action='store_true', help='blur the converted images')
+    parser.add_argument('--metric', choices=COLOR_METRICS, help='color distance used to find the nearest palette color')
+    parser.add_argument('--engine', choices=GoNord.CONVERSION_ENGINES, default='numpy',
+                        help='conversion engine, lut uses the cached color map of the palette')
+    parser.add_argument('--model', action='store_true', help='convert with the PaletteNet model')
+    parser.add_argument('--cpu', action='store_true', help='run the model on the cpu')
+    parser.add_argument('--streaming', action='store_true',
+                        help='convert the images strip by strip with bounded memory, for very big images')
+    parser.add_argument('-j', '--workers', type=int, help='number of worker threads')
+    parser.add_argument('-f', '--force', action='store_true', help='convert also the images whose output is up to date')
+    parser.add_argument('-q', '--quiet', action='store_true', help='print only the summary and the errors')
+    parser.add_argument('--profile', action='store_true', help='print the p50 and p95 time of every conversion stage')
+    return parser
+
+
+def configure(args):
+    """Get a GoNord instance configured by the command line arguments"""
+    go_nord = GoNord()
+    if args.palette or args.color:
+        go_nord.reset_palette()
+        go_nord.set_palette_lookup_path('')
+        for palette in args.palette:
+            if palette.lower() in NORD_PALETTES:
+                palette = go_nord.DEFAULT_PALETTE_PATH + NORD_PALETTES[palette.lower()]
+            go_nord.add_file_to_palette(os.path.abspath(palette))
+        for color in args.color:
+            go_nord.add_color_to_palette(color if color.startswith('#') else '#' + color)
+    if args.avg:
+        go_nord.enable_avg_algorithm()
+    if args.blur:
+        go_nord.enable_gaussian_blur()
+    if args.metric:
+        go_nord.set_color_metric(args.metric)
+    return go_nord
+
+
+def main(argv=None):
+    """Run the command line interface.
+
+    Parameters
+    ----------
+    argv: list, optional
+      command line arguments, sys.argv by default
+
+    Returns
+    -------
+    int
+      exit status: 1 if an image failed or no image was found
+    """
+    args = get_parser().parse_args(argv)
+    go_nord = configure(args)
+    if args.profile:
+        go_nord.set_tracer(tracing.StatsTracer())
+
+    def report(result):
+        if result['status'] == 'failed':
+            print('failed     {}: {}'.format(result['path'], result['error']), file=sys.stderr)
+        elif not args.quiet:
+            print('{:<10} {} ({:.3f} s)'.format(result['status'], result['path'], result['seconds']))
+
+    try:
+        summary = go_nord.convert_batch(
+            args.paths, args.out_dir, workers=args.workers, engine=args.engine,
+            use_model=args.model, use_model_cpu=args.cpu, force=args.force, callback=report,
+            streaming=args.streaming)
+    except (ValueError, ImportError, OSError, RuntimeError) as error:
+        # e.g. two images written to the same output, or a model that cannot
+        # be loaded: torch missing, weights not matching their checksum
+        print(error, file=sys.stderr)
+        return 1
+
+    statuses = [result['status'] for result in summary['files']]
+    print('{} converted, {} skipped, {} failed: {:.1f} MP in {:.2f} s ({:.2f} MP/s)'.format(
+        statuses.count('converted'), statuses.count('skipped'), statuses.count('failed'),
+        summary['pixels'] / 1e6, summary['seconds'], summary['megapixels_per_second']))
+    if args.profile:
+        print(go_nord.TRACER.format_report())
+    if not statuses:
+        print('no image found', file=sys.stderr)
+    return 1 if not statuses or 'failed' in statuses else 0
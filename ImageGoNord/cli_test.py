@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+
+from ImageGoNord import GoNord
+from ImageGoNord.cli import main
+
+
+def test_main(tmp_path, capsys):
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (30, 40, 3), dtype=np.uint8))
+    image.save(tmp_path / "image.png")
+    out_dir = tmp_path / "out"
+
+    assert main([str(tmp_path / "*.png"), "-o", str(out_dir), "-p", "aurora", "-c", "000000"]) == 0
+    converted = np.array(Image.open(out_dir / "image.png")).reshape(-1, 3)
+    palette = {tuple(color) for color in converted}
+    assert (0, 0, 0) in palette and (191, 97, 106) in palette
+    assert palette <= {(0, 0, 0), (191, 97, 106), (208, 135, 112), (235, 203, 139), (163, 190, 140), (180, 142, 173)}
+    assert "1 converted" in capsys.readouterr().out
+
+    assert main([str(tmp_path / "image.png"), "-o", str(out_dir), "-q", "-p", "aurora", "-c", "000000"]) == 0
+    assert "1 skipped" in capsys.readouterr().out
+    # another palette
+    assert main([str(tmp_path / "image.png"), "-o", str(out_dir), "-q"]) == 0
+    assert "1 converted" in capsys.readouterr().out
+    assert main([str(tmp_path / "image.png"), "-o", str(out_dir), "-q", "-f", "--profile"]) == 0
+    assert "convert_image.convert" in capsys.readouterr().out
+    assert main([str(tmp_path / "image.png"), "-o", str(out_dir), "-q", "-f", "--streaming",
+                 "-p", "aurora", "-c", "000000"]) == 0
+    assert np.array_equal(np.array(Image.open(out_dir / "image.png")).reshape(-1, 3), converted)
+    assert main([str(tmp_path / "missing"), "-o", str(out_dir)]) == 1
+    (tmp_path / "other").mkdir()
+    image.save(tmp_path / "other" / "image.png")
+    assert main([str(tmp_path / "image.png"), str(tmp_path / "other" / "image.png"), "-o", str(out_dir)]) == 1
+    assert "same output" in capsys.readouterr().err
+
+
+def test_main_model_not_loaded(tmp_path, capsys, monkeypatch):
+    Image.new("RGB", (8, 8)).save(tmp_path / "image.png")
+
+    def warmup(self, use_model_cpu=False):
+        raise ImportError("No module named 'torch'")
+
+    monkeypatch.setattr(GoNord, "warmup", warmup)
+    assert main([str(tmp_path / "image.png"), "-o", str(tmp_path / "out"), "--model"]) == 1
+    assert "torch" in capsys.readouterr().err
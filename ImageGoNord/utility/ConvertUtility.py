@@ -12,6 +12,24 @@ class ConvertUtility:
 
   get_avg_color(pixels, row, col, w, h)
     Get the avg color of a given area and return it as tuple containing rgb
+
+  get_avg_color_array(pixels, w, h)
+    Get the avg color of the area around every pixel of an array
+
+  pack_colors(colors)
+    Pack the rgb channels of colors into 24 bit integers
+
+  unique_colors(colors)
+    Find the distinct rgb colors of an array of colors
+
+  convert_pixels(palette_index, pixels, colors, transparency_tolerance, out)
+    Replace every pixel of an array with its nearest palette color
+
+  lookup_pixels(color_cube, pixels, colors, transparency_tolerance, out)
+    Replace every pixel of an array with its color in a color map
+
+  convert_palette(color_cube, image)
+    Convert frame color palette
   """
 
   def color_difference(color1, color2):
@@ -57,6 +75,9 @@ class ConvertUtility:
     average_sum = []
     for k in range(w, h):
       for l in range(w, h):
+        # negative indexes would wrap around the pixel map
+        if row+k < 0 or col+l < 0:
+          continue
         try:
           average_sum.append(pixels[row+k, col+l])
         except:
@@ -69,7 +90,7 @@ class ConvertUtility:
     r = 0
     g = 0
     b = 0
-    a = 255
+    a = 0
     for x in average_sum:
       r += x[0]
       g += x[1]
@@ -78,11 +99,242 @@ class ConvertUtility:
         a += x[3]
 
     avg_color = (int(r/size), int(g/size), int(b/size))
-    if (a != 255):
+    if (len(pixels[row, col]) > 3):
       avg_color = avg_color + (int(a/size), )
 
     return avg_color
-  
+
+  def box_sum(values, axis, start, stop):
+    """
+    Sum the values inside a sliding window along an axis
+
+    The window of the index i covers [i+start, i+stop), indexes outside
+    the array are dropped.
+
+    Parameters
+    ----------
+    values : ndarray
+      The values to sum
+    axis : int
+      Axis of the sliding window
+    start : int
+      First offset of the window
+    stop : int
+      Last offset (excluded) of the window
+
+    Returns
+    -------
+    tuple
+      the sums (int64) and the number of summed values for every index of the axis
+    """
+    size = values.shape[axis]
+    cumulative_shape = list(values.shape)
+    cumulative_shape[axis] = size + 1
+    cumulative = np.zeros(cumulative_shape, dtype=np.int64)
+    # cumulative[i] is the sum of the first i values
+    tail = [slice(None)] * values.ndim
+    tail[axis] = slice(1, None)
+    np.cumsum(values, axis=axis, dtype=np.int64, out=cumulative[tuple(tail)])
+
+    index = np.arange(size)
+    window_start = np.clip(index + start, 0, size)
+    window_stop = np.clip(index + stop, 0, size)
+    sums = np.take(cumulative, window_stop, axis=axis) - np.take(cumulative, window_start, axis=axis)
+    return sums, np.maximum(window_stop - window_start, 0)
+
+  def get_avg_color_array(pixels, w=-2, h=3):
+    """
+    Get the avg color of the area around every pixel of an array
+
+    Vectorized version of get_avg_color working as a separable box filter:
+    the area of each pixel covers the offsets range(w, h) on both axes,
+    neighbours outside the image are dropped and the divisor shrinks.
+
+    Parameters
+    ----------
+    pixels : ndarray
+      The source image as uint8 array, shape (h, w, channels)
+    w : int
+      Box's wdith
+    h : int
+      Box's height
+
+    Returns
+    -------
+    ndarray
+      the avg colors (alpha included), same shape of pixels
+    """
+    avg_colors = np.empty(pixels.shape, dtype=np.uint8)
+    for channel in range(pixels.shape[2]):
+      sums, rows_count = ConvertUtility.box_sum(pixels[:, :, channel], 0, w, h)
+      sums, cols_count = ConvertUtility.box_sum(sums, 1, w, h)
+      size = np.maximum(rows_count[:, None] * cols_count[None, :], 1)
+      avg_colors[:, :, channel] = sums // size
+
+    return avg_colors
+
+  def pack_colors(colors):
+    """
+    Pack the rgb channels of colors into 24 bit integers
+
+    The packed value of a color is its index in the flattened color cube.
+
+    Parameters
+    ----------
+    colors : ndarray
+      uint8 colors, shape (..., 3) or more channels (only rgb is used)
+
+    Returns
+    -------
+    ndarray
+      the uint32 packed colors, shape (...)
+    """
+    packed = colors[..., 0].astype(np.uint32)
+    packed <<= 8
+    packed |= colors[..., 1]
+    packed <<= 8
+    packed |= colors[..., 2]
+    return packed
+
+  def unique_colors(colors):
+    """
+    Find the distinct rgb colors of an array of colors
+
+    Every color is packed into a 24 bit integer, so the distinct colors
+    are found with a single np.unique over integers.
+
+    Parameters
+    ----------
+    colors : ndarray
+      uint8 colors, shape (..., 3) or more channels (only rgb is used)
+
+    Returns
+    -------
+    tuple
+      the distinct colors, shape (k, 3), and for every given color
+      the index of its distinct color, shape (m,)
+    """
+    packed = ConvertUtility.pack_colors(colors.reshape(-1, colors.shape[-1]))
+    packed, inverse = np.unique(packed, return_inverse=True)
+
+    unique = np.empty((len(packed), 3), dtype=np.uint8)
+    unique[:, 0] = packed >> 16
+    unique[:, 1] = (packed >> 8) & 0xFF
+    unique[:, 2] = packed & 0xFF
+    return unique, inverse.reshape(-1)
+
+  def convert_pixels(palette_index, pixels, colors=None, transparency_tolerance=None, out=None):
+    """
+    Replace every pixel of an array with its nearest palette color
+
+    The array is modified in place, like converted_loop does with the pixel map,
+    unless an output array is given.
+    For rgba arrays the alpha of the matched color is kept and pixels
+    below the transparency tolerance are left untouched.
+
+    Parameters
+    ----------
+    palette_index : PaletteIndex
+      Index of the palette colors
+    pixels : ndarray
+      The image as uint8 array, shape (h, w, 3) or (h, w, 4)
+    colors : ndarray, optional
+      Colors used for the matching (e.g. avg colors), same shape of pixels.
+      By default the pixels themselves
+    transparency_tolerance : int, optional
+      Alpha value under which a pixel is not converted
+    out : ndarray, optional
+      Array receiving the converted pixels, same shape of pixels.
+      By default the pixels themselves
+
+    Returns
+    -------
+    ndarray
+      the converted pixels
+    """
+    if colors is None:
+      colors = pixels
+    if out is None:
+      out = pixels
+
+    channels = pixels.shape[-1]
+    if channels == 4 and transparency_tolerance is not None:
+      mask = pixels[..., 3] >= transparency_tolerance
+      selected = colors[mask]
+      if out is not pixels:
+        np.copyto(out, pixels, where=~mask[..., None])
+    else:
+      mask = None
+      selected = colors.reshape(-1, channels)
+
+    converted = np.empty((len(selected), channels), dtype=np.uint8)
+    # every distinct color is matched once
+    unique, inverse = ConvertUtility.unique_colors(selected)
+    converted[:, :3] = palette_index.palette[palette_index.query(unique)][inverse]
+    if channels == 4:
+      converted[:, 3] = selected[:, 3]
+
+    if mask is None:
+      out[...] = converted.reshape(out.shape)
+    else:
+      out[mask] = converted
+
+    return out
+
+  def lookup_pixels(color_cube, pixels, colors=None, transparency_tolerance=None, out=None):
+    """
+    Replace every pixel of an array with its color in a color map
+
+    Each color is a single lookup in the flattened cube, so the output is the
+    one of convert_pixels with the palette index the cube was built from.
+    The array is modified in place unless an output array is given,
+    rgba arrays are handled like convert_pixels.
+
+    Parameters
+    ----------
+    color_cube : ndarray
+      Color map of the RGB color space, shape (256, 256, 256, 3)
+    pixels : ndarray
+      The image as uint8 array, shape (h, w, 3) or (h, w, 4)
+    colors : ndarray, optional
+      Colors used for the lookup (e.g. avg colors), same shape of pixels.
+      By default the pixels themselves
+    transparency_tolerance : int, optional
+      Alpha value under which a pixel is not converted
+    out : ndarray, optional
+      Array receiving the converted pixels, same shape of pixels.
+      By default the pixels themselves
+
+    Returns
+    -------
+    ndarray
+      the converted pixels
+    """
+    if colors is None:
+      colors = pixels
+    if out is None:
+      out = pixels
+
+    table = color_cube.reshape(-1, 3)
+    channels = pixels.shape[-1]
+    if channels == 4 and transparency_tolerance is not None:
+      mask = pixels[..., 3] >= transparency_tolerance
+      selected = colors[mask]
+      converted = np.empty_like(selected)
+      converted[:, :3] = np.take(table, ConvertUtility.pack_colors(selected), axis=0)
+      converted[:, 3] = selected[:, 3]
+      if out is not pixels:
+        np.copyto(out, pixels, where=~mask[..., None])
+      out[mask] = converted
+    else:
+      packed = ConvertUtility.pack_colors(colors)
+      # the packed colors are in the cube, clip skips the bounds check and the buffering of out
+      np.take(table, packed, axis=0, out=out[..., :3], mode='clip')
+      if channels == 4:
+        out[..., 3] = colors[..., 3]
+
+    return out
+
   def convert_palette(color_cube, image):
     """Convert frame color palette
 
@@ -100,9 +352,8 @@ class ConvertUtility:
     """
 
     shape = image.shape[0:2]
-    indices = image.reshape(-1,3)
     # Pass image colors and retrieve corresponding palette color
-    new_image = color_cube[indices[:,0],indices[:,1],indices[:,2]]
+    indices = ConvertUtility.pack_colors(image).reshape(-1)
+    new_image = np.take(color_cube.reshape(-1, 3), indices, axis=0)
 
     return new_image.reshape(shape[0],shape[1],3).astype(np.uint8)
-
@@ -0,0 +1,10 @@
+import numpy as np
+
+from ImageGoNord.utility.ConvertUtility import ConvertUtility
+
+
+def test_unique_colors():
+    colors = np.random.default_rng(0).integers(0, 4, (50, 40, 4), dtype=np.uint8) * 85
+    unique, inverse = ConvertUtility.unique_colors(colors)
+    assert len(unique) == len(np.unique(colors[..., :3].reshape(-1, 3), axis=0))
+    assert np.array_equal(unique[inverse], colors[..., :3].reshape(-1, 3))
@@ -0,0 +1,202 @@
+"""Async executor module.
+
+Run the blocking conversions of GoNord from asyncio: the work runs in a pool
+of threads while the event loop only awaits it. A concurrency limit bounds
+the conversions running at once and a queue depth bounds the ones waiting
+for a slot, so a busy service rejects new requests instead of piling them up.
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+_shared_executor = None
+_shared_lock = threading.Lock()
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the conversions waiting for a slot reach the queue depth"""
+
+
+class AsyncExecutor:
+    """
+    A class used to run blocking functions from asyncio with bounded concurrency
+
+    Every event loop using the executor gets its own slots: at most
+    max_workers functions of a loop run at once, at most max_queue calls
+    wait for a slot and the next ones raise QueueFullError.
+    A cancelled call that is still waiting leaves the queue. A call that is
+    already running cannot be interrupted: its slot is released only when
+    the function returns, so the limit holds also under cancellation.
+
+    Methods
+    -------
+    run(function, *args, **kwargs)
+        Run a function in the pool of threads and await its result
+
+    stats()
+        Get the number of running and waiting calls of the current event loop
+
+    shutdown(wait=True)
+        Stop the pool of threads
+    """
+
+    def __init__(self, max_workers, max_queue=None):
+        """
+        Constructor: the pool of threads is started on first use
+
+        Parameters
+        ----------
+        max_workers : int
+            number of functions running at once
+        max_queue : int, optional
+            number of calls waiting for a slot, unbounded if None
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.executor = None
+        self.lock = threading.Lock()
+        self.loops = weakref.WeakKeyDictionary()
+
+    def get_executor(self):
+        """Get the pool of threads, starting it if needed"""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ImageGoNord')
+            return self.executor
+
+    def get_slots(self, loop):
+        """Get the slots of an event loop, created inside the loop"""
+        slots = self.loops.get(loop)
+        if slots is None:
+            slots = {'semaphore': asyncio.Semaphore(self.max_workers), 'running': 0, 'waiting': 0}
+            self.loops[loop] = slots
+        return slots
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Run a function in the pool of threads and await its result
+
+        Parameters
+        ----------
+        function : callable
+            the blocking function
+        args, kwargs
+            arguments of the function
+
+        Returns
+        -------
+        object
+            the value returned by the function
+
+        Raises
+        ------
+        QueueFullError
+            if every slot is busy and max_queue calls are already waiting
+        """
+        loop = asyncio.get_running_loop()
+        slots = self.get_slots(loop)
+        semaphore = slots['semaphore']
+        if self.max_queue is not None and semaphore.locked() and slots['waiting'] >= self.max_queue:
+            raise QueueFullError("{} conversions running and {} waiting".format(slots['running'], slots['waiting']))
+
+        slots['waiting'] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            slots['waiting'] -= 1
+        slots['running'] += 1
+
+        def release(future):
+            def release_slot():
+                slots['running'] -= 1
+                semaphore.release()
+            try:
+                loop.call_soon_threadsafe(release_slot)
+            except RuntimeError:
+                # the loop is closed, nobody waits for its slots
+                pass
+
+        try:
+            future = self.get_executor().submit(functools.partial(function, *args, **kwargs))
+        except BaseException:
+            slots['running'] -= 1
+            semaphore.release()
+            raise
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        """
+        Get the number of running and waiting calls of the current event loop
+
+        Returns
+        -------
+        dict
+            'running' and 'waiting' calls
+        """
+        slots = self.get_slots(asyncio.get_running_loop())
+        return {'running': slots['running'], 'waiting': slots['waiting']}
+
+    def shutdown(self, wait=True):
+        """
+        Stop the pool of threads, a new one is started by the next call
+
+        Parameters
+        ----------
+        wait : bool, optional
+            true to wait for the running functions
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+def get_shared_executor(max_workers):
+    """Get the executor shared by the whole process.
+
+    Parameters
+    ----------
+    max_workers: int
+      Concurrency limit of the executor, if it is created by this call
+
+    Returns
+    -------
+    AsyncExecutor
+      the executor, created on first use
+    """
+    global _shared_executor
+    with _shared_lock:
+        if _shared_executor is None:
+            _shared_executor = AsyncExecutor(max_workers)
+        return _shared_executor
+
+
+def set_shared_executor(max_workers, max_queue=None):
+    """Replace the executor shared by the whole process.
+
+      The calls already submitted to the previous executor still run,
+      then its pool of threads stops.
+
+    Parameters
+    ----------
+    max_workers: int
+      Number of functions running at once
+    max_queue: int, optional
+      Number of calls waiting for a slot, unbounded if None
+
+    Returns
+    -------
+    AsyncExecutor
+      the new executor
+    """
+    global _shared_executor
+    executor = AsyncExecutor(max_workers, max_queue)
+    with _shared_lock:
+        previous, _shared_executor = _shared_executor, executor
+    if previous is not None:
+        previous.shutdown(wait=False)
+    return executor
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ImageGoNord.utility.async_executor import AsyncExecutor, QueueFullError
+
+
+def test_concurrency_limit_and_queue_depth():
+    executor = AsyncExecutor(2, max_queue=1)
+    gate = threading.Event()
+
+    async def main():
+        tasks = [asyncio.ensure_future(executor.run(gate.wait, 5)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert executor.stats() == {'running': 2, 'waiting': 1}
+        with pytest.raises(QueueFullError):
+            await executor.run(gate.wait, 5)
+        gate.set()
+        assert await asyncio.gather(*tasks) == [True, True, True]
+        assert executor.stats() == {'running': 0, 'waiting': 0}
+
+    asyncio.run(main())
+    executor.shutdown()
+
+
+def test_cancellation():
+    executor = AsyncExecutor(1)
+    gate = threading.Event()
+    calls = []
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(gate.wait, 5))
+        waiting = asyncio.ensure_future(executor.run(calls.append, 'waiting'))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        running.cancel()
+        await asyncio.sleep(0.05)
+        # the running function keeps its slot until it returns
+        assert executor.stats() == {'running': 1, 'waiting': 0}
+        gate.set()
+        assert await executor.run(calls.append, 'next') is None
+        assert running.cancelled() and waiting.cancelled()
+
+    asyncio.run(main())
+    executor.shutdown()
+    assert calls == ['next']
+
+
+def test_event_loop_is_not_blocked():
+    executor = AsyncExecutor(2)
+
+    async def main():
+        delays = []
+
+        async def ticker():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                delays.append(time.perf_counter() - start - 0.01)
+
+        ticking = asyncio.ensure_future(ticker())
+        await asyncio.gather(*[executor.run(time.sleep, 0.2) for _ in range(4)])
+        ticking.cancel()
+        return delays
+
+    delays = asyncio.run(main())
+    executor.shutdown()
+    assert len(delays) > 20 and max(delays) < 0.1
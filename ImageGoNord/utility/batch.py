@@ -0,0 +1,192 @@
+"""Batch conversion module.
+
+Find the image files to convert from files, directories and glob patterns,
+map them to their output paths and tell which outputs are already up to date.
+The fingerprint of the settings of every output is recorded in a manifest
+of the output folder, so outputs of other settings are converted again.
+"""
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+from PIL import Image
+
+# Manifest of an output folder: the settings fingerprint of every output
+MANIFEST_FILE = '.imagegonord.json'
+
+
+def get_image_extensions():
+    """Get the file extensions of the image formats Pillow can open.
+
+    Returns
+    -------
+    set
+      lowercase extensions, with the leading dot
+    """
+    return {extension.lower() for extension, image_format in Image.registered_extensions().items()
+            if image_format in Image.OPEN}
+
+
+def get_glob_root(pattern):
+    """Get the folder of a glob pattern before its first wildcard.
+
+    Parameters
+    ----------
+    pattern: str
+      glob pattern, e.g. photos/**/*.jpg
+
+    Returns
+    -------
+    str
+      the folder, e.g. photos
+    """
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def find_images(paths):
+    """Find the image files to convert.
+
+      Directories and glob patterns are walked and only files with an
+      image extension are kept from them. Every file keeps the path relative to
+      the directory or to the glob folder it was found in, so the outputs
+      mirror the input tree.
+
+    Parameters
+    ----------
+    paths: list
+      image files, directories or glob patterns
+
+    Returns
+    -------
+    list
+      (path, relative path) of every image, without duplicates
+
+    Raises
+    ------
+    ValueError
+      If two images have the same relative path, e.g. files with the same
+      name in different folders
+    """
+    extensions = get_image_extensions()
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, folders, files in os.walk(path):
+                folders.sort()
+                for file in sorted(files):
+                    if os.path.splitext(file)[1].lower() in extensions:
+                        file = os.path.join(folder, file)
+                        found.append((file, os.path.relpath(file, path)))
+        elif glob.has_magic(path):
+            root = get_glob_root(path)
+            for file in sorted(glob.glob(path, recursive=True)):
+                if os.path.isfile(file) and os.path.splitext(file)[1].lower() in extensions:
+                    found.append((file, os.path.relpath(file, root)))
+        else:
+            found.append((path, os.path.basename(path)))
+
+    seen = set()
+    outputs = {}
+    images = []
+    for path, relative_path in found:
+        if os.path.abspath(path) in seen:
+            continue
+        seen.add(os.path.abspath(path))
+        output = os.path.normcase(os.path.normpath(relative_path))
+        if output in outputs:
+            raise ValueError("{} and {} would be written to the same output {}".format(outputs[output], path, relative_path))
+        outputs[output] = path
+        images.append((path, relative_path))
+    return images
+
+
+def get_fingerprint(settings):
+    """Get the fingerprint of the settings of a conversion.
+
+    Parameters
+    ----------
+    settings: dict
+      JSON serializable settings changing the converted images
+
+    Returns
+    -------
+    str
+      sha256 hex digest of the settings
+    """
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest(out_dir):
+    """Load the settings fingerprint of the outputs of a folder.
+
+    Parameters
+    ----------
+    out_dir: str
+      folder of the converted images
+
+    Returns
+    -------
+    dict
+      fingerprint of every output, by path relative to the folder; empty if
+      the manifest is missing or unreadable
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE)) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def save_manifest(out_dir, manifest):
+    """Write the manifest of an output folder atomically.
+
+    Parameters
+    ----------
+    out_dir: str
+      folder of the converted images, created if missing
+    manifest: dict
+      fingerprint of every output, by path relative to the folder
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+    try:
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def is_up_to_date(source, target, fingerprint=None, recorded=None):
+    """Check if an output file is newer than its source and has the same settings.
+
+    Parameters
+    ----------
+    source: str
+      path of the source image
+    target: str
+      path of the converted image
+    fingerprint: str, optional
+      fingerprint of the current settings, not checked if None
+    recorded: str, optional
+      fingerprint of the settings the output was written with
+
+    Returns
+    -------
+    bool
+      true if the output exists, it was written after the source changed
+      and with the current settings
+    """
+    if fingerprint is not None and recorded != fingerprint:
+        return False
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
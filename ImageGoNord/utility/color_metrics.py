@@ -0,0 +1,197 @@
+"""Color metrics module.
+
+Color distances used to match the image colors with the palette colors.
+Every function works on whole arrays of colors.
+"""
+import numpy as np
+
+COLOR_METRICS = ('manhattan', 'euclidean', 'redmean', 'cie76', 'ciede2000')
+# Metrics computed on CIELAB coordinates instead of RGB
+LAB_METRICS = ('cie76', 'ciede2000')
+
+# sRGB (D65) to XYZ, same matrix and white point used by skimage.color
+RGB_TO_XYZ = np.array([
+    [0.412453, 0.357580, 0.180423],
+    [0.212671, 0.715160, 0.072169],
+    [0.019334, 0.119193, 0.950227],
+])
+D65_WHITE = np.array([0.95047, 1., 1.08883])
+XYZ_TO_RGB = np.linalg.inv(RGB_TO_XYZ)
+
+_levels = np.arange(256) / 255
+# Linear value of every 8 bit sRGB level
+SRGB_TO_LINEAR = np.where(_levels > 0.04045, ((_levels + 0.055) / 1.055) ** 2.4, _levels / 12.92)
+
+
+def check_metric(metric):
+    """Raise a ValueError if the metric is not available.
+
+    Parameters
+    ----------
+    metric: str
+      Name of the color distance
+    """
+    if metric not in COLOR_METRICS:
+        raise ValueError("unknown color distance: " + str(metric) + ", available: " + ', '.join(COLOR_METRICS))
+
+
+def rgb_to_lab(colors, dtype=np.float64):
+    """Convert 8 bit RGB colors to CIELAB (D65).
+
+    Parameters
+    ----------
+    colors: ndarray
+      uint8 colors, shape (..., 3)
+    dtype: numpy dtype, optional
+      Float type of the computation, float32 halves the memory of big images
+
+    Returns
+    -------
+    ndarray
+      L*a*b* coordinates, shape (..., 3)
+    """
+    linear = SRGB_TO_LINEAR.astype(dtype, copy=False)[np.asarray(colors, dtype=np.uint8)]
+    xyz = (linear @ RGB_TO_XYZ.T.astype(dtype, copy=False)) / D65_WHITE.astype(dtype, copy=False)
+    xyz = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16. / 116.).astype(dtype, copy=False)
+    lab = np.empty(xyz.shape, dtype=dtype)
+    lab[..., 0] = 116. * xyz[..., 1] - 16.
+    lab[..., 1] = 500. * (xyz[..., 0] - xyz[..., 1])
+    lab[..., 2] = 200. * (xyz[..., 1] - xyz[..., 2])
+    return lab
+
+
+def lab_to_rgb(lab, dtype=np.float64):
+    """Convert CIELAB (D65) coordinates to RGB values in [0, 1].
+
+      Same conversion of skimage.color.lab2rgb: negative Z values and
+      out of gamut RGB values are clipped.
+
+    Parameters
+    ----------
+    lab: ndarray
+      L*a*b* coordinates, shape (..., 3)
+    dtype: numpy dtype, optional
+      Float type of the computation, float32 halves the memory of big images
+
+    Returns
+    -------
+    ndarray
+      RGB values in [0, 1], shape (..., 3)
+    """
+    lab = np.asarray(lab, dtype=dtype)
+    y = (lab[..., 0] + 16.) / 116.
+    x = lab[..., 1] / 500. + y
+    z = np.maximum(y - lab[..., 2] / 200., 0)
+    xyz = np.stack([x, y, z], axis=-1)
+    xyz = np.where(xyz > 0.2068966, xyz ** 3, (xyz - 16. / 116.) / 7.787) * D65_WHITE.astype(dtype, copy=False)
+
+    rgb = xyz @ XYZ_TO_RGB.T.astype(dtype, copy=False)
+    rgb = np.where(rgb > 0.0031308, 1.055 * np.power(np.maximum(rgb, 0.0031308), 1 / 2.4) - 0.055, rgb * 12.92)
+    return np.clip(rgb, 0, 1)
+
+
+def to_metric_space(colors, metric):
+    """Convert 8 bit RGB colors to the coordinates used by a metric.
+
+    Parameters
+    ----------
+    colors: ndarray
+      uint8 colors, shape (..., 3)
+    metric: str
+      Name of the color distance
+
+    Returns
+    -------
+    ndarray
+      int32 RGB values or float L*a*b* coordinates
+    """
+    if metric in LAB_METRICS:
+        return rgb_to_lab(colors)
+    return np.asarray(colors).astype(np.int32)
+
+
+def delta_e_2000(lab1, lab2):
+    """Compute the CIEDE2000 color difference.
+
+    Parameters
+    ----------
+    lab1: ndarray
+      L*a*b* coordinates, shape (..., 3)
+    lab2: ndarray
+      L*a*b* coordinates, broadcastable to lab1
+
+    Returns
+    -------
+    ndarray
+      the color differences
+    """
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    C_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    G = 0.5 * (1 - np.sqrt(C_mean ** 7 / (C_mean ** 7 + 25. ** 7)))
+    a1, a2 = a1 * (1 + G), a2 * (1 + G)
+    C1, C2 = np.hypot(a1, b1), np.hypot(a2, b2)
+    h1 = np.degrees(np.arctan2(b1, a1)) % 360
+    h2 = np.degrees(np.arctan2(b2, a2)) % 360
+
+    delta_L = L2 - L1
+    delta_C = C2 - C1
+    delta_h = h2 - h1
+    delta_h = np.where(delta_h > 180, delta_h - 360, delta_h)
+    delta_h = np.where(delta_h < -180, delta_h + 360, delta_h)
+    delta_h = np.where(C1 * C2 == 0, 0, delta_h)
+    delta_H = 2 * np.sqrt(C1 * C2) * np.sin(np.radians(delta_h) / 2)
+
+    L_mean = (L1 + L2) / 2
+    C_mean = (C1 + C2) / 2
+    h_sum = h1 + h2
+    h_mean = np.where(np.abs(h1 - h2) > 180, (h_sum + 360) / 2, h_sum / 2)
+    h_mean = np.where(h_mean >= 360, h_mean - 360, h_mean)
+    h_mean = np.where(C1 * C2 == 0, h_sum, h_mean)
+
+    T = (1 - 0.17 * np.cos(np.radians(h_mean - 30)) + 0.24 * np.cos(np.radians(2 * h_mean))
+         + 0.32 * np.cos(np.radians(3 * h_mean + 6)) - 0.20 * np.cos(np.radians(4 * h_mean - 63)))
+    S_L = 1 + 0.015 * (L_mean - 50) ** 2 / np.sqrt(20 + (L_mean - 50) ** 2)
+    S_C = 1 + 0.045 * C_mean
+    S_H = 1 + 0.015 * C_mean * T
+    R_T = (-2 * np.sqrt(C_mean ** 7 / (C_mean ** 7 + 25. ** 7))
+           * np.sin(np.radians(60 * np.exp(-((h_mean - 275) / 25) ** 2))))
+
+    delta_L, delta_C, delta_H = delta_L / S_L, delta_C / S_C, delta_H / S_H
+    return np.sqrt(delta_L ** 2 + delta_C ** 2 + delta_H ** 2 + R_T * delta_C * delta_H)
+
+
+def distance(colors, palette_colors, metric):
+    """Compute the distance between colors in the coordinates of a metric.
+
+      Only the order of the distances matters, so squared distances are
+      returned where the square root is not needed.
+
+    Parameters
+    ----------
+    colors: ndarray
+      Colors converted with to_metric_space, shape (..., 3)
+    palette_colors: ndarray
+      Colors converted with to_metric_space, broadcastable to colors
+    metric: str
+      Name of the color distance
+
+    Returns
+    -------
+    ndarray
+      the distances, comparable with each other
+    """
+    if metric == 'ciede2000':
+        return delta_e_2000(colors, palette_colors)
+
+    difference = colors - palette_colors
+    if metric == 'manhattan':
+        return np.abs(difference).sum(axis=-1)
+    if metric == 'redmean':
+        # weights of https://www.compuphase.com/cmetric.htm in integer form (x 256)
+        red_mean = (colors[..., 0] + palette_colors[..., 0]) // 2
+        difference = difference ** 2
+        return ((512 + red_mean) * difference[..., 0] + 1024 * difference[..., 1]
+                + (767 - red_mean) * difference[..., 2])
+    return (difference ** 2).sum(axis=-1)
@@ -138,4 +138,15 @@ class RecoloringDecoder(nn.Module):
                                                              #illu,x
         x = self.conv_last(x)
         x = torch.tanh(x)
-        return x
\ No newline at end of file
+        return x
+
+
+class PaletteNet(nn.Module):
+    def __init__(self, FE, RD):
+        super().__init__()
+        self.FE = FE
+        self.RD = RD
+
+    def forward(self, image, target_palettes):  # image Bx3xHxW, palette Bx6x3
+        c1, c2, c3, c4 = self.FE(image)
+        return self.RD(c1, c2, c3, c4, target_palettes, image[:,0:1,:,:])
@@ -0,0 +1,485 @@
+"""PaletteNet backend module.
+
+Run PaletteNet on NumPy arrays with a pluggable inference library:
+eager PyTorch, an exported TorchScript graph or an exported ONNX graph
+run by onnxruntime. The ONNX backend does not need torch at all.
+PaletteNet can also be quantized to int8 for faster cpu inference.
+"""
+import copy
+import importlib.util
+import os
+import threading
+import uuid
+
+import numpy as np
+
+import ImageGoNord.utility.model_tiling as model_tiling
+from ImageGoNord.utility.model_weights import WEIGHTS_FILES
+
+MODEL_BACKENDS = ('torch', 'torchscript', 'onnx')
+# Exported graphs, saved next to the weights
+MODEL_FILES = {
+    'torchscript': 'PaletteNet.torchscript.pt',
+    'onnx': 'PaletteNet.onnx',
+}
+# Suffix of the file recording the weights an exported graph was made from
+WEIGHTS_VERSION_SUFFIX = '.weights'
+ONNX_INPUTS = ('image', 'palette')
+ONNX_OUTPUT = 'chroma'
+# Synthetic inputs calibrating the int8 quantization: count and side
+CALIBRATION_IMAGES = 8
+CALIBRATION_SIDE = 128
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def check_backend(backend):
+    """Raise a ValueError if the backend is not available.
+
+    Parameters
+    ----------
+    backend: str
+      Name of the backend
+    """
+    if backend not in MODEL_BACKENDS:
+        raise ValueError("unknown model backend: " + str(backend) + ", available: " + ', '.join(MODEL_BACKENDS))
+
+
+def is_backend_available(backend):
+    """Check if the library of a backend is installed, without importing it.
+
+    Parameters
+    ----------
+    backend: str
+      Name of the backend
+
+    Returns
+    -------
+    bool
+      true if the backend can run
+    """
+    check_backend(backend)
+    return importlib.util.find_spec('onnxruntime' if backend == 'onnx' else 'torch') is not None
+
+
+def get_model_file(backend, weights_path):
+    """Get the path of the exported graph of a backend.
+
+    Parameters
+    ----------
+    backend: str
+      'torchscript' or 'onnx'
+    weights_path: str
+      Folder of the PaletteNet weights
+
+    Returns
+    -------
+    str
+      path of the exported graph
+    """
+    return os.path.join(os.path.abspath(weights_path), MODEL_FILES[backend])
+
+
+def get_weights_version(weights_path):
+    """Get the version of the PaletteNet weights files of a folder.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the PaletteNet weights
+
+    Returns
+    -------
+    str
+      size and modification time of every weights file, None if a file is missing
+    """
+    try:
+        stats = [os.stat(os.path.join(weights_path, name)) for name in WEIGHTS_FILES]
+    except OSError:
+        return None
+    return ';'.join('{}:{}:{}'.format(name, stat.st_size, stat.st_mtime_ns) for name, stat in zip(WEIGHTS_FILES, stats))
+
+
+def get_graph_weights_version(path):
+    """Get the version of the weights an exported graph was made from.
+
+    Parameters
+    ----------
+    path: str
+      Path of the exported graph
+
+    Returns
+    -------
+    str
+      the version recorded by the export, None if it is unknown
+    """
+    try:
+        with open(path + WEIGHTS_VERSION_SUFFIX) as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def is_graph_current(backend, weights_path):
+    """Check if the exported graph of a backend exists and matches the weights next to it.
+
+      Graphs without weights next to them (e.g. an ONNX graph deployed alone)
+      cannot be checked and are current.
+
+    Parameters
+    ----------
+    backend: str
+      'torchscript' or 'onnx'
+    weights_path: str
+      Folder of the PaletteNet weights and of the exported graphs
+
+    Returns
+    -------
+    bool
+      true if the graph can be loaded
+    """
+    path = get_model_file(backend, weights_path)
+    if not os.path.exists(path):
+        return False
+    version = get_weights_version(weights_path)
+    return version is None or get_graph_weights_version(path) == version
+
+
+def save_graph(save, path, weights_version=None):
+    """Write an exported graph atomically, with the version of its weights.
+
+    Parameters
+    ----------
+    save: callable
+      Called with the path of a temporary file to write the graph into
+    path: str
+      Path of the graph file
+    weights_version: str, optional
+      Version of the weights the graph is made from, see get_weights_version
+    """
+    # a temporary name for every export, concurrent exports do not mix their files
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    version_path = path + WEIGHTS_VERSION_SUFFIX
+    tmp_version_path = '{}.{}.tmp'.format(version_path, uuid.uuid4().hex)
+    try:
+        save(tmp_path)
+        if weights_version is None:
+            if os.path.exists(version_path):
+                os.remove(version_path)
+        else:
+            with open(tmp_version_path, 'w') as file:
+                file.write(weights_version)
+        os.replace(tmp_path, path)
+        if weights_version is not None:
+            os.replace(tmp_version_path, version_path)
+    finally:
+        for leftover in (tmp_path, tmp_version_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+class TorchBackend:
+    """
+    Run PaletteNet with PyTorch, as eager modules or as TorchScript graph
+
+    Methods
+    -------
+    predict(lab_images, palette)
+        Predict the chroma of a batch of images
+
+    set_num_threads(num_threads)
+        Set the number of cpu threads
+    """
+
+    def __init__(self, model, device='cpu', channels_last=False):
+        """Constructor: model is a PaletteNet module in eval mode"""
+        self.model = model
+        self.device = device
+        self.channels_last = channels_last
+
+    def set_num_threads(self, num_threads=None, interop_threads=None):
+        """
+        Set the number of cpu threads used by torch
+
+        The inter-op threads can be changed only before torch runs parallel work.
+
+        Parameters
+        ----------
+        num_threads : int, optional
+            threads used inside an operator
+        interop_threads : int, optional
+            threads running independent operators
+        """
+        import torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if interop_threads and interop_threads != torch.get_num_interop_threads():
+            torch.set_interop_threads(interop_threads)
+
+    def predict(self, lab_images, palette):
+        """
+        Predict the chroma of a batch of images
+
+        Parameters
+        ----------
+        lab_images : ndarray
+            normalized L*a*b* images of the same size, shape (n, h, w, 3)
+        palette : ndarray
+            normalized L*a*b* palette, shape (1, 6, 3)
+
+        Returns
+        -------
+        ndarray
+            the normalized a* b* channels, float32, shape (n, h, w, 2)
+        """
+        import torch
+        with torch.inference_mode():
+            image = torch.from_numpy(np.ascontiguousarray(lab_images, dtype=np.float32))
+            image = image.permute(0, 3, 1, 2).to(self.device)
+            if self.channels_last:
+                image = image.contiguous(memory_format=torch.channels_last)
+            palette = torch.from_numpy(np.ascontiguousarray(palette, dtype=np.float32)).to(self.device)
+            out = self.model(image, palette.expand(len(lab_images), -1, -1))
+            return out.permute(0, 2, 3, 1).cpu().numpy()
+
+
+class OnnxBackend:
+    """
+    Run an exported PaletteNet ONNX graph with onnxruntime, without torch
+
+    Methods
+    -------
+    predict(lab_images, palette)
+        Predict the chroma of a batch of images
+
+    set_num_threads(num_threads)
+        Set the number of cpu threads
+    """
+
+    def __init__(self, path, device='cpu', num_threads=None, interop_threads=None):
+        """Constructor: load the graph, on cuda only if onnxruntime supports it"""
+        import onnxruntime
+
+        self.path = path
+        self.providers = ['CPUExecutionProvider']
+        if device == 'cuda' and 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
+            self.providers.insert(0, 'CUDAExecutionProvider')
+        self.threads = (num_threads or 0, interop_threads or 0)
+        self.lock = threading.Lock()
+        self.session = self.create_session()
+
+    def create_session(self):
+        """Create the onnxruntime session of the graph"""
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads, options.inter_op_num_threads = self.threads
+        return onnxruntime.InferenceSession(self.path, sess_options=options, providers=self.providers)
+
+    def set_num_threads(self, num_threads=None, interop_threads=None):
+        """
+        Set the number of cpu threads used by onnxruntime
+
+        The session is created again; predictions already running finish on
+        the old one. The backends of get_backend are shared by the whole
+        process: pass the threads to get_backend instead of changing them.
+
+        Parameters
+        ----------
+        num_threads : int, optional
+            threads used inside an operator
+        interop_threads : int, optional
+            threads running independent operators
+        """
+        with self.lock:
+            threads = (num_threads or self.threads[0], interop_threads or self.threads[1])
+            if threads != self.threads:
+                self.threads = threads
+                self.session = self.create_session()
+
+    def predict(self, lab_images, palette):
+        """
+        Predict the chroma of a batch of images
+
+        Parameters
+        ----------
+        lab_images : ndarray
+            normalized L*a*b* images of the same size, shape (n, h, w, 3)
+        palette : ndarray
+            normalized L*a*b* palette, shape (1, 6, 3)
+
+        Returns
+        -------
+        ndarray
+            the normalized a* b* channels, float32, shape (n, h, w, 2)
+        """
+        image = np.ascontiguousarray(np.asarray(lab_images, dtype=np.float32).transpose(0, 3, 1, 2))
+        palette = np.repeat(np.asarray(palette, dtype=np.float32), len(image), axis=0)
+        out = self.session.run([ONNX_OUTPUT], {ONNX_INPUTS[0]: image, ONNX_INPUTS[1]: palette})[0]
+        return out.transpose(0, 2, 3, 1)
+
+
+def export_torchscript(model, path, weights_version=None):
+    """Save a PaletteNet module as TorchScript graph.
+
+    Parameters
+    ----------
+    model: PaletteNet
+      Module to export, on cpu
+    path: str
+      Path of the graph file
+    weights_version: str, optional
+      Version of the weights of the module, see get_weights_version
+    """
+    import torch
+
+    model = model.eval()
+    with torch.no_grad():
+        graph = torch.jit.trace(model, (torch.zeros(1, 3, 64, 64), torch.zeros(1, 6, 3)))
+    save_graph(graph.save, path, weights_version)
+
+
+def export_onnx(model, path, weights_version=None):
+    """Save a PaletteNet module as ONNX graph, with dynamic batch and image size.
+
+    Parameters
+    ----------
+    model: PaletteNet
+      Module to export, on cpu
+    path: str
+      Path of the graph file
+    weights_version: str, optional
+      Version of the weights of the module, see get_weights_version
+    """
+    import torch
+    from torch.export import Dim
+
+    model = model.eval()
+
+    def save(tmp_path):
+        torch.onnx.export(
+            model, (torch.zeros(1, 3, 64, 64), torch.zeros(1, 6, 3)), tmp_path,
+            input_names=list(ONNX_INPUTS), output_names=[ONNX_OUTPUT],
+            dynamic_shapes={'image': {0: Dim.AUTO, 2: Dim.AUTO, 3: Dim.AUTO}, 'target_palettes': {0: Dim.AUTO}},
+            external_data=False,
+        )
+
+    save_graph(save, path, weights_version)
+
+
+def get_calibration_inputs():
+    """Get the synthetic inputs calibrating the int8 quantization.
+
+      Smooth random color fields and random palettes, covering the ranges
+      of the normalized L*a*b* values.
+
+    Returns
+    -------
+    list
+      (lab_images, palette) pairs, shapes (1, side, side, 3) and (1, 6, 3)
+    """
+    rng = np.random.default_rng(0)
+    scale = np.array([1, 0.6, 0.6])
+    inputs = []
+    for _ in range(CALIBRATION_IMAGES):
+        coarse = rng.uniform(-1, 1, (8, 8, 3)) * scale
+        image = model_tiling.resize_bilinear(coarse, CALIBRATION_SIDE, CALIBRATION_SIDE)
+        palette = (rng.uniform(-1, 1, (1, 6, 3)) * scale).astype(np.float32)
+        inputs.append((image[None], palette))
+    return inputs
+
+
+def quantize_model(model, calibration_inputs):
+    """Quantize a PaletteNet module to int8 for the cpu.
+
+      Post-training static quantization: convolutions run in int8 with the
+      activation ranges observed on the calibration inputs. Dynamic
+      quantization would leave the model unchanged, it only covers linear layers.
+
+    Parameters
+    ----------
+    model: PaletteNet
+      Module to quantize, on cpu
+    calibration_inputs: list
+      (lab_images, palette) pairs, as TorchBackend.predict arguments
+
+    Returns
+    -------
+    GraphModule
+      the quantized module, in channels last memory format
+    """
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    model = copy.deepcopy(model).cpu().eval()
+    for module in model.modules():
+        if isinstance(module, (torch.nn.ReLU, torch.nn.LeakyReLU)):
+            # quantized activations do not support inplace
+            module.inplace = False
+    example = (torch.zeros(1, 3, 64, 64), torch.zeros(1, 6, 3))
+    prepared = prepare_fx(model, get_default_qconfig_mapping('x86'), example)
+    calibration = TorchBackend(prepared)
+    for lab_images, palette in calibration_inputs:
+        calibration.predict(lab_images, palette)
+    return convert_fx(prepared).to(memory_format=torch.channels_last)
+
+
+def get_backend(backend, weights_path, device='cpu', num_threads=None, interop_threads=None):
+    """Get a backend running the exported graph of PaletteNet.
+
+      Backends are cached by graph file, device and (onnx) threads, they are
+      loaded again only if the file changed on disk.
+
+    Parameters
+    ----------
+    backend: str
+      'torchscript' or 'onnx'
+    weights_path: str
+      Folder of the PaletteNet weights and of the exported graphs
+    device: str
+      'cpu' or 'cuda'
+    num_threads: int, optional
+      threads of the onnx session used inside an operator
+    interop_threads: int, optional
+      threads of the onnx session running independent operators
+
+    Returns
+    -------
+    TorchBackend or OnnxBackend
+      the backend
+
+    Raises
+    ------
+    ValueError
+      If the graph was exported from other weights than the ones next to it
+    """
+    if backend not in MODEL_FILES:
+        raise ValueError("no exported graph for the model backend: " + str(backend))
+
+    path = get_model_file(backend, weights_path)
+    if not is_graph_current(backend, weights_path):
+        raise ValueError("the graph " + path + " was exported from other weights, export it again")
+    version = (os.stat(path).st_mtime_ns, get_weights_version(weights_path))
+    key = (backend, path, str(device))
+    if backend == 'onnx':
+        key += (num_threads or 0, interop_threads or 0)
+    with _backends_lock:
+        cached = _backends.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        if backend == 'onnx':
+            loaded = OnnxBackend(path, device, num_threads, interop_threads)
+        else:
+            import torch
+            loaded = TorchBackend(torch.jit.load(path, map_location=device).eval(), device)
+        _backends[key] = (version, loaded)
+        return loaded
+
+
+def clear_backend_cache():
+    """Release every cached backend."""
+    with _backends_lock:
+        _backends.clear()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import ImageGoNord.utility.model_backend as model_backend
+
+torch = pytest.importorskip("torch")
+
+
+@pytest.fixture
+def palette_net():
+    from ImageGoNord.utility.model import FeatureEncoder, RecoloringDecoder, PaletteNet
+    torch.manual_seed(0)
+    return PaletteNet(FeatureEncoder(), RecoloringDecoder()).eval()
+
+
+@pytest.fixture
+def lab_images():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, (2, 48, 80, 3)).astype(np.float32), rng.uniform(-1, 1, (1, 6, 3)).astype(np.float32)
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnx"])
+def test_exported_graph_matches_eager_model(tmp_path, palette_net, lab_images, backend):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        pytest.importorskip("onnxscript")
+        model_backend.export_onnx(palette_net, str(tmp_path / model_backend.MODEL_FILES["onnx"]))
+    else:
+        model_backend.export_torchscript(palette_net, str(tmp_path / model_backend.MODEL_FILES["torchscript"]))
+
+    images, palette = lab_images
+    expected = model_backend.TorchBackend(palette_net).predict(images, palette)
+    exported = model_backend.get_backend(backend, str(tmp_path))
+    assert model_backend.get_backend(backend, str(tmp_path)) is exported
+
+    chroma = exported.predict(images, palette)
+    assert chroma.shape == (2, 48, 80, 2)
+    np.testing.assert_allclose(chroma, expected, atol=1e-4)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        model_backend.check_backend("tensorflow")
+
+
+def test_stale_graph_is_refused(tmp_path, palette_net):
+    from ImageGoNord.utility.model import FeatureEncoder, RecoloringDecoder
+    torch.save(FeatureEncoder().state_dict(), str(tmp_path / "FE.state_dict.pt"))
+    torch.save(RecoloringDecoder().state_dict(), str(tmp_path / "RD.state_dict.pt"))
+    path = model_backend.get_model_file("torchscript", str(tmp_path))
+    model_backend.export_torchscript(palette_net, path, model_backend.get_weights_version(str(tmp_path)))
+    assert model_backend.is_graph_current("torchscript", str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")) == []
+    model_backend.get_backend("torchscript", str(tmp_path))
+
+    torch.save(FeatureEncoder().state_dict(), str(tmp_path / "FE.state_dict.pt"))
+    assert not model_backend.is_graph_current("torchscript", str(tmp_path))
+    with pytest.raises(ValueError):
+        model_backend.get_backend("torchscript", str(tmp_path))
+
+
+def test_onnx_backends_are_cached_by_threads(tmp_path, palette_net):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnxscript")
+    model_backend.export_onnx(palette_net, str(tmp_path / model_backend.MODEL_FILES["onnx"]))
+    single = model_backend.get_backend("onnx", str(tmp_path), num_threads=1)
+    assert single.threads == (1, 0)
+    assert model_backend.get_backend("onnx", str(tmp_path), num_threads=1) is single
+    assert model_backend.get_backend("onnx", str(tmp_path), num_threads=2) is not single
+    assert single.threads == (1, 0)
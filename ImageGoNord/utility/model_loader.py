@@ -0,0 +1,98 @@
+"""PaletteNet loader module.
+
+Keep the PaletteNet models loaded once per process, so that every
+conversion and every GoNord instance share the same warm models.
+"""
+import os
+import threading
+
+import torch
+
+from ImageGoNord.utility.model import FeatureEncoder, RecoloringDecoder, PaletteNet
+import ImageGoNord.utility.model_backend as model_backend
+import ImageGoNord.utility.model_weights as model_weights
+from ImageGoNord.utility.model_weights import FE_WEIGHTS, RD_WEIGHTS
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_palette_net(weights_path, device='cpu', checksums=None):
+    """Get the PaletteNet models, loading the weights only the first time.
+
+      Models are cached by weights folder and device, in eval mode.
+      They are loaded again only if a weights file changed on disk.
+      The files are checked against their checksums every time they are loaded.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files
+    device: str
+      Torch device of the models, e.g. 'cpu' or 'cuda'
+    checksums: dict, optional
+      Expected sha256 hex digest of every weights file name
+
+    Returns
+    -------
+    tuple
+      the FeatureEncoder and the RecoloringDecoder
+    """
+    weights_path = os.path.abspath(weights_path)
+    files = [os.path.join(weights_path, FE_WEIGHTS), os.path.join(weights_path, RD_WEIGHTS)]
+    version = tuple(os.stat(file).st_mtime_ns for file in files)
+    key = (weights_path, str(device))
+
+    with _models_lock:
+        cached = _models.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        model_weights.verify_weights(weights_path, checksums)
+        FE = FeatureEncoder()
+        RD = RecoloringDecoder()
+        FE.load_state_dict(torch.load(files[0], map_location=device))
+        RD.load_state_dict(torch.load(files[1], map_location=device))
+        models = (FE.to(device).eval(), RD.to(device).eval())
+        _models[key] = (version, models)
+        return models
+
+
+def get_quantized_palette_net(weights_path, checksums=None):
+    """Get PaletteNet quantized to int8 for the cpu, quantizing it only the first time.
+
+      The quantized model is cached like the fp32 models and built again
+      only if a weights file changed on disk.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files
+    checksums: dict, optional
+      Expected sha256 hex digest of every weights file name
+
+    Returns
+    -------
+    GraphModule
+      the quantized PaletteNet, see model_backend.quantize_model
+    """
+    models = get_palette_net(weights_path, 'cpu', checksums)
+    weights_path = os.path.abspath(weights_path)
+    files = [os.path.join(weights_path, FE_WEIGHTS), os.path.join(weights_path, RD_WEIGHTS)]
+    version = tuple(os.stat(file).st_mtime_ns for file in files)
+    key = (weights_path, 'int8')
+
+    with _models_lock:
+        cached = _models.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        quantized = model_backend.quantize_model(PaletteNet(*models), model_backend.get_calibration_inputs())
+        _models[key] = (version, quantized)
+        return quantized
+
+
+def clear_model_cache():
+    """Release every cached model."""
+    with _models_lock:
+        _models.clear()
@@ -0,0 +1,195 @@
+"""PaletteNet tiling module.
+
+Split big images into overlapping tiles, so that the memory used by the
+PaletteNet inference is bounded by a budget instead of growing with the
+image area. Neighbour tiles are blended with linear ramps to hide the seams.
+"""
+import numpy as np
+
+# Sides of the PaletteNet input must be multiples of this value (4 downsamplings)
+MODEL_STRIDE = 16
+# Smallest side of the input: the deepest features need more than one element
+MIN_MODEL_SIDE = 32
+# Rows and columns shared by neighbour tiles
+TILE_OVERLAP = 64
+# Measured peak memory of a float32 forward pass for every input pixel, with margin
+BYTES_PER_PIXEL = 1280
+
+
+def get_model_size(height, width):
+    """Get the size of the PaletteNet input of an image.
+
+    Parameters
+    ----------
+    height: int
+      Rows of the image
+    width: int
+      Columns of the image
+
+    Returns
+    -------
+    tuple
+      (height, width) rounded up to multiples of MODEL_STRIDE
+    """
+    return tuple(
+        max(MIN_MODEL_SIDE, -(-side // MODEL_STRIDE) * MODEL_STRIDE)
+        for side in (height, width)
+    )
+
+
+def pad_to_model_size(values):
+    """Pad an image array to the size of the PaletteNet input.
+
+      The border values are repeated, the image stays at the top left corner.
+
+    Parameters
+    ----------
+    values: ndarray
+      Image array, shape (h, w, channels)
+
+    Returns
+    -------
+    ndarray
+      Padded array, shape (model_h, model_w, channels)
+    """
+    height, width = get_model_size(*values.shape[:2])
+    padding = ((0, height - values.shape[0]), (0, width - values.shape[1]), (0, 0))
+    return np.pad(values, padding, mode='edge')
+
+
+def get_max_pixels(memory_limit):
+    """Get the number of input pixels that a forward pass can use.
+
+    Parameters
+    ----------
+    memory_limit: int
+      Peak memory budget of the inference, in bytes
+
+    Returns
+    -------
+    int
+      the number of pixels, never less than the smallest input
+    """
+    return max(MIN_MODEL_SIDE * MIN_MODEL_SIDE, int(memory_limit) // BYTES_PER_PIXEL)
+
+
+def get_tile_shape(height, width, max_pixels):
+    """Get the biggest tile of an input fitting in a number of pixels.
+
+    Parameters
+    ----------
+    height: int
+      Rows of the model input, multiple of MODEL_STRIDE
+    width: int
+      Columns of the model input, multiple of MODEL_STRIDE
+    max_pixels: int
+      Maximum number of pixels of a tile
+
+    Returns
+    -------
+    tuple
+      (tile_height, tile_width), multiples of MODEL_STRIDE
+    """
+    def round_side(side):
+        return max(MIN_MODEL_SIDE, int(side) // MODEL_STRIDE * MODEL_STRIDE)
+
+    tile_height = min(height, round_side(np.sqrt(max_pixels)))
+    tile_width = min(width, round_side(max_pixels / tile_height))
+    return tile_height, tile_width
+
+
+def split_tiles(length, tile, overlap=TILE_OVERLAP):
+    """Get the starts of the overlapping tiles covering a side.
+
+    Parameters
+    ----------
+    length: int
+      Length of the side
+    tile: int
+      Length of the tiles
+    overlap: int
+      Wanted overlap between neighbour tiles
+
+    Returns
+    -------
+    list
+      start of every tile, the last tile ends with the side
+    """
+    if length <= tile:
+        return [0]
+    step = tile - min(overlap, tile // 2)
+    starts = list(range(0, length - tile, step))
+    return starts + [length - tile]
+
+
+def get_blend_weights(length, tile, start, overlap=TILE_OVERLAP):
+    """Get the blending weights of a tile along a side.
+
+      Weights ramp up from the tile edges shared with other tiles,
+      edges on the image border keep the full weight.
+
+    Parameters
+    ----------
+    length: int
+      Length of the side
+    tile: int
+      Length of the tile
+    start: int
+      Start of the tile
+    overlap: int
+      Wanted overlap between neighbour tiles
+
+    Returns
+    -------
+    ndarray
+      float32 weights, shape (tile,)
+    """
+    ramp = min(overlap, tile // 2)
+    weights = np.ones(tile, dtype=np.float32)
+    if ramp == 0:
+        return weights
+    rising = (np.arange(ramp, dtype=np.float32) + 0.5) / ramp
+    if start > 0:
+        weights[:ramp] = rising
+    if start + tile < length:
+        weights[-ramp:] = np.minimum(weights[-ramp:], rising[::-1])
+    return weights
+
+
+def resize_bilinear(values, height, width, rows=None):
+    """Resize an image array with bilinear interpolation.
+
+      Pixel centers are aligned like torch interpolate(align_corners=False).
+      Only the rows of the resized array selected by `rows` are computed,
+      so a big output can be produced strip by strip.
+
+    Parameters
+    ----------
+    values: ndarray
+      Image array, shape (h, w, channels)
+    height: int
+      Rows of the resized array
+    width: int
+      Columns of the resized array
+    rows: slice, optional
+      Rows of the resized array to compute, all of them by default
+
+    Returns
+    -------
+    ndarray
+      float32 resized array, shape (height, width, channels), or
+      (selected rows, width, channels)
+    """
+    def axis_weights(source, target):
+        position = np.maximum((np.arange(target) + 0.5) * (source / target) - 0.5, 0)
+        low = np.minimum(position.astype(np.intp), source - 1)
+        high = np.minimum(low + 1, source - 1)
+        return low, high, (position - low).astype(np.float32)
+
+    values = np.asarray(values, dtype=np.float32)
+    low, high, weight = axis_weights(values.shape[0], height)
+    if rows is not None:
+        low, high, weight = low[rows], high[rows], weight[rows]
+    values = values[low] + (values[high] - values[low]) * weight[:, None, None]
+    low, high, weight = axis_weights(values.shape[1], width)
+    return values[:, low] + (values[:, high] - values[:, low]) * weight[None, :, None]
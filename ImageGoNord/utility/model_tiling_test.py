@@ -0,0 +1,33 @@
+import numpy as np
+
+import ImageGoNord.utility.model_tiling as model_tiling
+
+
+def test_get_model_size():
+    assert model_tiling.get_model_size(50, 70) == (64, 80)
+    assert model_tiling.get_model_size(64, 10) == (64, 32)
+
+
+def test_tiles_cover_the_side_with_positive_weights():
+    for length, tile in [(64, 64), (200, 64), (1000, 320), (96, 48)]:
+        covered = np.zeros(length)
+        for start in model_tiling.split_tiles(length, tile):
+            assert 0 <= start <= length - tile or (start == 0 and length < tile)
+            covered[start:start + tile] += model_tiling.get_blend_weights(length, tile, start)
+        assert (covered > 0).all()
+
+
+def test_tile_shape_fits_the_budget():
+    max_pixels = model_tiling.get_max_pixels(256 * 1024 ** 2)
+    tile_height, tile_width = model_tiling.get_tile_shape(5008, 4000, max_pixels)
+    assert tile_height * tile_width <= max_pixels
+    assert tile_height % model_tiling.MODEL_STRIDE == 0 and tile_width % model_tiling.MODEL_STRIDE == 0
+    assert model_tiling.get_tile_shape(48, 4000, max_pixels)[0] == 48
+
+
+def test_resize_bilinear_by_rows():
+    values = np.random.default_rng(0).random((12, 9, 2))
+    resized = model_tiling.resize_bilinear(values, 40, 30)
+    assert resized.shape == (40, 30, 2) and resized.dtype == np.float32
+    strips = [model_tiling.resize_bilinear(values, 40, 30, rows=slice(start, start + 7)) for start in range(0, 40, 7)]
+    assert np.array_equal(np.concatenate(strips), resized)
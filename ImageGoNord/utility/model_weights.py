@@ -0,0 +1,269 @@
+"""PaletteNet weights module.
+
+Provision the PaletteNet weights files: download them from a mirror (an
+http(s) url or a local folder) in chunks, verify them and move them in
+place atomically, so a weights folder never holds partial files.
+Downloads can run in the background, e.g. when a service starts.
+"""
+import hashlib
+import os
+import threading
+import uuid
+import warnings
+from concurrent.futures import Future
+
+FE_WEIGHTS = 'FE.state_dict.pt'
+RD_WEIGHTS = 'RD.state_dict.pt'
+WEIGHTS_FILES = (FE_WEIGHTS, RD_WEIGHTS)
+# Listing of the sha256 of the published weights files, in the sha256sum format
+CHECKSUMS_FILE = 'checksums.txt'
+# Size of the chunks read from a download
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Seconds without data before a download fails
+DOWNLOAD_TIMEOUT = 60
+
+_locks = {}
+_locks_lock = threading.Lock()
+_prefetches = {}
+
+
+def has_weights(weights_path):
+    """Check if both the PaletteNet weights files are in a folder.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files
+
+    Returns
+    -------
+    bool
+      true if both the files exist
+    """
+    return all(os.path.exists(os.path.join(weights_path, file)) for file in WEIGHTS_FILES)
+
+
+def file_sha256(path):
+    """Compute the sha256 of a file, reading it in chunks.
+
+    Parameters
+    ----------
+    path: str
+      Path of the file
+
+    Returns
+    -------
+    str
+      hex digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_checksums(path):
+    """Read the sha256 of the weights files from a listing.
+
+      Every line holds a hex digest and a file name, as written by
+      `sha256sum`; blank lines and lines starting with # are skipped.
+
+    Parameters
+    ----------
+    path: str
+      Path of the listing
+
+    Returns
+    -------
+    dict
+      hex digest of every file name, empty if the listing is missing
+    """
+    checksums = {}
+    if not os.path.exists(path):
+        return checksums
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            digest, name = line.split(None, 1)
+            checksums[name.lstrip('*')] = digest.lower()
+    return checksums
+
+
+def verify_weights(weights_path, checksums=None):
+    """Check the PaletteNet weights files of a folder against their checksums.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files
+    checksums: dict, optional
+      Expected sha256 hex digest of every file name, files without one
+      are not checked
+
+    Raises
+    ------
+    ValueError
+      If a file does not match its checksum
+    """
+    for name, sha256 in (checksums or {}).items():
+        path = os.path.join(weights_path, name)
+        if name in WEIGHTS_FILES and file_sha256(path) != sha256.lower():
+            raise ValueError("checksum mismatch for " + path + ", expected " + sha256.lower())
+
+
+def open_source(url):
+    """Open a file of a mirror as iterator of chunks.
+
+    Parameters
+    ----------
+    url: str
+      http(s) url, file:// url or path of the file
+
+    Returns
+    -------
+    tuple
+      the chunks iterator, the expected size (None if unknown) and the
+      object to close
+    """
+    if url.startswith(('http://', 'https://')):
+        import requests
+
+        response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        size = response.headers.get('Content-Length')
+        if response.headers.get('Content-Encoding'):
+            # the length is the one of the encoded content
+            size = None
+        return response.iter_content(DOWNLOAD_CHUNK_SIZE), int(size) if size else None, response
+
+    path = url[len('file://'):] if url.startswith('file://') else url
+    file = open(path, 'rb')
+    return iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''), os.path.getsize(path), file
+
+
+def download_file(url, path, sha256=None):
+    """Download a file in chunks and move it in place only when it is complete.
+
+    Parameters
+    ----------
+    url: str
+      http(s) url, file:// url or path of the source file
+    path: str
+      Destination path
+    sha256: str, optional
+      Expected hex digest of the file
+
+    Raises
+    ------
+    IOError
+      If the download is incomplete
+    ValueError
+      If the file does not match the checksum
+    """
+    tmp_path = path + '.' + uuid.uuid4().hex + '.tmp'
+    chunks, expected_size, source = open_source(url)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+
+        if expected_size is not None and size != expected_size:
+            raise IOError("incomplete download of " + url + ": " + str(size) + " of " + str(expected_size) + " bytes")
+        if sha256 and digest.hexdigest() != sha256.lower():
+            raise ValueError("checksum mismatch for " + url + ": " + digest.hexdigest())
+        os.replace(tmp_path, path)
+    finally:
+        source.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_lock(weights_path):
+    """Get the lock serializing the provisioning of a weights folder"""
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(weights_path), threading.Lock())
+
+
+def provision_weights(weights_path, mirror, checksums=None):
+    """Download the missing PaletteNet weights files from a mirror.
+
+      Files not matching their checksum are downloaded again, files
+      without a checksum are downloaded with a RuntimeWarning.
+      Concurrent calls for the same folder download the files once.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files, created if missing
+    mirror: str
+      Base http(s) url or local folder holding the weights files
+    checksums: dict, optional
+      Expected sha256 hex digest of every file name
+
+    Returns
+    -------
+    str
+      the weights folder
+    """
+    checksums = checksums or {}
+    with get_lock(weights_path):
+        os.makedirs(weights_path, exist_ok=True)
+        for name in WEIGHTS_FILES:
+            path = os.path.join(weights_path, name)
+            if os.path.exists(path) and (name not in checksums or file_sha256(path) == checksums[name].lower()):
+                continue
+            if name not in checksums:
+                warnings.warn(
+                    "no checksum for " + name + ", the downloaded file is not verified; list it in " + CHECKSUMS_FILE,
+                    RuntimeWarning, stacklevel=2,
+                )
+            if mirror.startswith(('http://', 'https://')):
+                url = mirror.rstrip('/') + '/' + name
+            else:
+                url = os.path.join(mirror, name)
+            download_file(url, path, checksums.get(name))
+    return weights_path
+
+
+def prefetch_weights(weights_path, mirror, checksums=None):
+    """Download the missing PaletteNet weights files in a background thread.
+
+      A second call while the download runs returns the same future.
+
+    Parameters
+    ----------
+    weights_path: str
+      Folder of the weights files
+    mirror: str
+      Base http(s) url or local folder holding the weights files
+    checksums: dict, optional
+      Expected sha256 hex digest of every file name
+
+    Returns
+    -------
+    Future
+      resolved with the weights folder, or with the download error
+    """
+    key = os.path.abspath(weights_path)
+    with _locks_lock:
+        future = _prefetches.get(key)
+        if future is not None and not future.done():
+            return future
+        future = Future()
+        _prefetches[key] = future
+
+    def run():
+        try:
+            future.set_result(provision_weights(weights_path, mirror, checksums))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, name='image-go-nord-prefetch', daemon=True).start()
+    return future
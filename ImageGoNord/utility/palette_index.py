@@ -0,0 +1,305 @@
+"""Palette index module.
+
+Find the nearest palette color of many colors at once without comparing
+every color with the whole palette.
+"""
+import threading
+
+import numpy as np
+
+import ImageGoNord.utility.color_metrics as cm
+
+# Number of candidate colors compared at once, it bounds the memory of a query
+QUERY_CHUNK_SIZE = 1 << 20
+# Metrics whose distance is a sum of independent per channel terms
+SEPARABLE_METRICS = ('manhattan', 'euclidean')
+# Exponent and per channel weights bounding each metric from below and above
+# in its own coordinates. The ciede2000 difference has no such bound, so its
+# index keeps every palette color as candidate.
+METRIC_BOUNDS = {
+    'manhattan': (1, (1, 1, 1), (1, 1, 1)),
+    'euclidean': (2, (1, 1, 1), (1, 1, 1)),
+    'redmean': (2, (512, 1024, 512), (767, 1024, 767)),
+    'cie76': (2, (1, 1, 1), (1, 1, 1)),
+}
+# Range of the coordinates of each metric space (low, extent)
+RGB_SPACE = (np.array([0., 0., 0.]), np.array([256., 256., 256.]))
+LAB_SPACE = (np.array([0., -128., -128.]), np.array([100., 256., 256.]))
+# Number of indexes kept by get_palette_index, the oldest one is dropped first
+INDEX_CACHE_SIZE = 64
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class PaletteIndex:
+    """
+    A class used to find the nearest palette color of many colors at once
+
+    The color space of the metric (RGB or CIELAB) is divided into a grid of
+    cells. For every cell the index keeps
+    only the palette colors that can be the nearest color of a point of that cell:
+    a color is dropped when its minimum distance from the cell is greater than
+    the maximum distance of another palette color from the same cell.
+    A query compares each color only with the candidates of its cell.
+
+    Ties are resolved like a linear scan would: the first palette color wins.
+
+    Attributes
+    ----------
+    palette : ndarray
+        Palette colors, shape (n, 3)
+    metric : str
+        Color distance, one of color_metrics.COLOR_METRICS
+    palette_space : ndarray
+        Palette colors in the coordinates of the metric (e.g. L*a*b*)
+    separable : bool
+        true if the distance is a sum of per channel terms
+    cells : int
+        Number of cells of the grid along each channel
+    candidates : ndarray
+        Indexes of the candidate palette colors of every cell, shape (cells**3, k)
+
+    Methods
+    -------
+    query(colors)
+        Find the index of the nearest palette color for every given color
+
+    get_cells(colors)
+        Find the cell of the grid of every color
+
+    get_box_candidates(low, high)
+        Find the palette colors that can be the nearest color of the points of boxes
+
+    channel_distance(difference)
+        Compute the contribution of a channel to the color distance
+
+    distance(colors, palette_colors)
+        Compute the distance between colors
+    """
+
+    def __init__(self, palette, metric='manhattan', cells=None):
+        """Constructor: build the grid of candidates of the palette"""
+        cm.check_metric(metric)
+        self.palette = np.asarray(palette, dtype=np.uint8).reshape(-1, 3)
+        if len(self.palette) == 0:
+            raise ValueError("the palette is empty")
+        self.metric = metric
+        self.palette_space = cm.to_metric_space(self.palette, metric)
+        self.separable = metric in SEPARABLE_METRICS
+        if metric in METRIC_BOUNDS:
+            self.cells = cells or self.default_cells(len(self.palette))
+        else:
+            self.cells = 1
+        self.space_low, extent = LAB_SPACE if metric in cm.LAB_METRICS else RGB_SPACE
+        self.cell_size = extent / self.cells
+        self.candidates = self.build_candidates()
+
+    def default_cells(self, palette_size):
+        """Grid resolution: bigger palettes need smaller cells to prune more colors"""
+        if palette_size <= 8:
+            return 4
+        if palette_size <= 64:
+            return 8
+        if palette_size <= 512:
+            return 16
+        return 32
+
+    def channel_distance(self, difference):
+        """
+        Compute the contribution of a channel to a separable color distance
+
+        The manhattan and euclidean distances between two colors are the sum
+        of the contributions of their channels.
+
+        Parameters
+        ----------
+        difference : ndarray
+            Differences between the values of a channel (int32)
+
+        Returns
+        -------
+        ndarray
+            the contributions to the distance
+        """
+        if self.metric == 'euclidean':
+            return difference ** 2
+        return np.abs(difference)
+
+    def build_candidates(self):
+        """
+        Find the candidate palette colors of every cell of the grid
+
+        Returns
+        -------
+        ndarray
+            indexes of the candidates, shape (cells**3, k); cells with less than
+            k candidates repeat their first candidate
+        """
+        palette = self.palette_space
+        if self.cells == 1:
+            return np.arange(len(palette))[None, :]
+
+        power, low_weights, high_weights = METRIC_BOUNDS[self.metric]
+        cells = np.arange(self.cells)[:, None]
+        min_distances = []
+        max_distances = []
+        for channel in range(3):
+            low = self.space_low[channel] + cells * self.cell_size[channel]
+            high = low + self.cell_size[channel]
+            value = palette[:, channel][None, :]
+            min_distance = np.maximum(np.maximum(low - value, value - high), 0)
+            max_distance = np.maximum(np.abs(value - low), np.abs(value - high))
+            min_distances.append(low_weights[channel] * min_distance ** power)
+            max_distances.append(high_weights[channel] * max_distance ** power)
+
+        keep = np.empty((self.cells, self.cells * self.cells, len(palette)), dtype=bool)
+        for red in range(self.cells):
+            min_distance = min_distances[0][red] + min_distances[1][:, None, :] + min_distances[2][None, :, :]
+            max_distance = max_distances[0][red] + max_distances[1][:, None, :] + max_distances[2][None, :, :]
+            min_distance = min_distance.reshape(-1, len(palette))
+            bound = max_distance.reshape(-1, len(palette)).min(axis=1)[:, None]
+            # slack for the rounding of the float coordinates
+            keep[red] = min_distance <= bound * (1 + 1e-9) + 1e-9
+
+        keep = keep.reshape(-1, len(palette))
+        counts = keep.sum(axis=1)
+        size = int(counts.max())
+        # kept colors first, in palette order
+        candidates = np.argsort(~keep, axis=1, kind='stable')[:, :size]
+        padding = np.arange(size)[None, :] >= counts[:, None]
+        candidates[padding] = np.broadcast_to(candidates[:, :1], candidates.shape)[padding]
+        return candidates
+
+    def distance(self, colors, palette_colors):
+        """
+        Compute the distance between colors
+
+        Parameters
+        ----------
+        colors : ndarray
+            Colors in the coordinates of the metric, shape (..., 3)
+        palette_colors : ndarray
+            Palette colors in the coordinates of the metric, broadcastable to colors
+
+        Returns
+        -------
+        ndarray
+            the distances
+        """
+        return cm.distance(colors, palette_colors, self.metric)
+
+    def get_cells(self, colors):
+        """
+        Find the cell of the grid of every color, along each channel
+
+        Parameters
+        ----------
+        colors : ndarray
+            Colors in the coordinates of the metric, shape (m, 3)
+
+        Returns
+        -------
+        ndarray
+            the cell coordinates, shape (m, 3)
+        """
+        cell = np.floor((colors - self.space_low) / self.cell_size).astype(np.intp)
+        return np.clip(cell, 0, self.cells - 1)
+
+    def get_box_candidates(self, low, high):
+        """
+        Find the palette colors that can be the nearest color of the points of boxes
+
+        A color is dropped when its minimum distance from a box is greater than
+        the maximum distance of another palette color from the same box, like
+        the cells of the grid do.
+
+        Parameters
+        ----------
+        low : ndarray
+            Lower corners of the boxes in the coordinates of the metric, shape (m, 3)
+        high : ndarray
+            Upper corners of the boxes, shape (m, 3)
+
+        Returns
+        -------
+        ndarray
+            true for the candidates of every box, shape (m, n); metrics without
+            bounds (ciede2000) keep every palette color
+        """
+        palette = self.palette_space[None, :, :]
+        if self.metric not in METRIC_BOUNDS:
+            return np.ones((len(low), len(self.palette)), dtype=bool)
+
+        power, low_weights, high_weights = METRIC_BOUNDS[self.metric]
+        low = np.asarray(low, dtype=np.float64)[:, None, :]
+        high = np.asarray(high, dtype=np.float64)[:, None, :]
+        min_distance = np.maximum(np.maximum(low - palette, palette - high), 0)
+        max_distance = np.maximum(np.abs(palette - low), np.abs(palette - high))
+        min_distance = (np.array(low_weights) * min_distance ** power).sum(axis=2)
+        max_distance = (np.array(high_weights) * max_distance ** power).sum(axis=2)
+        bound = max_distance.min(axis=1)[:, None]
+        # slack for the rounding of the float coordinates
+        return min_distance <= bound * (1 + 1e-9) + 1e-9
+
+    def query(self, colors):
+        """
+        Find the index of the nearest palette color for every given color
+
+        Parameters
+        ----------
+        colors : ndarray
+            Colors to match, shape (m, 3) or more channels (only rgb is used)
+
+        Returns
+        -------
+        ndarray
+            index of the nearest palette color, shape (m,)
+        """
+        colors = np.asarray(colors)
+        colors = colors.reshape(-1, colors.shape[-1])[:, :3].astype(np.uint8)
+        indices = np.empty(len(colors), dtype=np.intp)
+        chunk_size = max(1, QUERY_CHUNK_SIZE // self.candidates.shape[1])
+        for start in range(0, len(colors), chunk_size):
+            block = cm.to_metric_space(colors[start:start + chunk_size], self.metric)
+            cell = self.get_cells(block)
+            cell = (cell[:, 0] * self.cells + cell[:, 1]) * self.cells + cell[:, 2]
+            candidates = self.candidates[cell]
+            distances = self.distance(block[:, None, :], self.palette_space[candidates])
+            best = distances.argmin(axis=1)
+            indices[start:start + len(block)] = candidates[np.arange(len(block)), best]
+
+        return indices
+
+
+def get_palette_index(palette, metric='manhattan'):
+    """Get the index of a palette, shared by every caller in the process.
+
+      Indexes are cached by palette colors and metric and never modified,
+      so threads converting with the same palette build its index once.
+
+    Parameters
+    ----------
+    palette: ndarray
+      Palette colors, shape (n, 3)
+    metric: str
+      Color distance, one of color_metrics.COLOR_METRICS
+
+    Returns
+    -------
+    PaletteIndex
+      the index of the palette
+    """
+    palette = np.array(palette, dtype=np.uint8).reshape(-1, 3)
+    key = (metric, palette.tobytes())
+    with _indexes_lock:
+        palette_index = _indexes.get(key)
+    if palette_index is not None:
+        return palette_index
+
+    palette_index = PaletteIndex(palette, metric)
+    with _indexes_lock:
+        palette_index = _indexes.setdefault(key, palette_index)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            del _indexes[next(iter(_indexes))]
+    return palette_index
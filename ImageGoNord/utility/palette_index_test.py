@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import ImageGoNord.utility.color_metrics as cm
+from ImageGoNord.utility.palette_index import PaletteIndex, get_palette_index
+
+
+def linear_scan(palette, colors, metric):
+    colors = cm.to_metric_space(colors, metric)[:, None, :]
+    palette = cm.to_metric_space(palette, metric)[None, :, :]
+    return cm.distance(colors, palette, metric).argmin(axis=1)
+
+
+@pytest.mark.parametrize("metric", cm.COLOR_METRICS)
+@pytest.mark.parametrize("size", [1, 6, 16, 300])
+def test_query_matches_linear_scan(metric, size):
+    rng = np.random.default_rng(size)
+    palette = rng.integers(0, 256, (size, 3), dtype=np.uint8)
+    palette[-1] = palette[0]
+    colors = rng.integers(0, 256, (5000, 3), dtype=np.uint8)
+    palette_index = PaletteIndex(palette, metric)
+    assert np.array_equal(palette_index.query(colors), linear_scan(palette, colors, metric))
+
+
+def test_candidates_are_pruned():
+    palette = np.random.default_rng(0).integers(0, 256, (300, 3), dtype=np.uint8)
+    assert PaletteIndex(palette).candidates.shape[1] < len(palette)
+
+
+@pytest.mark.parametrize("metric", cm.COLOR_METRICS)
+def test_box_candidates_keep_the_nearest_color(metric):
+    rng = np.random.default_rng(0)
+    palette = rng.integers(0, 256, (16, 3), dtype=np.uint8)
+    # small boxes, like the blocks of a color cube
+    colors = (rng.integers(0, 240, (500, 1, 3)) + rng.integers(0, 16, (500, 8, 3))).astype(np.uint8)
+    palette_index = PaletteIndex(palette, metric)
+    space = cm.to_metric_space(colors.reshape(-1, 3), metric).reshape(colors.shape)
+    keep = palette_index.get_box_candidates(space.min(axis=1), space.max(axis=1))
+    nearest = linear_scan(palette, colors.reshape(-1, 3), metric).reshape(500, 8)
+    assert np.take_along_axis(keep, nearest, axis=1).all()
+    if metric in ("manhattan", "euclidean", "redmean", "cie76"):
+        assert keep.sum(axis=1).mean() < len(palette)
+
+
+def test_get_palette_index_is_shared():
+    palette = np.array([[46, 52, 64], [216, 222, 233]], dtype=np.uint8)
+    palette_index = get_palette_index(palette, "euclidean")
+    assert get_palette_index(palette.copy(), "euclidean") is palette_index
+    assert get_palette_index(palette, "manhattan") is not palette_index
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        PaletteIndex([[0, 0, 0]], "unknown")
+
+
+def test_rgb_to_lab():
+    lab = cm.rgb_to_lab(np.array([[255, 255, 255], [255, 0, 0], [0, 0, 0]], dtype=np.uint8))
+    assert np.allclose(lab, [[100, 0, 0], [53.2408, 80.0925, 67.2032], [0, 0, 0]], atol=1e-2)
+
+
+def test_delta_e_2000():
+    # first pair of the CIEDE2000 test data by Sharma, Wu and Dalal
+    lab1 = np.array([50, 2.6772, -79.7751])
+    lab2 = np.array([50, 0, -82.7485])
+    assert cm.delta_e_2000(lab1, lab2) == pytest.approx(2.0425, abs=1e-4)
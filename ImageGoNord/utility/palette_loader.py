@@ -2,9 +2,28 @@
 
 This module does stuff.
 """
+import hashlib
+import os
+import threading
+import uuid
+import warnings
 from os import listdir
 import numpy as np
 
+from ImageGoNord.utility.palette_index import PaletteIndex, METRIC_BOUNDS
+import ImageGoNord.utility.color_metrics as cm
+
+# Bump when the color map format changes, so that old cached cubes are not reused
+COLOR_MAP_VERSION = 1
+# Levels per channel of the blocks of the color cubes of non separable distances
+COLOR_BLOCK_SIDE = 16
+
+# Parsed palette files: path -> ((mtime, size), (hex codes, colors))
+_palette_files = {}
+# Loaded color maps: (cache folder, key) -> color cube
+_color_maps = {}
+_cache_lock = threading.Lock()
+
 
 def load_palette_set(path):
     """Create a list of every colors set on the path given.
@@ -69,12 +88,52 @@ def import_palette_from_file(filename):
     <type>
       <description>
     """
-    opened_file = open(filename, "r")
-    palette = [line.replace('#', '').replace('\n', '')
-               for line in opened_file.readlines()]
+    with open(filename, "r") as opened_file:
+        palette = [line.replace('#', '').replace('\n', '')
+                   for line in opened_file.readlines()]
     return palette
 
 
+def load_palette_file(filename):
+    """Get the colors of a palette file, parsing the file only when it changed.
+
+      Parsed files are cached by path and reloaded when their modification
+      time or size changes. Empty lines are skipped.
+
+    Parameters
+    ----------
+    filename: str
+      Path of the palette file
+
+    Returns
+    -------
+    tuple
+      the hex codes of the colors, and the read-only uint8 colors array,
+      shape (n, 3)
+    """
+    key = os.path.abspath(filename)
+    stat = os.stat(key)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _palette_files.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    hex_colors = tuple(hex_color for hex_color in import_palette_from_file(key) if hex_color)
+    colors = np.array([export_tripletes_from_color(hex_color) for hex_color in hex_colors],
+                      dtype=np.uint8).reshape(-1, 3)
+    colors.flags.writeable = False
+    with _cache_lock:
+        _palette_files[key] = (version, (hex_colors, colors))
+    return hex_colors, colors
+
+
+def clear_palette_cache():
+    """Forget every parsed palette file and loaded color map."""
+    with _cache_lock:
+        _palette_files.clear()
+        _color_maps.clear()
+
+
 def create_data_colors(palette):
     """<Short Description>
 
@@ -121,6 +180,114 @@ def export_tripletes_from_color(hex_color):
     return triplets_integer
 
 
+def create_palette_array(palette_data):
+    """Create the numpy array of a palette.
+
+      Colors are sorted by their hex code, so that ties in the color
+      distance are resolved like the pixel by pixel conversion does.
+
+    Parameters
+    ----------
+    palette_data: dict
+      The palette data: keys are hex color code, values are rgb values
+
+    Returns
+    -------
+    ndarray
+      The palette colors as uint8 array, shape (n, 3)
+    """
+    colors = [rgb[:3] for _, rgb in sorted(palette_data.items())]
+    return np.array(colors, dtype=np.uint8).reshape(-1, 3)
+
+
+def build_color_cube(palette_index):
+    """Build the color map of the entire RGB color space.
+
+      Every color of the cube is mapped to the closest color in the palette,
+      the same color palette_index.query finds.
+      With a separable distance the cube is filled cell by cell of the palette
+      index: the colors of a cell are compared only with the candidates of
+      that cell, summing precomputed per channel distances.
+      Other distances fill the cube in blocks of COLOR_BLOCK_SIDE levels per
+      channel: the colors of a block are compared only with the palette colors
+      that can be the closest to its bounding box in the coordinates of the
+      metric. The ciede2000 distance has no such bound and compares every
+      color with the whole palette: its cube takes more than a minute (about
+      80 s for 16 colors on a single core), the other distances take seconds.
+
+    Parameters
+    ----------
+    palette_index: PaletteIndex
+      Index of the palette colors
+
+    Returns
+    -------
+    ndarray
+      The uint8 color cube, shape (256, 256, 256, 3)
+    """
+    color_cube = np.empty((256, 256, 256, 3), dtype=np.uint8)
+    if not palette_index.separable:
+        return build_color_cube_by_blocks(palette_index, color_cube)
+
+    palette = palette_index.palette.astype(np.int32)
+    levels = np.arange(256, dtype=np.int32)[:, None]
+    channel_distances = [palette_index.channel_distance(levels - palette[:, channel]) for channel in range(3)]
+
+    # the levels of every cell along each channel, found like query does,
+    # so that the cells need not divide 256
+    cells = palette_index.cells
+    level_cells = palette_index.get_cells(np.repeat(levels, 3, axis=1))
+    bounds = [np.searchsorted(level_cells[:, channel], np.arange(cells + 1)) for channel in range(3)]
+    for cell, candidates in enumerate(palette_index.candidates):
+        red, green, blue = np.unravel_index(cell, (cells, cells, cells))
+        red = slice(bounds[0][red], bounds[0][red + 1])
+        green = slice(bounds[1][green], bounds[1][green + 1])
+        blue = slice(bounds[2][blue], bounds[2][blue + 1])
+        distances = (
+            channel_distances[0][red, candidates][:, None, None, :]
+            + channel_distances[1][green, candidates][None, :, None, :]
+            + channel_distances[2][blue, candidates][None, None, :, :]
+        )
+        color_cube[red, green, blue] = palette_index.palette[candidates[distances.argmin(axis=3)]]
+    return color_cube
+
+
+def build_color_cube_by_blocks(palette_index, color_cube):
+    """Fill a color cube block by block, for the distances that are not separable.
+
+    Parameters
+    ----------
+    palette_index: PaletteIndex
+      Index of the palette colors
+    color_cube: ndarray
+      The uint8 color cube to fill, shape (256, 256, 256, 3)
+
+    Returns
+    -------
+    ndarray
+      The color cube
+    """
+    side = COLOR_BLOCK_SIDE
+    blocks = 256 // side
+    levels = np.arange(256, dtype=np.uint8)
+    for red in range(0, 256, side):
+        colors = np.stack(np.meshgrid(levels[red:red + side], levels, levels, indexing='ij'), axis=-1)
+        # the colors of every block of the slab together: (green block, blue block, color, channel)
+        colors = colors.reshape(side, blocks, side, blocks, side, 3).transpose(1, 3, 0, 2, 4, 5)
+        colors = colors.reshape(blocks * blocks, side ** 3, 3)
+        space = cm.to_metric_space(colors.reshape(-1, 3), palette_index.metric).reshape(colors.shape)
+        keep = palette_index.get_box_candidates(space.min(axis=1), space.max(axis=1))
+        for block, block_space in enumerate(space):
+            # candidates in palette order, so ties are resolved like query does
+            candidates = np.flatnonzero(keep[block])
+            distances = palette_index.distance(block_space[:, None, :], palette_index.palette_space[candidates])
+            green, blue = divmod(block, blocks)
+            color_cube[red:red + side, green * side:(green + 1) * side, blue * side:(blue + 1) * side] = (
+                palette_index.palette[candidates[distances.argmin(axis=1)]].reshape(side, side, side, 3)
+            )
+    return color_cube
+
+
 def generate_color_map(palette, palette_name):
   """ Generate a color map
 
@@ -140,15 +307,101 @@ def generate_color_map(palette, palette_name):
   None
     Generates a .npz file and saves it to disk
   """
-  if not isinstance(palette, np.ndarray):
-    palette = np.asarray(palette)
-  precalculated = np.zeros(shape=[256,256,256,3])
-  for i in range(256):
-    for j in range(256):
-      for k in range(256):
-        index = np.argmin(np.sqrt(np.sum(
-            ((palette)-np.array([i,j,k]))**2,
-            axis=1
-          )))
-        precalculated[i,j,k] = palette[index]
-  np.savez_compressed(palette_name, color_cube = precalculated)    
\ No newline at end of file
+  np.savez_compressed(palette_name, color_cube = build_color_cube(PaletteIndex(palette, 'euclidean')))
+
+
+def get_cache_path():
+    """Get the default folder of the color map cache.
+
+      It is the IMAGE_GO_NORD_CACHE environment variable if set,
+      otherwise image-go-nord inside the user cache folder.
+
+    Returns
+    -------
+    str
+      path of the cache folder
+    """
+    if os.environ.get('IMAGE_GO_NORD_CACHE'):
+        return os.environ['IMAGE_GO_NORD_CACHE']
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'image-go-nord')
+
+
+def get_color_map_key(palette_index):
+    """Get the cache key of the color map of a palette.
+
+    Parameters
+    ----------
+    palette_index: PaletteIndex
+      Index of the palette colors
+
+    Returns
+    -------
+    str
+      hash of the palette colors, of the distance and of the map format
+    """
+    digest = hashlib.sha256()
+    digest.update('{}:{}:'.format(COLOR_MAP_VERSION, palette_index.metric).encode())
+    digest.update(palette_index.palette.tobytes())
+    return digest.hexdigest()
+
+
+def load_color_map(palette_index, cache_path=None):
+    """Load the color map of a palette, building it if it is not cached.
+
+      Color maps are stored as .npy files named after the hash of the palette
+      and of the distance, so a cube is never reused for a different palette.
+      The file is written atomically and memory mapped when loaded,
+      loaded maps are kept in memory for the next conversions.
+      Building the map of the ciede2000 distance takes more than a minute
+      and raises a RuntimeWarning first.
+
+    Parameters
+    ----------
+    palette_index: PaletteIndex
+      Index of the palette colors, with the distance to use
+    cache_path: str, optional
+      Folder of the cached color maps, get_cache_path() by default
+
+    Returns
+    -------
+    ndarray
+      The read-only uint8 color cube, shape (256, 256, 256, 3)
+    """
+    cache_path = cache_path or get_cache_path()
+    key = get_color_map_key(palette_index)
+    color_cube = _color_maps.get((cache_path, key))
+    if color_cube is not None:
+        return color_cube
+
+    filename = os.path.join(cache_path, 'color_cube_' + key + '.npy')
+    try:
+        color_cube = np.load(filename, mmap_mode='r')
+        if color_cube.shape == (256, 256, 256, 3) and color_cube.dtype == np.uint8:
+            with _cache_lock:
+                _color_maps[(cache_path, key)] = color_cube
+            return color_cube
+    except (OSError, ValueError):
+        # missing or corrupted cache entry
+        pass
+
+    if palette_index.metric not in METRIC_BOUNDS:
+        warnings.warn(
+            "building the color map of the {} distance compares every color with the whole palette and takes "
+            "more than a minute; it is cached in {} for the next conversions".format(palette_index.metric, cache_path),
+            RuntimeWarning, stacklevel=2,
+        )
+    color_cube = build_color_cube(palette_index)
+    os.makedirs(cache_path, exist_ok=True)
+    temporary_filename = '{}.{}.tmp'.format(filename, uuid.uuid4().hex)
+    try:
+        with open(temporary_filename, 'wb') as cache_file:
+            np.save(cache_file, color_cube)
+        os.replace(temporary_filename, filename)
+    finally:
+        if os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+    color_cube = np.load(filename, mmap_mode='r')
+    with _cache_lock:
+        _color_maps[(cache_path, key)] = color_cube
+    return color_cube
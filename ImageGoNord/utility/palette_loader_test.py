@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+import ImageGoNord.utility.palette_loader as pl
+from ImageGoNord.utility.palette_index import PaletteIndex
+
+
+@pytest.fixture
+def palette():
+    return np.array([[46, 52, 64], [216, 222, 233], [191, 97, 106], [136, 192, 208]], dtype=np.uint8)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "manhattan"])
+def test_build_color_cube(palette, metric):
+    color_cube = pl.build_color_cube(PaletteIndex(palette, metric))
+    colors = np.random.default_rng(0).integers(0, 256, (500, 3))
+    differences = np.abs(colors[:, None, :] - palette[None, :, :].astype(int))
+    if metric == "euclidean":
+        differences = differences ** 2
+    expected = palette[differences.sum(axis=2).argmin(axis=1)]
+    assert color_cube.dtype == np.uint8
+    assert np.array_equal(color_cube[colors[:, 0], colors[:, 1], colors[:, 2]], expected)
+
+
+def get_edge_colors(count):
+    # random colors and every color on the edges of the cube, where the last cells end
+    colors = np.random.default_rng(0).integers(0, 256, (count, 3))
+    levels = np.arange(256)[:, None]
+    edges = [np.hstack([levels, np.full_like(levels, value), np.full_like(levels, other)])[:, order]
+             for value in (0, 255) for other in (0, 255) for order in ([0, 1, 2], [1, 0, 2], [1, 2, 0])]
+    return np.vstack([colors] + edges)
+
+
+@pytest.mark.parametrize("metric, cells", [("manhattan", 6), ("euclidean", 7), ("euclidean", 5)])
+def test_build_color_cube_with_cells_not_dividing_256(palette, metric, cells):
+    palette_index = PaletteIndex(palette, metric, cells=cells)
+    color_cube = pl.build_color_cube(palette_index)
+    colors = get_edge_colors(2000)
+    expected = palette[palette_index.query(colors)]
+    assert np.array_equal(color_cube[colors[:, 0], colors[:, 1], colors[:, 2]], expected)
+
+
+@pytest.mark.parametrize("metric", ["redmean", "cie76"])
+def test_build_color_cube_by_blocks_matches_query(metric):
+    palette = np.random.default_rng(1).integers(0, 256, (16, 3), dtype=np.uint8)
+    palette_index = PaletteIndex(palette, metric)
+    color_cube = pl.build_color_cube(palette_index)
+    colors = get_edge_colors(20000)
+    expected = palette[palette_index.query(colors)]
+    assert np.array_equal(color_cube[colors[:, 0], colors[:, 1], colors[:, 2]], expected)
+
+
+def test_slow_color_map_warns(palette, tmp_path, monkeypatch):
+    monkeypatch.setattr(pl, "build_color_cube", lambda palette_index: np.zeros((256, 256, 256, 3), dtype=np.uint8))
+    with pytest.warns(RuntimeWarning, match="ciede2000"):
+        pl.load_color_map(PaletteIndex(palette, 'ciede2000'), cache_path=str(tmp_path))
+
+
+def test_load_color_map_is_cached_by_palette(palette, tmp_path):
+    color_cube = pl.load_color_map(PaletteIndex(palette, 'euclidean'), cache_path=str(tmp_path))
+    assert isinstance(color_cube, np.memmap)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    pl.load_color_map(PaletteIndex(palette, 'euclidean'), cache_path=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    pl.load_color_map(PaletteIndex(palette[:3], 'euclidean'), cache_path=str(tmp_path))
+    pl.load_color_map(PaletteIndex(palette, 'manhattan'), cache_path=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 3
+
+
+def test_load_palette_file_is_parsed_once(tmp_path):
+    palette_file = tmp_path / "palette.txt"
+    palette_file.write_text("#2E3440\n\n#D8DEE9\n")
+    hex_colors, colors = pl.load_palette_file(str(palette_file))
+    assert hex_colors == ("2E3440", "D8DEE9")
+    assert colors.dtype == np.uint8
+    assert colors.tolist() == [[46, 52, 64], [216, 222, 233]]
+    assert pl.load_palette_file(str(palette_file))[1] is colors
+
+    palette_file.write_text("#BF616A\n")
+    stat = palette_file.stat()
+    os.utime(palette_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    hex_colors, colors = pl.load_palette_file(str(palette_file))
+    assert hex_colors == ("BF616A",)
+    assert colors.tolist() == [[191, 97, 106]]
@@ -0,0 +1,176 @@
+"""Parallel conversion module.
+
+Split an image into horizontal tiles stored in shared memory and convert
+them with a pool of worker processes, so the conversion is not bound to
+the GIL.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_EXCEPTION, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Minimum number of rows of a tile, smaller tiles cost more than they save
+MIN_TILE_ROWS = 16
+# Number of tiles assigned to each worker, to balance uneven tiles
+TILES_PER_WORKER = 4
+
+# persistent pools by number of workers
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_process_pool(max_workers):
+    """Get the persistent process pool of a number of workers, creating it if needed.
+
+      Every pool is shared by the conversions of the process using the same
+      number of workers, so instances with different MAX_THREADS do not
+      re-create each other's pool. A pool is re-created only when it broke.
+
+    Parameters
+    ----------
+    max_workers: int
+      Number of worker processes
+
+    Returns
+    -------
+    ProcessPoolExecutor
+      The worker pool
+    """
+    with _pools_lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            pool = _pools[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+        return pool
+
+
+def shutdown_process_pool(max_workers=None):
+    """Stop the persistent process pools and their workers.
+
+    Parameters
+    ----------
+    max_workers: int, optional
+      Number of workers of the pool to stop, every pool by default
+    """
+    with _pools_lock:
+        if max_workers is None:
+            pools = list(_pools.values())
+            _pools.clear()
+        else:
+            pools = [_pools.pop(max_workers)] if max_workers in _pools else []
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+def split_rows(height, tiles):
+    """Split the rows of an image into contiguous tiles.
+
+    Parameters
+    ----------
+    height: int
+      Number of rows of the image
+    tiles: int
+      Wanted number of tiles
+
+    Returns
+    -------
+    list
+      (start, end) rows of every tile
+    """
+    tiles = max(1, min(tiles, height // MIN_TILE_ROWS))
+    bounds = np.linspace(0, height, tiles + 1).astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def attach_array(name, shape):
+    """Attach to a shared memory block and map it as uint8 array.
+
+    Parameters
+    ----------
+    name: str
+      Name of the shared memory block
+    shape: tuple
+      Shape of the array
+
+    Returns
+    -------
+    tuple
+      the shared memory block and the array using it
+    """
+    try:
+        # the process creating the block is in charge of its cleanup
+        block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # track is available from python 3.13
+        block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+
+
+def convert_tiles(function, pixels, args=(), max_workers=None):
+    """Convert an image array tile by tile in the process pool.
+
+      The source pixels and the converted pixels live in two shared memory
+      blocks, so workers only receive the names of the blocks and the rows
+      of their tile: function(source_name, target_name, shape, start, end, *args)
+      must convert the rows [start, end) of the target block.
+      Tiles can read the rows around them from the source block.
+
+    Parameters
+    ----------
+    function: callable
+      Picklable function converting a single tile
+    pixels: ndarray
+      The image as uint8 array, shape (h, w, channels)
+    args: tuple
+      Additional arguments for the function
+    max_workers: int
+      Number of worker processes, by default the number of cpus
+
+    Returns
+    -------
+    ndarray
+      The converted image
+
+    Raises
+    ------
+    RuntimeError
+      If the conversion of a tile fails, no partial image is returned
+    """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    max_workers = max_workers or os.cpu_count() or 1
+    source = shared_memory.SharedMemory(create=True, size=max(1, pixels.nbytes))
+    target = shared_memory.SharedMemory(create=True, size=max(1, pixels.nbytes))
+    source_pixels = target_pixels = None
+    try:
+        source_pixels = np.ndarray(pixels.shape, dtype=np.uint8, buffer=source.buf)
+        target_pixels = np.ndarray(pixels.shape, dtype=np.uint8, buffer=target.buf)
+        source_pixels[...] = pixels
+        target_pixels[...] = pixels
+
+        pool = get_process_pool(max_workers)
+        futures = [
+            pool.submit(function, source.name, target.name, pixels.shape, start, end, *args)
+            for start, end in split_rows(pixels.shape[0], max_workers * TILES_PER_WORKER)
+        ]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in not_done:
+            future.cancel()
+        # running tiles must end before the blocks are released
+        wait(not_done)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                if isinstance(error, BrokenProcessPool):
+                    shutdown_process_pool(max_workers)
+                raise RuntimeError("conversion of an image tile failed") from error
+
+        return target_pixels.copy()
+    finally:
+        # the arrays must be released before closing the blocks
+        source_pixels = target_pixels = None
+        source.close()
+        source.unlink()
+        target.close()
+        target.unlink()
@@ -0,0 +1,15 @@
+import ImageGoNord.utility.parallel as parallel
+
+
+def test_pools_are_kept_by_number_of_workers():
+    try:
+        two = parallel.get_process_pool(2)
+        three = parallel.get_process_pool(3)
+        assert parallel.get_process_pool(2) is two
+        assert parallel.get_process_pool(3) is three
+
+        parallel.shutdown_process_pool(2)
+        assert parallel.get_process_pool(2) is not two
+        assert parallel.get_process_pool(3) is three
+    finally:
+        parallel.shutdown_process_pool()
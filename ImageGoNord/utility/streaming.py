@@ -0,0 +1,330 @@
+"""Streaming module.
+
+Read, convert and write images in horizontal strips, so the memory of a
+conversion is bound to the size of a strip instead of the size of the image.
+The pixels of uncompressed files are mapped from disk, the strips carry the
+rows around them (the halo) needed by the avg algorithm and by the blur, and
+TIFF outputs are written strip by strip.
+"""
+import struct
+
+import numpy as np
+
+# Extensions written strip by strip as uncompressed TIFF
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+# Raw modes of Pillow that can be mapped as rgb or rgba rows:
+# (image mode, raw mode) -> (bytes per pixel, channel indexes)
+RAW_LAYOUTS = {
+    ('RGB', 'RGB'): (3, [0, 1, 2]),
+    ('RGB', 'BGR'): (3, [2, 1, 0]),
+    ('RGB', 'RGBX'): (4, [0, 1, 2]),
+    ('RGB', 'BGRX'): (4, [2, 1, 0]),
+    ('RGBA', 'RGBA'): (4, [0, 1, 2, 3]),
+    ('RGBA', 'BGRA'): (4, [2, 1, 0, 3]),
+}
+
+# Rows above and below a row read by the GaussianBlur(1) of GoNord,
+# three box blurs reading a row on each side
+BLUR_HALO = 3
+
+# TIFF tags and field types written by TiffWriter
+TIFF_SHORT, TIFF_LONG, TIFF_ASCII, TIFF_LONG8 = 3, 4, 2, 16
+PROCESSING_SOFTWARE = 0x000B
+
+
+def get_raw_blocks(image):
+    """Get the layout of the rows of an uncompressed image file.
+
+      Only files whose pixels Pillow reads as raw rgb(a) rows covering the
+      whole width (e.g. uncompressed TIFF, BMP, PPM) have one.
+
+    Parameters
+    ----------
+    image: pillow image
+      An opened image, not loaded yet
+
+    Returns
+    -------
+    list
+      (first row, last row excluded, file offset, bytes per row, bytes per
+      pixel, channel indexes, orientation) of every block of rows of the
+      file, None if the pixels are compressed
+    """
+    if image.mode not in ('RGB', 'RGBA') or not getattr(image, 'filename', None) or not image.tile:
+        return None
+
+    width = image.size[0]
+    blocks = []
+    for tile in image.tile:
+        codec, extents, offset, args = tile[:4]
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        layout = RAW_LAYOUTS.get((image.mode, rawmode))
+        left, upper, right, lower = extents
+        if codec != 'raw' or layout is None or left != 0 or right != width or orientation not in (1, -1):
+            return None
+        pixel_size, channels = layout
+        blocks.append((upper, lower, offset, stride or width * pixel_size, pixel_size, channels, orientation))
+    return sorted(blocks, key=lambda block: block[0])
+
+
+def map_raw_rows(image, start=0, end=None):
+    """Map the rows of an uncompressed image file as read-only arrays.
+
+      Only the rows from start to end are mapped, so the pages of the file
+      read through them leave the memory of the process with the arrays.
+
+    Parameters
+    ----------
+    image: pillow image
+      An opened image, not loaded yet
+    start: int, optional
+      First row to map
+    end: int, optional
+      Last row to map (excluded), the last row of the image by default
+
+    Returns
+    -------
+    list
+      (first row, last row excluded, uint8 array of shape (rows, w, bytes per
+      pixel), channel indexes) of every block of rows of the file between
+      start and end, None if the pixels are compressed
+    """
+    blocks = get_raw_blocks(image)
+    if blocks is None:
+        return None
+
+    width, height = image.size
+    end = height if end is None else end
+    mapped = []
+    for upper, lower, offset, stride, pixel_size, channels, orientation in blocks:
+        first, last = max(start, upper), min(end, lower)
+        if first >= last:
+            continue
+        # bottom-up blocks store the last row first
+        file_row = first - upper if orientation == 1 else lower - last
+        rows = np.memmap(image.filename, dtype=np.uint8, mode='r', offset=offset + file_row * stride, shape=(last - first, stride))
+        rows = rows[:, :width * pixel_size].reshape(last - first, width, pixel_size)
+        if orientation == -1:
+            rows = rows[::-1]
+        mapped.append((first, last, rows, channels))
+    return mapped
+
+
+def read_strips(image, strip_rows):
+    """Read an image strip by strip.
+
+      Uncompressed files are mapped from disk one strip at a time, so only
+      the strip being converted is in memory. Compressed images are decoded
+      once by Pillow and cropped strip by strip.
+
+    Parameters
+    ----------
+    image: pillow image
+      An opened RGB or RGBA image
+    strip_rows: int
+      Number of rows of every strip
+
+    Returns
+    -------
+    generator
+      uint8 arrays of shape (rows, w, channels), from the top of the image
+    """
+    width, height = image.size
+    is_raw = get_raw_blocks(image) is not None
+    if not is_raw:
+        image.load()
+    for start in range(0, height, strip_rows):
+        end = min(height, start + strip_rows)
+        if not is_raw:
+            yield np.asarray(image.crop((0, start, width, end)))
+            continue
+        # the channels are picked per strip, fancy indexing copies the rows
+        yield np.concatenate([rows[:, :, channels] for first, last, rows, channels in map_raw_rows(image, start, end)])
+
+
+def stream_with_halo(strips, top, bottom, function):
+    """Apply a function to a stream of strips, with the rows around them.
+
+      The function sees every row together with the `top` rows above it and
+      the `bottom` rows below it (fewer at the edges of the image), so its
+      output is the same it would give on the whole image as long as every
+      output row depends only on those rows. Strips smaller than the halo
+      are buffered until enough rows arrive.
+
+    Parameters
+    ----------
+    strips: iterable
+      uint8 arrays of shape (rows, w, channels), from the top of the image
+    top: int
+      Number of rows above a row needed by the function
+    bottom: int
+      Number of rows below a row needed by the function
+    function: callable
+      Called with a new array of rows (it can modify it), it returns an
+      array of the same number of rows
+
+    Returns
+    -------
+    generator
+      the output rows, in strips
+    """
+    buffer = None
+    # rows at the top of the buffer already returned, kept as context
+    context = 0
+    for strip in strips:
+        buffer = np.concatenate([strip] if buffer is None else [buffer, strip])
+        end = len(buffer) - bottom
+        if end <= context:
+            continue
+        keep = max(0, end - top)
+        # the function can modify the buffer, the next strips need the source rows
+        kept = buffer[keep:].copy()
+        yield function(buffer)[context:end]
+        buffer = kept
+        context = end - keep
+    if buffer is not None and len(buffer) > context:
+        yield function(buffer)[context:]
+
+
+class TiffWriter:
+    """
+    A class used to write an uncompressed TIFF file strip by strip
+
+    The header is written first, since the size of the image is known, and
+    the rows follow in a single TIFF strip. Files bigger than 4 GiB are
+    written as BigTIFF.
+
+    Methods
+    -------
+    write(rows)
+        Append rows to the image
+
+    close()
+        Check that every row was written and close the file
+    """
+
+    def __init__(self, path, width, height, mode, software=None):
+        """
+        Constructor: write the header of the image
+
+        Parameters
+        ----------
+        path : str
+            path of the file
+        width : int
+            width of the image
+        height : int
+            height of the image
+        mode : str
+            'RGB' or 'RGBA'
+        software : str, optional
+            value of the ProcessingSoftware tag
+        """
+        if mode not in ('RGB', 'RGBA'):
+            raise ValueError("only RGB or RGBA images can be written: " + str(mode))
+        self.channels = len(mode)
+        self.width = width
+        self.height = height
+        self.rows = 0
+
+        data_size = width * height * self.channels
+        header = self.get_header(width, height, software, data_size, big=False)
+        if len(header) + data_size >= 1 << 32:
+            header = self.get_header(width, height, software, data_size, big=True)
+        self.file = open(path, 'wb')
+        self.file.write(header)
+
+    def get_header(self, width, height, software, data_size, big):
+        """Get the header and the image file directory, up to the first pixel"""
+        channels = self.channels
+        entry_format, count_format = ('<HHQQ', '<Q') if big else ('<HHII', '<H')
+        inline_size = 8 if big else 4
+        entries = [
+            (256, TIFF_LONG, 1, width),
+            (257, TIFF_LONG, 1, height),
+            (258, TIFF_SHORT, channels, struct.pack('<' + 'H' * channels, *[8] * channels)),
+            (259, TIFF_SHORT, 1, 1),
+            (262, TIFF_SHORT, 1, 2),
+            (273, TIFF_LONG8 if big else TIFF_LONG, 1, None),
+            (277, TIFF_SHORT, 1, channels),
+            (278, TIFF_LONG, 1, height),
+            (279, TIFF_LONG8 if big else TIFF_LONG, 1, data_size),
+            (284, TIFF_SHORT, 1, 1),
+        ]
+        if channels == 4:
+            # unassociated alpha
+            entries.append((338, TIFF_SHORT, 1, 2))
+        if software:
+            software = software.encode('ascii', 'replace') + b'\0'
+            entries.append((PROCESSING_SOFTWARE, TIFF_ASCII, len(software), software))
+        entries.sort()
+
+        if big:
+            start = struct.pack('<2sHHHQ', b'II', 43, 8, 0, 16)
+        else:
+            start = struct.pack('<2sHI', b'II', 42, 8)
+        directory_size = struct.calcsize(count_format) + len(entries) * struct.calcsize(entry_format) + inline_size
+        extra_offset = len(start) + directory_size
+        extra = b''
+        values = []
+        for tag, field_type, count, value in entries:
+            if isinstance(value, bytes) and len(value) > inline_size:
+                values.append(extra_offset + len(extra))
+                extra += value + b'\0' * (len(value) % 2)
+            else:
+                values.append(value)
+        data_offset = extra_offset + len(extra)
+
+        directory = struct.pack(count_format, len(entries))
+        for (tag, field_type, count, value), inline in zip(entries, values):
+            if tag == 273:
+                inline = data_offset
+            if isinstance(inline, bytes):
+                inline = int.from_bytes(inline.ljust(inline_size, b'\0'), 'little')
+            elif field_type == TIFF_SHORT:
+                # shorts are left aligned in the value field
+                inline = int.from_bytes(struct.pack('<H', inline).ljust(inline_size, b'\0'), 'little')
+            directory += struct.pack(entry_format, tag, field_type, count, inline)
+        directory += b'\0' * inline_size
+        return start + directory + extra
+
+    def write(self, rows):
+        """
+        Append rows to the image
+
+        Parameters
+        ----------
+        rows : ndarray
+            uint8 array of shape (rows, w, channels)
+        """
+        if rows.shape[1:] != (self.width, self.channels) or self.rows + len(rows) > self.height:
+            raise ValueError("the rows do not fit the image: " + str(rows.shape))
+        self.file.write(np.ascontiguousarray(rows, dtype=np.uint8).data)
+        self.rows += len(rows)
+
+    def close(self):
+        """
+        Check that every row was written and close the file
+
+        Raises
+        ------
+        ValueError
+            if rows are missing
+        """
+        if self.file.closed:
+            return
+        self.file.close()
+        if self.rows != self.height:
+            raise ValueError("{} rows of {} were written".format(self.rows, self.height))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+        return False
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ImageGoNord import GoNord
+import ImageGoNord.utility.streaming as streaming
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("extension", ["tif", "bmp", "ppm", "png"])
+def test_read_strips(tmp_path, mode, extension):
+    pixels = np.random.default_rng(0).integers(0, 256, (23, 17, len(mode)), dtype=np.uint8)
+    Image.fromarray(pixels, mode).save(tmp_path / ("image." + extension))
+    with Image.open(tmp_path / ("image." + extension)) as image:
+        expected = np.array(image)
+    with Image.open(tmp_path / ("image." + extension)) as image:
+        assert (streaming.map_raw_rows(image) is None) == (extension == "png")
+        strips = list(streaming.read_strips(image, 5))
+    assert [len(strip) for strip in strips] == [5, 5, 5, 5, 3]
+    assert np.array_equal(np.concatenate(strips), expected)
+
+
+@pytest.mark.parametrize("big", [False, True])
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+def test_tiff_writer(tmp_path, mode, big):
+    pixels = np.random.default_rng(0).integers(0, 256, (23, 17, len(mode)), dtype=np.uint8)
+    with streaming.TiffWriter(str(tmp_path / "image.tif"), 17, 23, mode, software="ImageGoNord") as writer:
+        if big:
+            writer.file.seek(0)
+            writer.file.write(writer.get_header(17, 23, "ImageGoNord", pixels.nbytes, big=True))
+        for start in range(0, 23, 10):
+            writer.write(pixels[start:start + 10])
+    with Image.open(tmp_path / "image.tif") as image:
+        assert image.mode == mode
+        assert image.getexif()[streaming.PROCESSING_SOFTWARE] == "ImageGoNord"
+        assert np.array_equal(np.array(image), pixels)
+
+    with pytest.raises(ValueError):
+        with streaming.TiffWriter(str(tmp_path / "short.tif"), 17, 23, mode) as writer:
+            writer.write(pixels[:10])
+
+
+@pytest.mark.parametrize("strip_rows", [1, 2, 5, 40])
+def test_stream_with_halo(strip_rows):
+    values = np.random.default_rng(0).integers(0, 256, (40, 3, 1), dtype=np.uint8)
+
+    def window_max(rows):
+        # max of the rows [row - 3, row + 2), modifying the rows in place
+        padded = np.pad(rows, ((3, 1), (0, 0), (0, 0)))
+        rows[:] = np.max([padded[offset:offset + len(rows)] for offset in range(5)], axis=0)
+        return rows
+
+    strips = (values[start:start + strip_rows] for start in range(0, len(values), strip_rows))
+    output = list(streaming.stream_with_halo(strips, 3, 1, window_max))
+    assert np.array_equal(np.concatenate(output), window_max(values.copy()))
+
+
+def test_uncompressed_input_is_mapped(tmp_path, monkeypatch):
+    mapped = []
+    map_raw_rows = streaming.map_raw_rows
+
+    def spy(image, *rows):
+        blocks = map_raw_rows(image, *rows)
+        mapped.append(blocks)
+        return blocks
+
+    monkeypatch.setattr(streaming, "map_raw_rows", spy)
+    pixels = np.random.default_rng(0).integers(0, 256, (60, 50, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(tmp_path / "image.tif")
+    GoNord().convert_image_strips(str(tmp_path / "image.tif"), str(tmp_path / "converted.tif"), strip_rows=7)
+    # every strip is mapped from the file
+    assert len(mapped) == 9 and all(blocks is not None for blocks in mapped)
+
+
+MEMORY_SCRIPT = """
+import sys
+from ImageGoNord import GoNord
+go_nord = GoNord()
+go_nord.enable_avg_algorithm()
+go_nord.STRIP_PIXELS = 100000
+go_nord.convert_image_strips(sys.argv[1], sys.argv[2])
+with open('/proc/self/status') as status:
+    print([line.split()[1] for line in status if line.startswith('VmHWM:')][0])
+"""
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="the peak resident memory is read from /proc")
+def test_memory_is_bound_to_the_strip(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(streaming.__file__))))
+    environment = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+
+    def peak_rss(height):
+        # peak resident memory of a new process converting the image, in KiB
+        pixels = np.random.default_rng(0).integers(0, 256, (height, 2000, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(tmp_path / "image.tif")
+        del pixels
+        output = subprocess.run(
+            [sys.executable, "-c", MEMORY_SCRIPT, str(tmp_path / "image.tif"), str(tmp_path / "converted.tif")],
+            check=True, capture_output=True, text=True, env=environment,
+        ).stdout
+        return int(output.split()[-1])
+
+    # 60 MB more pixels, less than 10 MB more memory
+    assert peak_rss(10000) - peak_rss(100) < 10 * 1024
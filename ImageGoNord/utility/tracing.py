@@ -0,0 +1,210 @@
+"""Tracing module.
+
+Time the stages of the GoNord conversions. Each stage runs inside a span
+of a tracer, which receives its name, its duration and its pixel and byte
+counts. The default tracer does nothing; StatsTracer collects the durations
+and reports the percentiles of every stage.
+"""
+import contextlib
+import random
+import threading
+import time
+
+import numpy as np
+
+_null_span = contextlib.nullcontext()
+# Durations kept by StatsTracer for the percentiles of a stage
+RESERVOIR_SIZE = 1024
+
+
+class NullTracer:
+    """
+    A tracer that records nothing, the default of GoNord
+
+    Methods
+    -------
+    span(name, pixels=0, nbytes=0)
+        Get the context manager of a stage
+    """
+
+    def span(self, name, pixels=0, nbytes=0):
+        """Get a context manager doing nothing"""
+        return _null_span
+
+
+NULL_TRACER = NullTracer()
+
+
+class Span:
+    """
+    A stage being timed, used as context manager
+
+    Attributes
+    ----------
+    name : str
+        name of the stage
+    pixels : int
+        pixels processed by the stage
+    nbytes : int
+        bytes processed by the stage
+    seconds : float
+        duration of the stage, set when it ends
+    """
+
+    def __init__(self, tracer, name, pixels=0, nbytes=0):
+        """Constructor: the tracer records the span when it ends"""
+        self.tracer = tracer
+        self.name = name
+        self.pixels = pixels
+        self.nbytes = nbytes
+        self.seconds = None
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.start
+        self.tracer.record(self)
+        return False
+
+
+class Tracer:
+    """
+    A tracer passing every ended span to a callback
+
+    Methods
+    -------
+    span(name, pixels=0, nbytes=0)
+        Get the context manager timing a stage
+
+    record(span)
+        Receive an ended span
+    """
+
+    def __init__(self, callback=None):
+        """Constructor: callback is called with every ended Span"""
+        self.callback = callback
+
+    def span(self, name, pixels=0, nbytes=0):
+        """
+        Get the context manager timing a stage
+
+        Parameters
+        ----------
+        name : str
+            name of the stage, e.g. 'convert_image.convert'
+        pixels : int, optional
+            pixels processed by the stage
+        nbytes : int, optional
+            bytes processed by the stage
+
+        Returns
+        -------
+        Span
+            the span, recorded when the context ends
+        """
+        return Span(self, name, pixels, nbytes)
+
+    def record(self, span):
+        """Receive an ended span"""
+        if self.callback is not None:
+            self.callback(span)
+
+
+class StatsTracer(Tracer):
+    """
+    A tracer collecting the durations of every stage, safe to share between threads
+
+    The count, total, min and max of a stage are exact. The percentiles come
+    from a uniform sample of at most reservoir_size durations (reservoir
+    sampling), so the memory of a stage stays bounded in long running
+    services; they are exact until a stage has more spans than that.
+
+    Methods
+    -------
+    record(span)
+        Collect an ended span
+
+    report()
+        Get the statistics of every stage
+
+    reset()
+        Forget the collected spans
+
+    format_report()
+        Get the report as a text table
+    """
+
+    def __init__(self, callback=None, reservoir_size=RESERVOIR_SIZE):
+        """Constructor: callback is also called with every ended Span"""
+        super().__init__(callback)
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.reservoir_size = max(1, reservoir_size)
+        self.random = random.Random()
+
+    def record(self, span):
+        """Collect an ended span"""
+        seconds = span.seconds
+        with self.lock:
+            stage = self.stages.get(span.name)
+            if stage is None:
+                stage = {'samples': [], 'count': 0, 'total': 0.0, 'min': seconds, 'max': seconds, 'pixels': 0, 'nbytes': 0}
+                self.stages[span.name] = stage
+            stage['count'] += 1
+            stage['total'] += seconds
+            stage['min'] = min(stage['min'], seconds)
+            stage['max'] = max(stage['max'], seconds)
+            stage['pixels'] += span.pixels
+            stage['nbytes'] += span.nbytes
+            samples = stage['samples']
+            if len(samples) < self.reservoir_size:
+                samples.append(seconds)
+            else:
+                # every span of the stage stays in the sample with the same probability
+                position = self.random.randrange(stage['count'])
+                if position < self.reservoir_size:
+                    samples[position] = seconds
+        super().record(span)
+
+    def report(self):
+        """
+        Get the statistics of every stage
+
+        Returns
+        -------
+        dict
+            for every stage name a dict with 'count', 'total', 'min', 'max',
+            'p50' and 'p95' (seconds), and the total 'pixels' and 'nbytes'
+        """
+        with self.lock:
+            stages = {name: dict(stage, samples=list(stage['samples'])) for name, stage in self.stages.items()}
+        report = {}
+        for name, stage in sorted(stages.items()):
+            samples = np.array(stage['samples'])
+            report[name] = {
+                'count': stage['count'],
+                'total': stage['total'],
+                'min': stage['min'],
+                'max': stage['max'],
+                'p50': float(np.percentile(samples, 50)),
+                'p95': float(np.percentile(samples, 95)),
+                'pixels': stage['pixels'],
+                'nbytes': stage['nbytes'],
+            }
+        return report
+
+    def reset(self):
+        """Forget the collected spans"""
+        with self.lock:
+            self.stages = {}
+
+    def format_report(self):
+        """Get the report as a text table, one stage per line"""
+        lines = ['{:<36} {:>7} {:>10} {:>10} {:>10}'.format('stage', 'count', 'p50 ms', 'p95 ms', 'total s')]
+        for name, stage in self.report().items():
+            lines.append('{:<36} {:>7} {:>10.2f} {:>10.2f} {:>10.3f}'.format(
+                name, stage['count'], stage['p50'] * 1000, stage['p95'] * 1000, stage['total']))
+        return '\n'.join(lines)
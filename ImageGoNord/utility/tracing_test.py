@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ImageGoNord.utility.tracing as tracing
+
+
+def test_null_tracer_records_nothing():
+    with tracing.NULL_TRACER.span('stage', 10, 30) as span:
+        assert span is None
+    assert tracing.NULL_TRACER.span('other') is tracing.NULL_TRACER.span('stage')
+
+
+def test_tracer_callback():
+    spans = []
+    tracer = tracing.Tracer(spans.append)
+    with tracer.span('stage', 10, 30):
+        time.sleep(0.01)
+    assert [(span.name, span.pixels, span.nbytes) for span in spans] == [('stage', 10, 30)]
+    assert spans[0].seconds >= 0.01
+
+
+def test_stats_tracer_report():
+    tracer = tracing.StatsTracer()
+
+    def record(seconds):
+        span = tracing.Span(tracer, 'stage', 2, 6)
+        span.seconds = seconds
+        tracer.record(span)
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(record, [index / 100 for index in range(1, 101)]))
+    report = tracer.report()['stage']
+    assert report['count'] == 100 and report['pixels'] == 200 and report['nbytes'] == 600
+    assert report['p50'] == pytest.approx(0.505)
+    assert report['p95'] == pytest.approx(0.9505)
+    assert report['total'] == pytest.approx(50.5)
+    assert 'stage' in tracer.format_report()
+
+    tracer.reset()
+    assert tracer.report() == {}
+
+
+def test_stats_tracer_memory_is_bounded():
+    tracer = tracing.StatsTracer(reservoir_size=50)
+    for index in range(1, 10001):
+        span = tracing.Span(tracer, 'stage', 1, 3)
+        span.seconds = index / 10000
+        tracer.record(span)
+    assert len(tracer.stages['stage']['samples']) == 50
+    report = tracer.report()['stage']
+    assert report['count'] == 10000 and report['pixels'] == 10000
+    assert report['total'] == pytest.approx(5000.5)
+    assert report['min'] == 0.0001 and report['max'] == 1.0
+    # a uniform sample of the durations
+    assert 0.3 < report['p50'] < 0.7 and report['p95'] > 0.75
@@ -0,0 +1,425 @@
+"""Benchmarks of the GoNord conversion paths.
+
+Every path runs on synthetic images of several sizes, modes and palette
+sizes, recording the throughput (megapixels per second), the peak memory
+traced by tracemalloc, the peak resident memory of the process and the
+number of distinct colors of the input and of the output. Results are
+compared with a stored baseline: a slower or heavier case, or a case whose
+output colors changed, is a regression and the run exits with status 1.
+
+    python -m benchmarks.run --save-baseline
+    python -m benchmarks.run
+    python -m benchmarks.run --paths numpy lut --sizes 12 48
+
+The baseline is machine dependent (cpu count and speed), so it is not
+committed: save it on the machine that checks for regressions, from the
+base branch, before measuring a change. Without a baseline the run exits
+with status 2, so a missing baseline never passes for a clean run.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+import numpy as np
+from PIL import Image
+
+from ImageGoNord import GoNord
+from ImageGoNord.utility.ConvertUtility import ConvertUtility
+import ImageGoNord.utility.palette_loader as pl
+import ImageGoNord.utility.model_weights as model_weights
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Image sizes in megapixels
+SIZES = (0.25, 2, 12, 48)
+DEFAULT_SIZES = (0.25, 2)
+MODES = ('RGB', 'RGBA')
+PALETTE_SIZES = (6, 16, 256)
+# Relative slowdown (or memory growth) accepted before a case is a regression
+TOLERANCE = 0.3
+# Memory growth always accepted, in megabytes
+MEMORY_SLACK = 1
+# Resident memory growth always accepted, in megabytes (allocator and page noise)
+RSS_SLACK = 16
+# Exit status of a comparison without baseline
+NO_BASELINE_STATUS = 2
+# Time after which a case stops repeating its runs, in seconds
+CASE_TIME_BUDGET = 10
+
+
+class BenchmarkPath:
+    """
+    A conversion path of GoNord to measure
+
+    Attributes
+    ----------
+    name : str
+        name of the path
+    run : callable
+        called with a configured GoNord and the image, returns the converted image
+    max_megapixels : float
+        biggest default size, bigger sizes run only with --all-sizes
+    modes : tuple
+        image modes supported by the path
+    palettes : tuple
+        palette sizes measured by the path
+    avg : bool
+        true if the path uses the avg algorithm
+    exact : bool
+        true if the output colors do not depend on the platform
+    """
+
+    def __init__(self, name, run, max_megapixels=48, modes=MODES, palettes=PALETTE_SIZES, avg=False, exact=True):
+        self.name = name
+        self.run = run
+        self.max_megapixels = max_megapixels
+        self.modes = modes
+        self.palettes = palettes
+        self.avg = avg
+        self.exact = exact
+
+
+def convert_frame(go_nord, image):
+    """Convert an image like a video frame, with the color map of the palette"""
+    color_cube = pl.load_color_map(go_nord.get_palette_index(), cache_path=go_nord.COLOR_MAP_CACHE_PATH)
+    return ConvertUtility.convert_palette(color_cube, np.asarray(image))
+
+
+PATHS = {
+    path.name: path for path in (
+        BenchmarkPath('loop', lambda go_nord, image: go_nord.convert_image(image), max_megapixels=0.25),
+        BenchmarkPath('loop_avg', lambda go_nord, image: go_nord.convert_image(image), max_megapixels=0.25, avg=True),
+        BenchmarkPath('numpy', lambda go_nord, image: go_nord.convert_image(image, engine='numpy')),
+        BenchmarkPath('numpy_avg', lambda go_nord, image: go_nord.convert_image(image, engine='numpy'), avg=True),
+        BenchmarkPath('lut', lambda go_nord, image: go_nord.convert_image(image, engine='lut')),
+        BenchmarkPath('quantize', lambda go_nord, image: go_nord.quantize_image(image)),
+        BenchmarkPath('convert_palette', convert_frame, modes=('RGB',)),
+        BenchmarkPath('model', lambda go_nord, image: go_nord.convert_image_by_model(image, use_model_cpu=True),
+                      max_megapixels=2, modes=('RGB',), palettes=(16,), exact=False),
+    )
+}
+
+
+def make_image(megapixels, mode, seed=0):
+    """Create a synthetic photo-like image.
+
+      Smooth color fields with fine noise, so the image has many distinct
+      colors without being pure noise.
+
+    Parameters
+    ----------
+    megapixels: float
+      size of the image
+    mode: str
+      'RGB' or 'RGBA'
+
+    Returns
+    -------
+    pillow image
+      the image, with a 4:3 aspect ratio
+    """
+    rng = np.random.default_rng(seed)
+    width = int(round(np.sqrt(megapixels * 1e6 * 4 / 3)))
+    height = int(round(megapixels * 1e6 / width))
+    coarse = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize((width, height), Image.BILINEAR)
+    pixels = np.asarray(image).astype(np.int16)
+    pixels += rng.integers(-2, 3, (height, width, 1), dtype=np.int16)
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    if mode == 'RGBA':
+        # opaque, with a transparent fade on the left quarter
+        alpha = np.full((height, width, 1), 255, dtype=np.uint8)
+        quarter = max(1, width // 4)
+        alpha[:, :quarter, 0] = np.linspace(0, 255, quarter).astype(np.uint8)
+        pixels = np.concatenate((pixels, alpha), axis=2)
+    return Image.fromarray(pixels, mode)
+
+
+def make_palette(size):
+    """Get the hex colors of a palette: the Nord ones, then deterministic random colors"""
+    go_nord = GoNord()
+    colors = list(go_nord.get_palette_data())
+    rng = np.random.default_rng(size)
+    while len(colors) < size:
+        colors.append('{:02X}{:02X}{:02X}'.format(*rng.integers(0, 256, 3)))
+    return colors[:size]
+
+
+def make_go_nord(path, palette_size, cache_path, weights_path):
+    """Get a GoNord configured for a path and a palette size"""
+    go_nord = GoNord()
+    go_nord.reset_palette()
+    for color in make_palette(palette_size):
+        go_nord.add_color_to_palette('#' + color)
+    go_nord.set_color_map_cache_path(cache_path)
+    go_nord.set_palette_net_path(weights_path)
+    if path.avg:
+        go_nord.enable_avg_algorithm()
+    return go_nord
+
+
+def make_random_weights(weights_path):
+    """Save randomly initialized PaletteNet weights: the speed does not depend on them"""
+    import torch
+    from ImageGoNord.utility.model import FeatureEncoder, RecoloringDecoder
+
+    torch.manual_seed(0)
+    torch.save(FeatureEncoder().state_dict(), os.path.join(weights_path, model_weights.FE_WEIGHTS))
+    torch.save(RecoloringDecoder().state_dict(), os.path.join(weights_path, model_weights.RD_WEIGHTS))
+
+
+def count_colors(image):
+    """Count the distinct rgb colors of an image"""
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        return len(np.unique(pixels))
+    return len(ConvertUtility.unique_colors(pixels[..., :3])[0])
+
+
+def reset_peak_rss():
+    """Reset the peak resident memory of the process, on Linux.
+
+    Returns
+    -------
+    bool
+      true if the peak was reset, otherwise it is the one since the process started
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss():
+    """Get the peak resident memory of the process in megabytes, None if unknown"""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_case(path, go_nord, image, repeat=3, memory=True):
+    """Measure a path on an image.
+
+    Parameters
+    ----------
+    path: BenchmarkPath
+      the path to measure
+    go_nord: GoNord
+      configured instance
+    image: pillow image
+      source image, it is copied before every run
+    repeat: int
+      timed runs, the fastest one is kept; slow cases stop after CASE_TIME_BUDGET seconds
+    memory: bool
+      true to measure the peak traced memory in one more run
+
+    Returns
+    -------
+    dict
+      'seconds', 'mp_per_s', 'peak_mb' (None without memory), 'rss_mb'
+      (peak resident memory of the timed runs, including Pillow buffers
+      and the interpreter; None if unknown), 'input_colors' and 'output_colors'
+    """
+    megapixels = image.size[0] * image.size[1] / 1e6
+    # warm up on a small image: palette index, color maps and models
+    path.run(go_nord, image.resize((32, 32)))
+
+    reset_peak_rss()
+    best = None
+    output = None
+    total = 0
+    for _ in range(repeat):
+        source = image.copy()
+        start = time.perf_counter()
+        output = path.run(go_nord, source)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        total += seconds
+        if total > CASE_TIME_BUDGET:
+            break
+    rss = get_peak_rss()
+
+    peak = None
+    if memory:
+        source = image.copy()
+        tracemalloc.start()
+        try:
+            path.run(go_nord, source)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'seconds': best,
+        'mp_per_s': megapixels / best if best > 0 else float('inf'),
+        'peak_mb': peak,
+        'rss_mb': rss,
+        'input_colors': count_colors(image),
+        'output_colors': count_colors(output),
+    }
+
+
+def get_cases(paths, sizes, all_sizes=False):
+    """Get the (path, megapixels, mode, palette size) of every case to run"""
+    cases = []
+    for name in paths:
+        path = PATHS[name]
+        for megapixels in sizes:
+            if megapixels > path.max_megapixels and not all_sizes:
+                continue
+            for mode in path.modes:
+                for palette_size in path.palettes:
+                    cases.append((path, megapixels, mode, palette_size))
+    return cases
+
+
+def get_case_name(path, megapixels, mode, palette_size):
+    """Get the name of a case in the results and in the baseline"""
+    return '{}-{}MP-{}-{}colors'.format(path.name, megapixels, mode, palette_size)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Find the regressions of the results against a baseline.
+
+    Parameters
+    ----------
+    results: dict
+      results by case name
+    baseline: dict
+      baseline results by case name, cases missing in it are not compared
+    tolerance: float
+      accepted relative slowdown and memory growth
+
+    Returns
+    -------
+    list
+      description of every regression
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['mp_per_s'] < expected['mp_per_s'] * (1 - tolerance):
+            regressions.append('{}: {:.2f} MP/s, baseline {:.2f} MP/s'.format(
+                name, result['mp_per_s'], expected['mp_per_s']))
+        if result.get('peak_mb') is not None and expected.get('peak_mb') is not None \
+                and result['peak_mb'] > expected['peak_mb'] * (1 + tolerance) + MEMORY_SLACK:
+            regressions.append('{}: {:.1f} MB peak memory, baseline {:.1f} MB'.format(
+                name, result['peak_mb'], expected['peak_mb']))
+        if result.get('rss_mb') is not None and expected.get('rss_mb') is not None \
+                and result['rss_mb'] > expected['rss_mb'] * (1 + tolerance) + RSS_SLACK:
+            regressions.append('{}: {:.1f} MB peak resident memory, baseline {:.1f} MB'.format(
+                name, result['rss_mb'], expected['rss_mb']))
+        if result.get('exact', True) and result['output_colors'] != expected['output_colors']:
+            regressions.append('{}: {} output colors, baseline {}'.format(
+                name, result['output_colors'], expected['output_colors']))
+    return regressions
+
+
+def get_parser():
+    """Get the parser of the command line arguments"""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Benchmark the GoNord conversion paths.')
+    parser.add_argument('--paths', nargs='+', choices=list(PATHS), default=list(PATHS), help='paths to measure')
+    parser.add_argument('--sizes', nargs='+', type=float, default=list(DEFAULT_SIZES),
+                        help='image sizes in megapixels, e.g. ' + ' '.join(str(size) for size in SIZES))
+    parser.add_argument('--all-sizes', action='store_true', help='run also the sizes above the limit of slow paths')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs of every case, the fastest is kept')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure the peak memory')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='baseline file to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results into the baseline file')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='accepted relative slowdown')
+    parser.add_argument('--output', help='file where to write the results as json')
+    return parser
+
+
+def main(argv=None):
+    """Run the benchmarks, returns the exit status"""
+    args = get_parser().parse_args(argv)
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        weights_path = GoNord.PALETTE_NET_PATH
+        if 'model' in args.paths and not model_weights.has_weights(weights_path):
+            weights_path = folder
+            try:
+                make_random_weights(weights_path)
+            except ImportError:
+                print('skipping the model path: torch is not installed')
+                args.paths = [name for name in args.paths if name != 'model']
+
+        images = {}
+        print('{:<44} {:>9} {:>10} {:>9} {:>9} {:>9}'.format('case', 'MP/s', 'peak MB', 'RSS MB', 'colors', 'output'))
+        for path, megapixels, mode, palette_size in get_cases(args.paths, args.sizes, args.all_sizes):
+            if (megapixels, mode) not in images:
+                images = {(megapixels, mode): make_image(megapixels, mode)}
+            go_nord = make_go_nord(path, palette_size, folder, weights_path)
+            result = run_case(path, go_nord, images[(megapixels, mode)], args.repeat, not args.no_memory)
+            result['exact'] = path.exact
+            name = get_case_name(path, megapixels, mode, palette_size)
+            results[name] = result
+            print('{:<44} {:>9.2f} {:>10} {:>9} {:>9} {:>9}'.format(
+                name, result['mp_per_s'], '-' if result['peak_mb'] is None else '{:.1f}'.format(result['peak_mb']),
+                '-' if result['rss_mb'] is None else '{:.1f}'.format(result['rss_mb']),
+                result['input_colors'], result['output_colors']), flush=True)
+
+    report = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        baseline['environment'] = report['environment']
+        baseline['results'].update(results)
+        with open(args.baseline, 'w') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print('baseline saved: ' + args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('no baseline to compare with: ' + args.baseline + ', save one from the base branch with --save-baseline',
+              file=sys.stderr)
+        return NO_BASELINE_STATUS
+    with open(args.baseline) as file:
+        regressions = compare(results, json.load(file)['results'], args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression, file=sys.stderr)
+    print('{} cases, {} regressions'.format(len(results), len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import json
+
+from benchmarks.run import NO_BASELINE_STATUS, PATHS, compare, main, make_go_nord, make_image, run_case
+
+
+def test_compare():
+    baseline = {'case': {'mp_per_s': 10.0, 'peak_mb': 10.0, 'output_colors': 16}}
+    assert compare({'case': {'mp_per_s': 8.0, 'peak_mb': 11.0, 'output_colors': 16}}, baseline) == []
+    assert compare({'other': {'mp_per_s': 1.0, 'peak_mb': 11.0, 'output_colors': 1}}, baseline) == []
+    assert len(compare({'case': {'mp_per_s': 5.0, 'peak_mb': 10.0, 'output_colors': 16}}, baseline)) == 1
+    assert len(compare({'case': {'mp_per_s': 10.0, 'peak_mb': 30.0, 'output_colors': 16}}, baseline)) == 1
+    assert len(compare({'case': {'mp_per_s': 10.0, 'peak_mb': 10.0, 'output_colors': 15}}, baseline)) == 1
+    assert compare({'case': {'mp_per_s': 10.0, 'peak_mb': 10.0, 'output_colors': 15, 'exact': False}}, baseline) == []
+
+    baseline['case']['rss_mb'] = 100.0
+    assert compare({'case': {'mp_per_s': 10.0, 'rss_mb': 140.0, 'output_colors': 16}}, baseline) == []
+    assert len(compare({'case': {'mp_per_s': 10.0, 'rss_mb': 200.0, 'output_colors': 16}}, baseline)) == 1
+
+
+def test_run_case(tmp_path):
+    image = make_image(0.01, 'RGBA')
+    go_nord = make_go_nord(PATHS['numpy_avg'], 6, str(tmp_path), str(tmp_path))
+    result = run_case(PATHS['numpy_avg'], go_nord, image, repeat=1)
+    assert result['mp_per_s'] > 0 and result['peak_mb'] > 0
+    assert result['rss_mb'] is None or result['rss_mb'] > 0
+    # six palette colors plus the untouched transparent pixels
+    assert 6 < result['output_colors'] < result['input_colors']
+
+
+def test_main_fails_on_regression(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    arguments = ['--paths', 'lut', '--sizes', '0.01', '--repeat', '1', '--no-memory', '--baseline', str(baseline)]
+    # no baseline is not a clean run
+    assert main(arguments) == NO_BASELINE_STATUS
+    assert main(arguments + ['--save-baseline']) == 0
+
+    saved = json.loads(baseline.read_text())
+    assert len(saved['results']) == 6
+    assert main(arguments + ['--tolerance', '0.99']) == 0
+
+    for result in saved['results'].values():
+        result['output_colors'] += 1
+    baseline.write_text(json.dumps(saved))
+    assert main(arguments + ['--tolerance', '0.99']) == 1
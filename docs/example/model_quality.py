@@ -0,0 +1,19 @@
+import glob
+import sys
+
+from ImageGoNord import GoNord
+
+# Quality and speed of the int8 quantized PaletteNet (fast cpu mode) against fp32
+# on the bundled images. Usage: python docs/example/model_quality.py [max_side]
+max_side = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+go_nord = GoNord()
+paths = sorted(glob.glob("images/*.jpg") + glob.glob("images/*.png"))
+images = [go_nord.open_image(path) for path in paths]
+
+report = go_nord.compare_fast_cpu_model(images, max_side=max_side)
+
+print("%-32s %8s %8s %10s %10s" % ("image", "PSNR dB", "mean dE", "fp32 s", "int8 s"))
+for path, result in zip(paths, report):
+    print("%-32s %8.2f %8.2f %10.3f %10.3f" % (
+        path, result['psnr'], result['delta_e'], result['time_fp32'], result['time_int8']))
@@ -22,19 +22,24 @@ setup(
         'Topic :: Software Development :: Build Tools',
         "License :: OSI Approved :: GNU Affero General Public License v3 or later (AGPLv3+)",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7"
+        "Programming Language :: Python :: 3.8"
     ],
     project_urls={
         "Homepage": "https://ign.schroedinger-hat.org",
         "Source": "https://github.com/schroedinger-Hat/ImageGoNord-pip",
         "Bug Reports": "https://github.com/schroedinger-Hat/ImageGoNord-pip/issues",
     },
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     package_data={'': ['*.txt', 'palettes/*.txt']},
     include_package_data=True,
     install_requires=["Pillow", "ffmpeg-python", "numpy", "requests"],
     extras_require = {
-        'AI':  ["torch", "scikit-image", "torchvision"]
+        'AI':  ["torch"],
+        'ONNX':  ["onnxruntime"],
+        'EXPORT':  ["torch", "onnx", "onnxscript"],
     },
-    python_requires=">=3.5"
+    entry_points={
+        'console_scripts': ['image-go-nord=ImageGoNord.cli:main'],
+    },
+    python_requires=">=3.8"
 )